@@ -0,0 +1,360 @@
+"""
+Measures throughput and latency of Cache operations across backends and
+serializers.
+
+Every scenario (hits, misses, stale entries, writes, expiry scans, in full
+or paged) is run against every backend and serializer, for every number of
+keys, payload size and number of threads, on a fresh backend. With ``--tasks``, backends
+that have an asyncio flavour are also run through ``AsyncCache``, by as
+many tasks.
+
+Redis backends use the server given by ``--redis-host`` and
+``--redis-port``, and are skipped if it can't be reached. Their databases
+(``--redis-db`` and ``--sharded-dbs``) are flushed before every run.
+
+Results are written as JSON. Given ``--compare``, results are checked
+against an earlier run, and the script exits with status 1 if any
+throughput dropped, or any p99 latency rose, by more than ``--tolerance``.
+
+Usage::
+
+  $ python benchmarks/cache_ops.py --backends memory redis --output results.json
+  $ python benchmarks/cache_ops.py --compare results.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+
+from freon.async_cache import AsyncCache
+from freon.cache import Cache
+
+
+ASYNC_BACKENDS = ('memory', 'redis')
+
+FILE_NUMBERS = itertools.count()
+
+
+def backend_config(name, args, keys, payload, directory):
+    if name == 'concurrent_memory':
+        return {'shards': args.shards}
+    if name == 'shared_memory':
+        return {'path': os.path.join(directory, 'shm.%d' % next(FILE_NUMBERS)),
+                'slots': 1 << (4 * keys).bit_length(), 'slot_size': payload * 2 + 512}
+    if name == 'sqlite':
+        return {'path': os.path.join(directory, 'sqlite.%d' % next(FILE_NUMBERS))}
+    if name == 'redis':
+        return {'host': args.redis_host, 'port': args.redis_port, 'db': args.redis_db}
+    if name == 'sharded':
+        return {'nodes': [{'host': args.redis_host, 'port': args.redis_port, 'db': db}
+                          for db in args.sharded_dbs]}
+    return {}
+
+
+def redis_dbs(name, args):
+    if name == 'redis':
+        return [args.redis_db]
+    if name == 'sharded':
+        return args.sharded_dbs
+    return []
+
+
+def flush(name, args):
+    import redis
+    for db in redis_dbs(name, args):
+        redis.StrictRedis(host=args.redis_host, port=args.redis_port, db=db).flushdb()
+
+
+def redis_available(args):
+    try:
+        import redis
+        return redis.StrictRedis(host=args.redis_host, port=args.redis_port,
+                                 socket_connect_timeout=1).ping()
+    except Exception:
+        return False
+
+
+def make_value(payload):
+    rng = random.Random(payload)
+    return {'id': payload, 'data': ''.join(rng.choice(string.ascii_letters)
+                                           for _ in range(payload))}
+
+
+# Scenarios prepare the cache through ``run``, which awaits coroutines for
+# AsyncCache, and return the operation to be measured, called with a key.
+
+def scenario_set(cache, run, keys, value):
+    return lambda key: cache.set(key, value)
+
+
+def scenario_get_hit(cache, run, keys, value):
+    run(cache.set_many(dict((key, value) for key in keys)))
+    return lambda key: cache.get(key)
+
+
+def scenario_get_miss(cache, run, keys, value):
+    return lambda key: cache.get('missing:' + key)
+
+
+def scenario_get_or_set_hit(cache, run, keys, value):
+    run(cache.set_many(dict((key, value) for key in keys)))
+    return lambda key: cache.get_or_set(key, value)
+
+
+def scenario_get_or_set_miss(cache, run, keys, value):
+    counter = itertools.count()
+    return lambda key: cache.get_or_set('new:%d' % next(counter), value)
+
+
+def scenario_get_or_set_stale(cache, run, keys, value):
+    # Refreshed entries are expired as well, so every call serves a stale entry
+    run(cache.set_many(dict((key, value) for key in keys), ttl=-1))
+    return lambda key: cache.get_or_set(key, value, ttl=-1)
+
+
+def scenario_get_expired(cache, run, keys, value):
+    run(cache.set_many(dict((key, value) for key in keys),
+                       ttl=dict((key, -1 if i % 2 else 3600) for i, key in enumerate(keys))))
+    return lambda key: cache.get_expired()
+
+
+def scenario_get_by_ttl(cache, run, keys, value):
+    run(cache.set_many(dict((key, value) for key in keys),
+                       ttl=dict((key, 60 + i % 3600) for i, key in enumerate(keys))))
+    return lambda key: cache.get_by_ttl(1800)
+
+
+def scenario_iter_expired(cache, run, keys, value):
+    run(cache.set_many(dict((key, value) for key in keys),
+                       ttl=dict((key, -1 if i % 2 else 3600) for i, key in enumerate(keys))))
+    if isinstance(cache, AsyncCache):
+        async def op(key):
+            return [k async for k in cache.iter_expired()]
+        return op
+    return lambda key: list(cache.iter_expired())
+
+
+SCENARIOS = {
+    'set': (scenario_set, {}),
+    'get_hit': (scenario_get_hit, {}),
+    'get_miss': (scenario_get_miss, {}),
+    'get_or_set_hit': (scenario_get_or_set_hit, {}),
+    'get_or_set_miss': (scenario_get_or_set_miss, {}),
+    'get_or_set_stale': (scenario_get_or_set_stale, {'stale_while_revalidate': True}),
+    'get_expired': (scenario_get_expired, {}),
+    'get_by_ttl': (scenario_get_by_ttl, {}),
+    'iter_expired': (scenario_iter_expired, {}),
+}
+
+# Scenarios scanning the whole key space run fewer operations
+SCANS = ('get_expired', 'get_by_ttl', 'iter_expired')
+
+
+def run_threads(cache, scenario, keys, value, threads, operations):
+    op = scenario(cache, lambda result: result, keys, value)
+    latencies = [[] for _ in range(threads)]
+
+    def work(n):
+        rng, record = random.Random(n), latencies[n].append
+        for _ in range(operations):
+            key = keys[rng.randrange(len(keys))]
+            start = time.perf_counter()
+            op(key)
+            record(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, [l for worker in latencies for l in worker]
+
+
+def run_tasks(cache, scenario, keys, value, tasks, operations):
+    loop = asyncio.new_event_loop()
+    try:
+        op = scenario(cache, loop.run_until_complete, keys, value)
+        latencies = [[] for _ in range(tasks)]
+
+        async def work(n):
+            rng, record = random.Random(n), latencies[n].append
+            for _ in range(operations):
+                key = keys[rng.randrange(len(keys))]
+                start = time.perf_counter()
+                await op(key)
+                record(time.perf_counter() - start)
+
+        async def run():
+            start = time.perf_counter()
+            await asyncio.gather(*[work(n) for n in range(tasks)])
+            return time.perf_counter() - start
+
+        elapsed = loop.run_until_complete(run())
+        # Let background refreshes finish before the loop goes away
+        pending = asyncio.all_tasks(loop)
+        if pending:
+            loop.run_until_complete(asyncio.wait(pending))
+    finally:
+        loop.close()
+    return elapsed, [l for task in latencies for l in task]
+
+
+def percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100.0))]
+
+
+def summarize(elapsed, latencies):
+    latencies.sort()
+    return {
+        'operations': len(latencies),
+        'seconds': elapsed,
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_us': percentile(latencies, 50) * 1e6,
+        'p95_us': percentile(latencies, 95) * 1e6,
+        'p99_us': percentile(latencies, 99) * 1e6,
+        'max_us': latencies[-1] * 1e6,
+    }
+
+
+def combinations(args):
+    modes = [('threads', n) for n in args.threads] + [('tasks', n) for n in args.tasks]
+    return itertools.product(args.backends, args.serializers, args.scenarios, args.keys,
+                             args.payloads, modes)
+
+
+def run_all(args):
+    results, skipped = [], set()
+    has_redis = redis_available(args)
+    directory = tempfile.mkdtemp()
+    try:
+        for backend, serializer, scenario, keys, payload, (mode, concurrency) in \
+                combinations(args):
+            if mode == 'tasks' and backend not in ASYNC_BACKENDS:
+                continue
+            if redis_dbs(backend, args) and not has_redis:
+                skipped.add('%s (no Redis server at %s:%s)' % (
+                    backend, args.redis_host, args.redis_port))
+                continue
+
+            scenario_fn, options = SCENARIOS[scenario]
+            cache_cls = AsyncCache if mode == 'tasks' else Cache
+            try:
+                cache = cache_cls(backend=backend, serializer=serializer, **dict(
+                    options, **backend_config(backend, args, keys, payload, directory)))
+            except ImportError as e:
+                skipped.add('%s (%s)' % (serializer, e))
+                continue
+
+            if redis_dbs(backend, args):
+                flush(backend, args)
+            run = run_tasks if mode == 'tasks' else run_threads
+            operations = args.scan_operations if scenario in SCANS else args.operations
+            elapsed, latencies = run(cache, scenario_fn, ['key:%d' % i for i in range(keys)],
+                                     make_value(payload), concurrency, operations)
+
+            result = dict(backend=backend, serializer=serializer, scenario=scenario,
+                          keys=keys, payload=payload, mode=mode, concurrency=concurrency,
+                          **summarize(elapsed, latencies))
+            results.append(result)
+            print('%-17s %-13s %-17s %7d keys %6d B %2d %-7s %10.0f ops/s p99 %9.1f us' % (
+                backend, serializer, scenario, keys, payload, concurrency, mode,
+                result['ops_per_sec'], result['p99_us']))
+    finally:
+        shutil.rmtree(directory)
+
+    for reason in sorted(skipped):
+        print('skipped %s' % reason, file=sys.stderr)
+    return results
+
+
+def identity(result):
+    return tuple(result[field] for field in ('backend', 'serializer', 'scenario', 'keys',
+                                             'payload', 'mode', 'concurrency'))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns descriptions of the results that regressed against the
+    baseline's matching results.
+    """
+
+    previous = dict((identity(result), result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        before = previous.get(identity(result))
+        if before is None:
+            continue
+        if result['ops_per_sec'] < before['ops_per_sec'] * (1 - tolerance):
+            regressions.append('%s: %.0f ops/s, was %.0f' % (
+                ' '.join(map(str, identity(result))), result['ops_per_sec'],
+                before['ops_per_sec']))
+        if result['p99_us'] > before['p99_us'] * (1 + tolerance):
+            regressions.append('%s: p99 %.1f us, was %.1f' % (
+                ' '.join(map(str, identity(result))), result['p99_us'], before['p99_us']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+',
+                        default=['memory', 'concurrent_memory', 'shared_memory', 'sqlite',
+                                 'redis', 'sharded'])
+    parser.add_argument('--serializers', nargs='+',
+                        default=['json', 'fast_json', 'msgpack', 'pickle', 'msgpack+zstd'])
+    parser.add_argument('--scenarios', nargs='+', default=sorted(SCENARIOS),
+                        choices=sorted(SCENARIOS))
+    parser.add_argument('--keys', nargs='+', type=int, default=[1000, 100000])
+    parser.add_argument('--payloads', nargs='+', type=int, default=[100, 10000],
+                        help='approximate value sizes, in bytes')
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--tasks', nargs='*', type=int, default=[],
+                        help='asyncio tasks, for backends with an asyncio flavour')
+    parser.add_argument('--operations', type=int, default=10000,
+                        help='per thread or task')
+    parser.add_argument('--scan-operations', type=int, default=20,
+                        help='per thread or task, for get_expired, get_by_ttl and '
+                        'iter_expired')
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--redis-db', type=int, default=15)
+    parser.add_argument('--sharded-dbs', nargs='+', type=int, default=[12, 13, 14])
+    parser.add_argument('--output', help='file results are written to, as JSON')
+    parser.add_argument('--compare', help='results of an earlier run, as JSON')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run_all(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'arguments': vars(args),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('regression %s' % regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures how memory backends' throughput scales with threads.
+
+Every thread runs a mix of reads and writes over a shared key space, and
+the total number of operations per second is reported for each number of
+threads. Throughput only scales with cores on free-threaded Python (3.13t
+and later); with a GIL, this shows how much locking costs instead.
+
+Usage::
+
+  $ python benchmarks/memory_threads.py --threads 1 2 4 8 --reads 0.9
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from freon.backends.concurrent_memory import ConcurrentMemoryBackend
+from freon.backends.memory import MemoryBackend
+
+
+BACKENDS = {
+    'memory': lambda args: MemoryBackend(max_entries=args.max_entries),
+    'concurrent_memory': lambda args: ConcurrentMemoryBackend(shards=args.shards,
+                                                              max_entries=args.max_entries),
+}
+
+
+def run(backend, threads, operations, keys, reads):
+    for key in keys:
+        backend.set(key, key, 3600)
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(operations):
+            key = keys[rng.randrange(len(keys))]
+            if rng.random() < reads:
+                backend.get(key)
+            else:
+                backend.set(key, key, 3600)
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * operations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--operations', type=int, default=100000, help='per thread')
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--reads', type=float, default=0.9, help='fraction of reads')
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--max-entries', type=int, default=None)
+    args = parser.parse_args()
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('Python %s, GIL %s' % (sys.version.split()[0], 'enabled' if gil else 'disabled'))
+
+    keys = ['key%s' % i for i in range(args.keys)]
+    for name in args.backends:
+        for threads in args.threads:
+            ops = run(BACKENDS[name](args), threads, args.operations, keys, args.reads)
+            print('%-18s %3d threads %12.0f ops/s' % (name, threads, ops))
+
+
+if __name__ == '__main__':
+    main()
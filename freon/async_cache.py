@@ -0,0 +1,392 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import time
+from importlib import import_module
+
+from freon.cache import Cache, class_name
+from freon.memoize import memoize_async
+from freon.namespace import AsyncNamespacedBackend
+from freon.pipeline import AsyncPipeline
+from freon.refresher import AsyncRefresher
+
+logger = logging.getLogger(__name__)
+
+
+async def resolve(value, *args):
+    """
+    Calls ``value`` with ``args`` if it is callable, awaiting the result if
+    needed. Non-callable values are returned as they are.
+    """
+
+    if callable(value):
+        value = value(*args)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncCache(Cache):
+    """
+    Asyncio connection to a cache backend
+
+    Mirrors ``Cache``, with every operation being a coroutine. Values and TTLs
+    can be coroutine functions, or any callables returning awaitables.
+    Background refreshes run as tasks on the event loop, so
+    ``refresh_workers`` is ignored.
+
+    :param backend: (optional) Name of backend to connect to. Can be one of ``redis`` or ``memory``; other backends have no asyncio version. Defaults to ``memory``.
+    :type backend: string
+    :param serializer: (optional) Name of serializer used to serialize/deserialize cached values. Can be one of ``msgpack``, ``pickle``, ``json`` or ``fast_json``, optionally followed by ``+zlib``, ``+lz4`` or ``+zstd`` to compress large values. Can also be a serializer instance. Defaults to ``json``.
+    :type serializer: string or BaseSerializer
+    :param default_ttl: (optional) Default TTL applied to items that don't have one associated. Value is expressed in seconds. Defaults to ``3600``.
+    :type default_ttl: integer
+    :param custom_encoder: (optional) Custom encoder to extend the serializer's default behaviour.
+    :type custom_encoder: None or callable
+    :param custom_decoder: (optional) Custom decoder to extend the serializer's default behaviour.
+    :type custom_decoder: None or callable
+    :param wait_timeout: (optional) Seconds to wait for another task that is already caching a missing entry, instead of returning ``None``. Defaults to ``None``, meaning not to wait.
+    :type wait_timeout: None or number
+    :param stats: (optional) Reports hits, misses, lock contention and latencies. See ``Cache``.
+    :type stats: None, BaseSink, list of BaseSink or Stats
+    :param **kwargs: (optional) Extra arguments, passed to the selected backend.
+
+    Usage::
+
+      >>> from freon.async_cache import AsyncCache
+      >>> cache = AsyncCache()
+      >>> await cache.get('foobar')
+      None
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncCache, self).__init__(*args, **kwargs)
+        # Refresh tasks by key; the event loop only keeps weak references to them
+        self._refreshes = {}
+
+    async def get(self, key):
+        """
+        Retrieves a cached entry by given key. See ``Cache.get``.
+        """
+
+        value, expired = await self.backend.get(key)
+        return self._entry(key, value, expired)
+
+    async def get_many(self, keys):
+        """
+        Retrieves several cached entries by their keys. See ``Cache.get_many``.
+        """
+
+        keys = list(keys)
+        return self._entries(keys, await self.backend.get_many(keys))
+
+    async def set(self, key, value, ttl=None, tags=None):
+        """
+        Caches an entry by key and by TTL. See ``Cache.set``.
+
+        Value and TTL callables may return awaitables, which are awaited
+        while holding the lock.
+        """
+
+        lock = self.backend.get_lock(key)
+
+        if not await lock.acquire(blocking=False):
+            if self.stats is not None:
+                self.stats.contention(key)
+            return None
+
+        try:
+            return await self._store(key, value, ttl, tags=tags)
+        finally:
+            await lock.release()
+
+    async def set_many(self, mapping, ttl=None, tags=None):
+        """
+        Caches several entries. See ``Cache.set_many``.
+        """
+
+        values, items = await self._items(mapping, ttl)
+        if tags:
+            result = await self.backend.set_many(items, list(tags))
+        else:
+            result = await self.backend.set_many(items)
+        return values if result else {}
+
+    async def get_or_set(self, key, new_value, ttl=None):
+        """
+        Tries to retrieve a cached entry by key. If the value does not exist,
+        it caches the entry by key and TTL. See ``Cache.get_or_set``.
+        """
+
+        if self.backend.supports_leases:
+            value, expired, lease = await self.backend.get_or_lease(key)
+        else:
+            (value, expired), lease = await self.backend.get(key), None
+        busy = self.backend.supports_leases and lease is None
+        if self.stats is not None:
+            self._record(key, value, expired, busy)
+        if self._reads is not None:
+            self._reads.add(key)
+
+        if value is None:
+            result = None if busy else await self._update(key, new_value, ttl, lease)
+            if result is None and self.wait_timeout:
+                return await self._wait_for(key)
+            return result
+
+        value, delta, expires_at = self._decode(value)
+        if not expired and self.early_refresh_beta is not None:
+            expired = self._expires_early(delta, expires_at)
+            busy = False
+
+        if not expired:
+            return self._loaded(key, value, expired)
+
+        if busy:
+            return self._loaded(key, value, expired)
+
+        if self.stale_while_revalidate:
+            self.refresh(key, new_value, ttl, lease)
+            return self._loaded(key, value, expired)
+
+        result = await self._update(key, new_value, ttl, lease)
+        return result if result is not None else self._loaded(key, value, expired)
+
+    def memoize(self, ttl=None, key_fn=None, namespace=None):
+        """
+        Decorator caching a function's results, by its arguments. See
+        ``Cache.memoize``.
+
+        The decorated function is always a coroutine function, whether the
+        original one is or not; so is its ``invalidate``.
+        """
+
+        def decorator(func):
+            return memoize_async(self, func, ttl, key_fn, namespace)
+        return decorator
+
+    def namespace(self, name, generation_ttl=0):
+        """
+        Returns a cache whose keys live in namespace ``name``. See
+        ``Cache.namespace``.
+        """
+
+        return self._namespaced(AsyncNamespacedBackend(self.backend, name, generation_ttl))
+
+    async def invalidate_namespace(self, name=None):
+        """
+        Invalidates every entry of a namespace at once. See
+        ``Cache.invalidate_namespace``.
+        """
+
+        if name is not None:
+            return await self.namespace(name).backend.invalidate()
+        if not isinstance(self.backend, AsyncNamespacedBackend):
+            raise ValueError('Cache is not namespaced')
+        return await self.backend.invalidate()
+
+    async def invalidate_tags(self, tags):
+        """
+        Deletes every entry tagged with any of ``tags``. See
+        ``Cache.invalidate_tags``.
+        """
+
+        return await self.backend.invalidate_tags(list(tags))
+
+    def refresh(self, key, new_value, ttl=None, lease=None):
+        """
+        Caches an entry by key and TTL in a background task. See ``Cache.refresh``.
+
+        :return: ``asyncio.Task`` of the cached object, or ``None`` if nothing was scheduled
+        """
+
+        if key in self._refreshes or len(self._refreshes) >= self.max_refreshes:
+            if lease is not None:
+                asyncio.ensure_future(self.backend.release_lease(key, lease))
+            return None
+
+        task = self._refreshes[key] = asyncio.ensure_future(
+            self._update(key, new_value, ttl, lease))
+        task.add_done_callback(lambda _: self._refreshes.pop(key, None))
+        return task
+
+    async def delete(self, key):
+        """
+        Deletes a cached entry by key.
+        """
+
+        return await self.backend.delete(key)
+
+    async def delete_many(self, keys):
+        """
+        Deletes several cached entries by their keys.
+        """
+
+        return await self.backend.delete_many(list(keys))
+
+    async def exists(self, key):
+        """
+        Checks whether a cached entry exists by key.
+        """
+
+        return await self.backend.exists(key)
+
+    async def get_expired(self):
+        """
+        Returns a list of expired keys.
+        """
+
+        return await self.backend.get_expired()
+
+    async def get_by_ttl(self, ttl):
+        """
+        Returns a list of keys that will expire within the specified threshold.
+        """
+
+        return await self.backend.get_by_ttl(ttl)
+
+    def iter_expired(self, batch_size=1000):
+        """
+        Returns an asynchronous iterator of expired keys. See
+        ``Cache.iter_expired``.
+
+        Usage::
+
+          >>> async for key in cache.iter_expired(batch_size=500):
+          ...     await refresh(key)
+        """
+
+        return self.backend.iter_expired(batch_size)
+
+    def iter_by_ttl(self, ttl, batch_size=1000):
+        """
+        Returns an asynchronous iterator of keys that will expire within the
+        specified threshold. See ``Cache.iter_by_ttl``.
+        """
+
+        return self.backend.iter_by_ttl(ttl, batch_size)
+
+    async def reap(self, grace=0, batch_size=100):
+        """
+        Deletes up to ``batch_size`` entries that expired more than ``grace``
+        seconds ago. See ``Cache.reap``.
+        """
+
+        return await self.backend.reap(grace, batch_size)
+
+    def start_reaper(self, interval=60, grace=0, batch_size=100):
+        """
+        Starts a task that keeps reaping expired entries in the background,
+        the same way ``freon.reaper.Reaper`` does, errors included.
+
+        :return: the started ``asyncio.Task``, which can be cancelled
+        """
+
+        async def reap_forever():
+            while True:
+                try:
+                    keys = await self.reap(grace, batch_size)
+                except Exception:
+                    logger.exception('Failed to reap expired entries')
+                    keys = []
+                await asyncio.sleep(0 if len(keys) >= batch_size else interval)
+
+        return asyncio.ensure_future(reap_forever())
+
+    @contextlib.asynccontextmanager
+    async def pipeline(self):
+        """
+        Asynchronous context manager queuing operations, to be sent to the
+        backend in a single batch when the block exits without an error.
+        See ``Cache.pipeline``.
+
+        Usage::
+
+          >>> async with cache.pipeline() as pipeline:
+          ...     pipeline.set('foo', 'bar')
+          ...     pipeline.get('baz')
+          >>> pipeline.results
+          ['bar', None]
+        """
+
+        pipeline = AsyncPipeline(self)
+        yield pipeline
+        await pipeline.execute()
+
+    def start_refresher(self, loaders, window=60, interval=10, workers=4, max_pending=100,
+                        min_reads=0):
+        """
+        Starts a task recomputing entries before they expire, with the given
+        loaders, on at most ``workers`` tasks at once. Reads through this
+        cache are counted from now on. See ``Cache.start_refresher`` and
+        ``freon.refresher.AsyncRefresher``.
+
+        :return: the started ``AsyncRefresher``, which can be ``stop()``-ed
+        """
+
+        refresher = AsyncRefresher(self, loaders, window, interval, workers, max_pending,
+                                   min_reads)
+        self._reads = refresher.reads
+        refresher.start()
+        return refresher
+
+    async def _items(self, mapping, ttl):
+        values, items = {}, {}
+        for key, value in mapping.items():
+            key_ttl = ttl.get(key) if isinstance(ttl, dict) else ttl
+
+            value, delta = await self._compute(value)
+            key_ttl = self._ttl(await resolve(key_ttl, value), value)
+
+            values[key] = value
+            items[key] = (self._dump(value, delta, key_ttl), key_ttl)
+        return values, items
+
+    async def _update(self, key, value, ttl, lease):
+        if lease is None:
+            return await self.set(key, value, ttl)
+
+        try:
+            return await self._store(key, value, ttl, lease)
+        except BaseException:
+            await self.backend.release_lease(key, lease)
+            raise
+
+    async def _store(self, key, value, ttl, lease=None, tags=None):
+        value, delta = await self._compute(value)
+        ttl = self._ttl(await resolve(ttl, value), value)
+        value_dump = self._dump(value, delta, ttl)
+
+        if tags:
+            result = await self.backend.set(key, value_dump, ttl, list(tags))
+        elif lease is None:
+            result = await self.backend.set(key, value_dump, ttl)
+        else:
+            # Whoever took the lease over, if it expired meanwhile, caches
+            # their own value; this one is still good to return
+            await self.backend.set_with_lease(key, value_dump, ttl, lease)
+            return value
+        return value if result else None
+
+    async def _compute(self, value):
+        if not callable(value):
+            return value, 0
+
+        start = time.time()
+        value = await resolve(value)
+        return value, time.time() - start
+
+    async def _wait_for(self, key):
+        lock = self.backend.get_lock(key)
+
+        if not await lock.acquire(blocking=True, blocking_timeout=self.wait_timeout):
+            return None
+        await lock.release()
+
+        return await self.get(key)
+
+    def _load_backend(self, name, **config):
+        module = import_module("freon.backends.async_%s" % name)
+        backend_cls = getattr(module, "Async%sBackend" % class_name(name))
+        return backend_cls(**config)
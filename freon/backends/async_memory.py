@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+import asyncio
+import copy
+
+from freon.backends.base import AsyncBasePipeline, BaseBackend
+from freon.backends.memory import MemoryBackend
+
+
+class AsyncMemoryLock(object):
+    """
+    Per-key lock shared by all coroutines of an ``AsyncMemoryBackend``.
+
+    Mirrors the ``acquire``/``release`` interface of ``redis.asyncio`` locks.
+    Locks are kept in the registry only while someone holds or waits for them.
+    """
+
+    def __init__(self, locks, key):
+        self.locks = locks
+        self.key = key
+
+    async def acquire(self, blocking=True, blocking_timeout=None):
+        lock, users = self.locks.get(self.key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        elif not blocking:
+            return False
+        self.locks[self.key] = (lock, users + 1)
+
+        try:
+            await asyncio.wait_for(lock.acquire(), blocking_timeout)
+        except asyncio.TimeoutError:
+            self._forget(lock)
+            return False
+        except BaseException:
+            self._forget(lock)
+            raise
+        return True
+
+    async def release(self):
+        lock, _ = self.locks[self.key]
+        lock.release()
+        self._forget(lock)
+
+    def _forget(self, lock):
+        _, users = self.locks[self.key]
+        if users > 1:
+            self.locks[self.key] = (lock, users - 1)
+        else:
+            del self.locks[self.key]
+
+
+class AsyncMemoryBackend(BaseBackend):
+    """
+    Asyncio flavour of ``MemoryBackend``.
+
+    Entries are kept in a regular ``MemoryBackend``, which never blocks, so
+    its methods are simply exposed as coroutines.
+    """
+
+    def __init__(self, **kwargs):
+        self.backend = MemoryBackend(**kwargs)
+        self.locks = {}
+
+    @property
+    def ttl_key(self):
+        return self.backend.ttl_key
+
+    @property
+    def store(self):
+        return self.backend.store
+
+    def get_lock(self, key):
+        return AsyncMemoryLock(self.locks, key)
+
+    async def get(self, key):
+        return self.backend.get(key)
+
+    async def get_many(self, keys):
+        return self.backend.get_many(keys)
+
+    async def set(self, key, value, ttl, tags=None):
+        return self.backend.set(key, value, ttl, tags)
+
+    async def set_many(self, items, tags=None):
+        return self.backend.set_many(items, tags)
+
+    async def delete(self, key):
+        return self.backend.delete(key)
+
+    async def delete_many(self, keys):
+        return self.backend.delete_many(keys)
+
+    async def exists(self, key):
+        return self.backend.exists(key)
+
+    async def get_expired(self):
+        return self.backend.get_expired()
+
+    async def get_by_ttl(self, ttl):
+        return self.backend.get_by_ttl(ttl)
+
+    async def iter_expired(self, batch_size=1000, with_scores=False):
+        for item in self.backend.iter_expired(batch_size, with_scores):
+            yield item
+
+    async def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        for item in self.backend.iter_by_ttl(ttl, batch_size, with_scores):
+            yield item
+
+    async def reap(self, grace=0, limit=100):
+        return self.backend.reap(grace, limit)
+
+    async def invalidate_tags(self, tags):
+        return self.backend.invalidate_tags(tags)
+
+    async def incr(self, key):
+        return self.backend.incr(key)
+
+    async def get_counter(self, key):
+        return self.backend.get_counter(key)
+
+    def with_ttl_key(self, ttl_key):
+        backend = copy.copy(self)
+        backend.backend = self.backend.with_ttl_key(ttl_key)
+        return backend
+
+    def pipeline(self):
+        return AsyncBasePipeline(self)
@@ -0,0 +1,149 @@
+from __future__ import absolute_import
+import redis.asyncio
+import uuid
+
+from freon.backends.base import next_cursor
+from freon.backends.redis import (BaseRedisBackend, BaseRedisPipeline, decode_keys, page_args,
+                                  parse_entry)
+
+
+class AsyncRedisBackend(BaseRedisBackend):
+    """
+    Same as ``RedisBackend``, for asyncio, taking the same options.
+    """
+
+    async def get(self, key):
+        response = await self.run_script('get', keys=[key, self.ttl_key])
+        return self._parse(response, parse_entry)
+
+    async def get_many(self, keys):
+        if not keys:
+            return self._parse(None, lambda response: [])
+        response = await self.run_script('get_many', keys=[self.ttl_key] + list(keys))
+        return self._parse(response, lambda response: [
+            parse_entry(entry) for entry in zip(response[::2], response[1::2])])
+
+    async def get_or_lease(self, key):
+        token = uuid.uuid4().hex
+        response = await self.run_script(
+            'get_or_lease', keys=[key, self.ttl_key, self._lock_name(key)],
+            args=[token, int(self.lock_timeout * 1000)])
+        return self._parse(response, lambda response: (
+            response[0], bool(response[1]), token if response[2] else None))
+
+    async def set(self, key, value, ttl, tags=None):
+        response = await self.run_script('set', keys=[key, self.ttl_key],
+                                         args=self._write_args() + [value, ttl] +
+                                         list(tags or []))
+        return self._parse(response, bool)
+
+    async def set_many(self, items, tags=None):
+        if not items:
+            return self._parse(None, lambda response: True)
+        tags = list(tags or [])
+        keys, args = [self.ttl_key], self._write_args() + [len(tags)] + tags
+        for key, (value, ttl) in items.items():
+            keys.append(key)
+            args.extend([value, ttl])
+        response = await self.run_script('set_many', keys=keys, args=args)
+        return self._parse(response, bool)
+
+    async def set_with_lease(self, key, value, ttl, lease):
+        response = await self.run_script('set_with_lease',
+                                         keys=[key, self.ttl_key, self._lock_name(key)],
+                                         args=self._write_args() + [value, ttl, lease])
+        return self._parse(response, bool)
+
+    async def release_lease(self, key, lease):
+        response = await self.run_script('release_lease', keys=[self._lock_name(key)], args=[lease])
+        return self._parse(response, bool)
+
+    async def delete(self, key):
+        response = await self.run_script('delete', keys=[key, self.ttl_key],
+                                         args=self._write_args())
+        return self._parse(response, bool)
+
+    async def delete_many(self, keys):
+        if not keys:
+            return self._parse(None, lambda response: True)
+        response = await self.run_script('delete_many', keys=[self.ttl_key] + list(keys),
+                                         args=self._write_args())
+        return self._parse(response, bool)
+
+    async def exists(self, key):
+        response = await self.client.exists(key)
+        return self._parse(response, bool)
+
+    async def get_expired(self):
+        response = await self.run_script('get_expired', keys=[self.ttl_key])
+        return self._parse(response, decode_keys)
+
+    async def get_by_ttl(self, ttl):
+        response = await self.run_script('get_by_ttl', keys=[self.ttl_key], args=[ttl])
+        return self._parse(response, decode_keys)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Asynchronously yields expired keys, a page per round trip. See
+        ``RedisBackend.iter_expired``.
+        """
+
+        return self._iter_range(lambda now: (0, now), batch_size, with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        return self._iter_range(lambda now: (now, now + ttl), batch_size, with_scores)
+
+    async def reap(self, grace=0, limit=100):
+        response = await self.run_script('reap', keys=[self.ttl_key],
+                                         args=self._reap_args(grace, limit))
+        return self._parse(response, decode_keys)
+
+    async def invalidate_tags(self, tags):
+        response = await self.run_script('invalidate_tags', keys=[self.ttl_key],
+                                         args=self._write_args() + list(tags))
+        return self._parse(response, decode_keys)
+
+    async def incr(self, key):
+        return self._parse(await self.client.incr(key), int)
+
+    async def get_counter(self, key):
+        return self._parse(await self.client.get(key), lambda response: int(response or 0))
+
+    def pipeline(self):
+        """
+        Returns an ``AsyncRedisPipeline``, queuing calls to be sent in a
+        single round trip.
+        """
+
+        return AsyncRedisPipeline(self)
+
+    async def _iter_range(self, bounds, batch_size, with_scores):
+        min_expires_at, max_expires_at = bounds((await self.client.time())[0])
+        cursor = None
+        while True:
+            page = decode_keys(await self.run_script(
+                'range_page', keys=[self.ttl_key],
+                args=page_args(min_expires_at, max_expires_at, batch_size, cursor)),
+                with_scores=True)
+            for item in page:
+                yield item if with_scores else item[0]
+            if len(page) < batch_size:
+                return
+            cursor = next_cursor(page, cursor)
+
+    def _connect(self, **kwargs):
+        return redis.asyncio.StrictRedis(**kwargs)
+
+
+class AsyncRedisPipeline(BaseRedisPipeline, AsyncRedisBackend):
+    """
+    Queues calls to an ``AsyncRedisBackend``, sending them in a single round
+    trip on ``execute``, which returns their results, in order. See
+    ``RedisPipeline``.
+
+    Calls (awaited) return nothing until then. Locks are taken right away,
+    through the backend.
+    """
+
+    async def execute(self):
+        return self._results(await self.client.execute())
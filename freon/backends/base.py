@@ -1,18 +1,154 @@
+def next_cursor(page, cursor=None):
+    """
+    Returns the cursor following a page of ``(key, score)`` items, ordered
+    by score, then key: the last score and key, and how many items with that
+    score were returned so far.
+    """
+
+    key, score = page[-1]
+    ties = 0
+    for _, item_score in reversed(page):
+        if item_score != score:
+            break
+        ties += 1
+    if ties == len(page) and cursor is not None and cursor[0] == score:
+        ties += cursor[1]
+    return (score, ties, key)
+
+
+def paginate(fetch, batch_size, with_scores=False):
+    """
+    Yields the keys (or ``(key, score)`` items) of successive pages returned
+    by ``fetch(cursor, limit)``, until a page comes back short. The cursor
+    is ``None`` for the first page, and a ``next_cursor`` afterwards.
+    """
+
+    cursor = None
+    while True:
+        page = fetch(cursor, batch_size)
+        for item in page:
+            yield item if with_scores else item[0]
+        if len(page) < batch_size:
+            return
+        cursor = next_cursor(page, cursor)
+
+
 class BaseBackend(object):
+    # Whether get_or_lease, set_with_lease and release_lease are supported
+    supports_leases = False
+
     def get(self, key):
         raise NotImplementedError()
 
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def get_or_lease(self, key):
+        raise NotImplementedError()
+
     def set(self, key, value, ttl):
         raise NotImplementedError()
 
+    def set_with_lease(self, key, value, ttl, lease):
+        raise NotImplementedError()
+
+    def release_lease(self, key, lease):
+        raise NotImplementedError()
+
+    def set_many(self, items):
+        results = [self.set(key, value, ttl) for key, (value, ttl) in items.items()]
+        return all(results)
+
     def delete(self, key):
         raise NotImplementedError()
 
+    def delete_many(self, keys):
+        results = [self.delete(key) for key in keys]
+        return all(results)
+
     def exists(self, key):
         raise NotImplementedError()
 
-    def get_expired(self):
+    def get_expired(self, with_scores=False):
+        raise NotImplementedError()
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        raise NotImplementedError()
+
+    def reap(self, grace=0, limit=100):
+        raise NotImplementedError()
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        # Backends that can't page through expiry times return a full list
+        if with_scores:
+            return iter(self.get_expired(with_scores=True))
+        return iter(self.get_expired())
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        if with_scores:
+            return iter(self.get_by_ttl(ttl, with_scores=True))
+        return iter(self.get_by_ttl(ttl))
+
+    def invalidate_tags(self, tags):
+        raise NotImplementedError()
+
+    def incr(self, key):
         raise NotImplementedError()
 
-    def get_by_ttl(self, ttl):
+    def get_counter(self, key):
         raise NotImplementedError()
+
+    def with_ttl_key(self, ttl_key):
+        # Backends with a single expiry index share it between namespaces
+        return self
+
+    def pipeline(self):
+        return BasePipeline(self)
+
+
+class BasePipeline(object):
+    """
+    Queues calls to a backend, running them one by one on ``execute``, which
+    returns their results, in order. Meant for backends with no round trips
+    to save.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append((self.backend.get, (key,)))
+
+    def get_many(self, keys):
+        self.calls.append((self.backend.get_many, (keys,)))
+
+    def set(self, key, value, ttl):
+        self.calls.append((self.backend.set, (key, value, ttl)))
+
+    def set_many(self, items):
+        self.calls.append((self.backend.set_many, (items,)))
+
+    def delete(self, key):
+        self.calls.append((self.backend.delete, (key,)))
+
+    def delete_many(self, keys):
+        self.calls.append((self.backend.delete_many, (keys,)))
+
+    def exists(self, key):
+        self.calls.append((self.backend.exists, (key,)))
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [method(*args) for method, args in calls]
+
+
+class AsyncBasePipeline(BasePipeline):
+    """
+    Same as ``BasePipeline``, for asyncio backends: ``execute`` awaits calls
+    one by one.
+    """
+
+    async def execute(self):
+        calls, self.calls = self.calls, []
+        return [await method(*args) for method, args in calls]
@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+import heapq
+
+from freon.backends.base import BaseBackend
+from freon.backends.memory import MemoryBackend
+
+
+class MemoryShard(MemoryBackend):
+    """
+    ``MemoryBackend`` whose reads hold its lock too, so that they never see
+    an entry and its expiry time out of step, nor race with the eviction
+    policy, even without a GIL.
+    """
+
+    def get(self, key):
+        with self._lock:
+            return super(MemoryShard, self).get(key)
+
+    def get_many(self, keys):
+        with self._lock:
+            return super(MemoryShard, self).get_many(keys)
+
+    def exists(self, key):
+        with self._lock:
+            return super(MemoryShard, self).exists(key)
+
+    def _range(self, min_expires_at, max_expires_at, with_scores):
+        with self._lock:
+            return super(MemoryShard, self)._range(min_expires_at, max_expires_at, with_scores)
+
+
+class ConcurrentMemoryBackend(BaseBackend):
+    """
+    Keeps cached entries in the current process, striped across ``shards``
+    independent ``MemoryBackend``-s, each with its own lock, dict and expiry
+    index.
+
+    Threads working on keys of different shards never wait on each other,
+    so throughput scales with cores on free-threaded Python. ``max_entries``
+    and ``max_bytes`` are split evenly between shards, and each shard evicts
+    on its own.
+
+    :param shards: (optional) Number of shards. Defaults to ``16``.
+    :type shards: integer
+    :param **kwargs: (optional) Arguments passed to each shard, like in ``MemoryBackend``.
+    """
+
+    def __init__(self, shards=16, **kwargs):
+        for limit in ('max_entries', 'max_bytes'):
+            if kwargs.get(limit):
+                kwargs[limit] = max(1, kwargs[limit] // shards)
+
+        self.ttl_key = kwargs.get('ttl_key', 'freon:cache:ttls')
+        self.shards = [MemoryShard(**kwargs) for _ in range(shards)]
+
+    @property
+    def evictions(self):
+        return sum(shard.evictions for shard in self.shards)
+
+    def get_shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def get_lock(self, key):
+        return self.get_shard(key).get_lock(key)
+
+    def get(self, key):
+        return self.get_shard(key).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        for shard, group in self._group(keys):
+            found.update(zip(group, shard.get_many(group)))
+        return [found[key] for key in keys]
+
+    def set(self, key, value, ttl, tags=None):
+        return self.get_shard(key).set(key, value, ttl, tags)
+
+    def set_many(self, items, tags=None):
+        results = [shard.set_many(dict((key, items[key]) for key in group), tags)
+                   for shard, group in self._group(items)]
+        return all(results)
+
+    def delete(self, key):
+        return self.get_shard(key).delete(key)
+
+    def delete_many(self, keys):
+        results = [shard.delete_many(group) for shard, group in self._group(keys)]
+        return all(results)
+
+    def exists(self, key):
+        return self.get_shard(key).exists(key)
+
+    def get_expired(self, with_scores=False):
+        return self._merge([shard.get_expired(with_scores=True) for shard in self.shards],
+                           with_scores)
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        return self._merge([shard.get_by_ttl(ttl, with_scores=True) for shard in self.shards],
+                           with_scores)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Yields expired keys of all shards, merged by expiry time, each shard
+        being walked ``batch_size`` keys at a time.
+        """
+
+        return self._merge_iter([shard.iter_expired(batch_size, with_scores=True)
+                                 for shard in self.shards], with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        return self._merge_iter([shard.iter_by_ttl(ttl, batch_size, with_scores=True)
+                                 for shard in self.shards], with_scores)
+
+    def reap(self, grace=0, limit=100):
+        """
+        Deletes up to ``limit`` expired entries from each shard.
+        """
+
+        return [key for shard in self.shards for key in shard.reap(grace, limit)]
+
+    def invalidate_tags(self, tags):
+        return [key for shard in self.shards for key in shard.invalidate_tags(tags)]
+
+    def incr(self, key):
+        return self.get_shard(key).incr(key)
+
+    def get_counter(self, key):
+        return self.get_shard(key).get_counter(key)
+
+    def _group(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(hash(key) % len(self.shards), []).append(key)
+        return [(self.shards[shard], group) for shard, group in groups.items()]
+
+    def _merge(self, results, with_scores):
+        return list(self._merge_iter(results, with_scores))
+
+    def _merge_iter(self, results, with_scores):
+        merged = heapq.merge(*results, key=lambda item: (item[1], item[0]))
+        if with_scores:
+            return merged
+        return (key for key, _ in merged)
@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+import collections
+import heapq
+
+
+class BaseEvictionPolicy(object):
+    """
+    Decides which key a bounded ``MemoryBackend`` evicts next.
+
+    ``add`` is called whenever a key is written (whether it is new or not),
+    ``touch`` whenever it is read and ``remove`` whenever it is deleted.
+    """
+
+    def add(self, key, expires_at):
+        raise NotImplementedError()
+
+    def touch(self, key):
+        raise NotImplementedError()
+
+    def remove(self, key):
+        raise NotImplementedError()
+
+    def victim(self):
+        raise NotImplementedError()
+
+
+class LruEvictionPolicy(BaseEvictionPolicy):
+    """
+    Evicts the least recently used key. All operations are O(1).
+    """
+
+    def __init__(self):
+        self.keys = collections.OrderedDict()
+
+    def add(self, key, expires_at):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+
+    def touch(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+
+    def remove(self, key):
+        self.keys.pop(key, None)
+
+    def victim(self):
+        return next(iter(self.keys))
+
+
+class LfuEvictionPolicy(BaseEvictionPolicy):
+    """
+    Evicts the least frequently used key, breaking ties by recency.
+
+    Keys are kept in one ordered bucket per access count, so that all
+    operations are O(1).
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.buckets = collections.defaultdict(collections.OrderedDict)
+        self.min_count = 0
+
+    def add(self, key, expires_at):
+        if key in self.counts:
+            self.touch(key)
+            return
+        self.counts[key] = 1
+        self.buckets[1][key] = None
+        self.min_count = 1
+
+    def touch(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            return
+        self._unlink(key, count)
+        self.counts[key] = count + 1
+        self.buckets[count + 1][key] = None
+        if self.min_count == count and count not in self.buckets:
+            self.min_count = count + 1
+
+    def remove(self, key):
+        count = self.counts.pop(key, None)
+        if count is not None:
+            self._unlink(key, count)
+
+    def victim(self):
+        if self.min_count not in self.buckets:
+            self.min_count = min(self.buckets)
+        return next(iter(self.buckets[self.min_count]))
+
+    def _unlink(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+
+class TtlEvictionPolicy(BaseEvictionPolicy):
+    """
+    Evicts the key closest to expiring (or the longest expired).
+
+    Expiry times are kept in a heap with lazy deletion, so writes and
+    evictions are O(log n) and reads are free.
+    """
+
+    def __init__(self):
+        self.expiry = {}
+        self.heap = []
+
+    def add(self, key, expires_at):
+        self.expiry[key] = expires_at
+        heapq.heappush(self.heap, (expires_at, key))
+        if len(self.heap) > 2 * len(self.expiry) + 64:
+            self.heap = [(expires_at, key) for key, expires_at in self.expiry.items()]
+            heapq.heapify(self.heap)
+
+    def touch(self, key):
+        pass
+
+    def remove(self, key):
+        self.expiry.pop(key, None)
+
+    def victim(self):
+        while True:
+            expires_at, key = self.heap[0]
+            if self.expiry.get(key) == expires_at:
+                return key
+            heapq.heappop(self.heap)
+
+
+POLICIES = {
+    'lru': LruEvictionPolicy,
+    'lfu': LfuEvictionPolicy,
+    'ttl': TtlEvictionPolicy,
+}
+
+
+def load_policy(policy):
+    if isinstance(policy, BaseEvictionPolicy):
+        return policy
+    return POLICIES[policy]()
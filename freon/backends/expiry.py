@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+import bisect
+
+
+class ExpiryIndex(dict):
+    """
+    Dict of expiry times by key, which also keeps them in a sorted list.
+
+    The list makes range queries by expiry time cost O(log n + k), where
+    ``k`` is the number of matching keys, as both bounds are found by
+    bisection. Writes and deletes keep it sorted in place, in O(n) moves of
+    the list but O(log n) comparisons.
+
+    ``entries`` holds ``(expires_at, key)`` items ordered by expiry time,
+    then key, like a Redis sorted set; ``times`` holds their expiry times
+    alone, in the same order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ExpiryIndex, self).__init__()
+        self.entries = []
+        self.times = []
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, expires_at):
+        if key in self:
+            self._unlink(key, self[key])
+        super(ExpiryIndex, self).__setitem__(key, expires_at)
+        entry = (expires_at, key)
+        i = bisect.bisect_left(self.entries, entry)
+        self.entries.insert(i, entry)
+        self.times.insert(i, expires_at)
+
+    def __delitem__(self, key):
+        self._unlink(key, self[key])
+        super(ExpiryIndex, self).__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._unlink(key, self[key])
+        return super(ExpiryIndex, self).pop(key, *default)
+
+    def popitem(self):
+        key, expires_at = super(ExpiryIndex, self).popitem()
+        self._unlink(key, expires_at)
+        return key, expires_at
+
+    def update(self, *args, **kwargs):
+        for key, expires_at in dict(*args, **kwargs).items():
+            self[key] = expires_at
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def clear(self):
+        super(ExpiryIndex, self).clear()
+        self.entries = []
+        self.times = []
+
+    def range(self, min_expires_at, max_expires_at):
+        """
+        Returns keys expiring between the given bounds (inclusive), ordered by
+        expiry time, just like ``ZRANGEBYSCORE``.
+        """
+
+        start = bisect.bisect_left(self.times, min_expires_at)
+        end = bisect.bisect_right(self.times, max_expires_at)
+        return [key for _, key in self.entries[start:end]]
+
+    def expired(self, max_expires_at, limit):
+        """
+        Returns up to ``limit`` keys expiring no later than ``max_expires_at``,
+        soonest first.
+        """
+
+        end = min(limit, bisect.bisect_right(self.times, max_expires_at))
+        return [key for _, key in self.entries[:end]]
+
+    def page(self, min_expires_at, max_expires_at, limit, cursor=None):
+        """
+        Returns up to ``limit`` ``(key, expires_at)`` items between the given
+        bounds (inclusive), ordered by expiry time, following ``cursor``,
+        along with the cursor of the next page.
+
+        The cursor is the last ``(expires_at, key)`` item returned, which the
+        next page starts right after, so writes in between never make it skip
+        or repeat entries that stayed put.
+        """
+
+        if cursor is None:
+            start = bisect.bisect_left(self.times, min_expires_at)
+        else:
+            start = bisect.bisect_right(self.entries, cursor)
+        end = min(start + limit, bisect.bisect_right(self.times, max_expires_at))
+        entries = self.entries[start:end]
+        if entries:
+            cursor = entries[-1]
+        return [(key, expires_at) for expires_at, key in entries], cursor
+
+    def _unlink(self, key, expires_at):
+        i = bisect.bisect_left(self.entries, (expires_at, key))
+        del self.entries[i]
+        del self.times[i]
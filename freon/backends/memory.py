@@ -1,49 +1,449 @@
 from __future__ import absolute_import
+import collections
+import copy
 import glob
 import os
+import pickle
+import sys
+import tempfile
 import threading
 import time
+import weakref
 
 from freon.backends.base import BaseBackend
+from freon.backends.eviction import load_policy
+from freon.backends.expiry import ExpiryIndex
+
+
+SNAPSHOT_VERSION = 'freon:snapshot:1'
+
+
+def sizeof(value):
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class KeyLock(object):
+    """
+    Lock guarding a single key, handed out by a ``LockRegistry``.
+
+    Mirrors the ``acquire``/``release`` interface of ``redis`` locks, so that
+    waiters can block on an in-flight computation for a limited time.
+    """
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        if self._lock.acquire(False):
+            return True
+
+        self.registry.contended(self.key)
+        if not blocking:
+            return False
+        if blocking_timeout is None:
+            return self._lock.acquire(True)
+        return self._lock.acquire(True, blocking_timeout)
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+
+class LockRegistry(object):
+    """
+    Hands out one ``KeyLock`` per key, for as long as somebody references it.
+
+    Locks are kept in a ``WeakValueDictionary``, so the registry never grows
+    beyond the keys that are currently being locked or waited on.
+    Contention is counted for the ``max_contended`` most contended keys at
+    most: beyond that, the least contended half is dropped.
+
+    :param max_contended: (optional) Maximum number of keys contention is counted for. Defaults to ``1000``.
+    :type max_contended: integer
+    """
+
+    def __init__(self, max_contended=1000):
+        self.max_contended = max_contended
+        self.contention = collections.Counter()
+        self._locks = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = KeyLock(self, key)
+            return lock
+
+    def contended(self, key):
+        with self._lock:
+            self.contention[key] += 1
+            if len(self.contention) > self.max_contended:
+                self.contention = collections.Counter(
+                    dict(self.contention.most_common(self.max_contended // 2)))
+
+    def __len__(self):
+        return len(self._locks)
 
 
 class MemoryBackend(BaseBackend):
+    """
+    Keeps cached entries in a dict, in the current process.
+
+    The store is unbounded by default. Passing ``max_entries`` and/or
+    ``max_bytes`` bounds it, evicting entries chosen by ``eviction_policy``
+    (one of ``lru``, ``lfu`` or ``ttl``, or a ``BaseEvictionPolicy``) once
+    a limit is exceeded. ``max_bytes`` only accounts for the (serialized)
+    values. The number of evicted entries is kept in ``evictions``.
+
+    Expiry times are kept in an ``ExpiryIndex``, so that ``get_expired``,
+    ``get_by_ttl`` and ``reap`` don't need to scan every entry.
+
+    Counters (see ``incr``) are kept apart from entries, and are never
+    evicted.
+
+    Tags are indexed both ways, in ``tags`` (tag to keys) and ``key_tags``
+    (key to tags), so that ``invalidate_tags`` only goes through tagged
+    entries. Entries leave the index however they go: overwritten, deleted,
+    reaped or evicted.
+
+    Backends made with ``with_ttl_key`` (namespaces) keep their entries in
+    this one's store, under an expiry index of their own, so that limits and
+    eviction apply to all of them at once.
+    """
+
     def __init__(self, **kwargs):
         self.ttl_key = kwargs.pop('ttl_key', 'freon:cache:ttls')
+        self.max_entries = kwargs.pop('max_entries', None)
+        self.max_bytes = kwargs.pop('max_bytes', None)
+        self.eviction_policy = kwargs.pop('eviction_policy', 'lru')
+
         self.store = {}
-        self.store[self.ttl_key] = {}
+        self.store[self.ttl_key] = ExpiryIndex()
+        self.counters = {}
+        self.tags = {}
+        self.key_tags = {}
+        self.locks = LockRegistry()
+        self._lock = threading.RLock()
+        # Backends made with with_ttl_key share everything but their ttl_key,
+        # whose indexes are listed here while they have entries
+        self._root = self
+        self._ttl_keys = set()
 
-    def get_lock(self, _):
-        return threading.Lock()
+        self.policy = None
+        if self.max_entries or self.max_bytes:
+            self.policy = load_policy(self.eviction_policy)
+        self._bytes = 0
+        self._evictions = 0
+
+    @property
+    def bytes(self):
+        return self._root._bytes
+
+    @property
+    def evictions(self):
+        return self._root._evictions
+
+    def get_lock(self, key):
+        return self.locks.get(key)
 
     def get(self, key):
-        try:
-            value = self.store[key]
-            expired = self.store[self.ttl_key][key] < time.time()
-            return (value, expired)
-        except KeyError:
-            return (None, True)
+        if self.policy is not None:
+            # Reads update the eviction policy, which writes change under the lock
+            with self._lock:
+                return self._get(key)
+        return self._get(key)
+
+    def get_many(self, keys):
+        if self.policy is not None:
+            with self._lock:
+                return self._get_many(keys)
+        return self._get_many(keys)
+
+    def set(self, key, value, ttl, tags=None):
+        self._set(key, value, time.time() + ttl, tags)
+        return True
 
-    def set(self, key, value, ttl):
-        self.store[key] = value
-        self.store[self.ttl_key][key] = time.time() + ttl
+    def set_many(self, items, tags=None):
+        now = time.time()
+        for key, (value, ttl) in items.items():
+            self._set(key, value, now + ttl, tags)
         return True
 
     def delete(self, key):
-        try:
-            del self.store[key]
-            del self.store[self.ttl_key][key]
-        except KeyError:
-            pass
+        self._delete(key)
+        return True
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
         return True
 
     def exists(self, key):
-        return key in self.store
+        return key in self._index()
+
+    def get_expired(self, with_scores=False):
+        return self._range(0, time.time(), with_scores)
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        now = time.time()
+        return self._range(now, now + ttl, with_scores)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Yields expired keys, ordered by expiry time, walking the expiry index
+        ``batch_size`` keys at a time. The lock is only held for a batch.
+        """
+
+        return self._iter_range(0, time.time(), batch_size, with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        now = time.time()
+        return self._iter_range(now, now + ttl, batch_size, with_scores)
+
+    def reap(self, grace=0, limit=100):
+        """
+        Deletes up to ``limit`` expired entries, from this backend first,
+        then from those made with ``with_ttl_key`` (namespaces), unless this
+        is one of them. Namespaces' indexes are dropped once empty.
+        """
+
+        max_expires_at = time.time() - grace
+        with self._lock:
+            keys = self._reap(self.ttl_key, max_expires_at, limit)
+            if self._root is self:
+                for ttl_key in list(self._ttl_keys):
+                    if len(keys) >= limit:
+                        break
+                    keys += self._reap(ttl_key, max_expires_at, limit - len(keys))
+        return keys
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self.tags.get(tag, ()))
+            return [key for key in keys if self._delete(key)]
+
+    def incr(self, key):
+        with self._lock:
+            value = self.counters[key] = self.counters.get(key, 0) + 1
+        return value
+
+    def get_counter(self, key):
+        return self.counters.get(key, 0)
+
+    def with_ttl_key(self, ttl_key):
+        """
+        Returns a backend keeping its entries' expiry times under ``ttl_key``,
+        apart from this one's, so that expiry queries only go through its
+        entries. Everything else is shared: the store, tags, locks, and
+        ``max_entries`` and ``max_bytes``, which bound all namespaces
+        together, evicting across them. This backend's ``reap`` goes through
+        its entries too.
+        """
+
+        if ttl_key == self._root.ttl_key:
+            return self._root
+
+        backend = copy.copy(self)
+        backend.ttl_key = ttl_key
+        return backend
+
+    def snapshot(self, path):
+        """
+        Writes all entries, with their expiry times, to ``path``. The file is
+        replaced atomically, so a reader never sees a partial snapshot.
+
+        :return: number of entries written
+        """
+
+        with self._lock:
+            ttls = self._index()
+            entries = [(key, self.store[key], expires_at) for key, expires_at in ttls.items()]
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                         delete=False) as f:
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.dump(SNAPSHOT_VERSION)
+            for entry in entries:
+                pickler.dump(entry)
+        os.replace(f.name, path)
+        return len(entries)
+
+    def restore(self, path):
+        """
+        Loads the entries of a snapshot written by ``snapshot``, keeping their
+        expiry times. Entries written in the meantime are kept over the
+        snapshot's. A missing snapshot restores nothing.
+
+        Snapshots are ``pickle`` files, so they must only be read from trusted
+        locations.
+
+        :return: number of entries restored
+        """
+
+        try:
+            f = open(path, 'rb')
+        except (IOError, OSError):
+            return 0
+
+        restored = 0
+        with f:
+            unpickler = pickle.Unpickler(f)
+            if unpickler.load() != SNAPSHOT_VERSION:
+                raise ValueError('Unsupported snapshot: %s' % path)
+            while True:
+                try:
+                    key, value, expires_at = unpickler.load()
+                except EOFError:
+                    break
+                with self._lock:
+                    if key not in self._index():
+                        self._set(key, value, expires_at)
+                        restored += 1
+        return restored
+
+    def start_restore(self, path):
+        """
+        Restores a snapshot in a daemon thread, so that startup doesn't wait
+        for it; entries become available as they are loaded.
+
+        :return: the started ``threading.Thread``
+        """
+
+        thread = threading.Thread(target=self.restore, args=(path,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _get(self, key):
+        try:
+            value = self.store[key]
+            expired = self._index()[key] < time.time()
+        except KeyError:
+            return (None, True)
+
+        if self.policy is not None:
+            self.policy.touch(key)
+        return (value, expired)
+
+    def _get_many(self, keys):
+        now = time.time()
+        ttls = self._index()
+        result = []
+        for key in keys:
+            try:
+                result.append((self.store[key], ttls[key] < now))
+            except KeyError:
+                result.append((None, True))
+                continue
+            if self.policy is not None:
+                self.policy.touch(key)
+        return result
+
+    def _range(self, min_expires_at, max_expires_at, with_scores):
+        ttls = self._index()
+        keys = ttls.range(min_expires_at, max_expires_at)
+        if with_scores:
+            return [(key, ttls[key]) for key in keys]
+        return keys
+
+    def _iter_range(self, min_expires_at, max_expires_at, batch_size, with_scores):
+        ttls, cursor = self._index(), None
+        while True:
+            with self._lock:
+                items, cursor = ttls.page(min_expires_at, max_expires_at, batch_size, cursor)
+            for item in items:
+                yield item if with_scores else item[0]
+            if len(items) < batch_size:
+                return
+
+    def _set(self, key, value, expires_at, tags=None):
+        with self._lock:
+            # Entries written without tags keep the ones they had
+            if tags:
+                self._untag(key)
+                self.key_tags[key] = set(tags)
+                for tag in tags:
+                    self.tags.setdefault(tag, set()).add(key)
+
+            ttls = self._ttls()
+            if self.policy is not None:
+                if key in ttls:
+                    self._root._bytes -= sizeof(self.store[key])
+                self._root._bytes += sizeof(value)
+                self.policy.add(key, expires_at)
+
+            self.store[key] = value
+            ttls[key] = expires_at
+
+            if self.policy is not None:
+                self._evict()
+
+    def _delete(self, key, ttls=None):
+        with self._lock:
+            ttls = self._index() if ttls is None else ttls
+            # Keys of other namespaces are left alone
+            if key not in ttls:
+                return False
+            self._untag(key)
+            value = self.store.pop(key)
+            del ttls[key]
+
+            if self.policy is not None:
+                self._root._bytes -= sizeof(value)
+                self.policy.remove(key)
+            return True
+
+    def _reap(self, ttl_key, max_expires_at, limit):
+        ttls = self.store.get(ttl_key)
+        if ttls is None:
+            return []
+        keys = ttls.expired(max_expires_at, limit)
+        for key in keys:
+            self._delete(key, ttls)
+        if not ttls and ttl_key in self._ttl_keys:
+            del self.store[ttl_key]
+            self._ttl_keys.discard(ttl_key)
+        return keys
+
+    def _index(self):
+        # Namespaces without entries have no index
+        return self.store.get(self.ttl_key) or ExpiryIndex()
+
+    def _ttls(self):
+        ttls = self.store.get(self.ttl_key)
+        if ttls is None:
+            ttls = self.store[self.ttl_key] = ExpiryIndex()
+            self._ttl_keys.add(self.ttl_key)
+        return ttls
 
-    def get_expired(self):
-        return [key for key, expiration_time in self.store[self.ttl_key].items()
-                if 0 <= expiration_time <= time.time()]
+    def _untag(self, key):
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tags[tag]
 
-    def get_by_ttl(self, ttl):
-        return [key for key, expiration_time in self.store[self.ttl_key].items()
-                if time.time() <= expiration_time <= time.time() + ttl]
+    def _evict(self):
+        root = self._root
+        while True:
+            # The store holds every namespace's entries, and their indexes
+            entries = len(self.store) - 1 - len(self._ttl_keys)
+            if not entries or not ((self.max_entries and entries > self.max_entries) or
+                                   (self.max_bytes and root._bytes > self.max_bytes)):
+                return
+            key = self.policy.victim()
+            for ttl_key in [root.ttl_key] + list(self._ttl_keys):
+                if self._delete(key, self.store[ttl_key]):
+                    root._evictions += 1
+                    break
+            else:
+                self.policy.remove(key)
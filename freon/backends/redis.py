@@ -1,53 +1,371 @@
 from __future__ import absolute_import
+import copy
 import glob
 import os
+import uuid
+import weakref
 import redis
 
-from freon.backends.base import BaseBackend
+from freon.backends.base import BaseBackend, paginate
 
 
-class RedisBackend(BaseBackend):
-    def __init__(self, host='localhost', port=6379, db=0, password=None, **kwargs):
+SCRIPT_DIR = os.path.join(os.path.dirname(__file__), 'scripts')
+
+
+SCRIPT_SOURCES = {}
+
+# Registered scripts, by client, so backends sharing a client share them too
+_client_scripts = weakref.WeakKeyDictionary()
+
+
+def read_scripts():
+    """
+    Returns the source of every script, by name. Files are read once per
+    process. Files whose names start with an underscore hold functions
+    shared by scripts, and are prepended to all of them.
+    """
+
+    if not SCRIPT_SOURCES:
+        sources, preludes = {}, []
+        for filename in sorted(glob.glob(os.path.join(SCRIPT_DIR, '*.lua'))):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            with open(filename, 'r') as f:
+                if name.startswith('_'):
+                    preludes.append(f.read())
+                else:
+                    sources[name] = f.read()
+        SCRIPT_SOURCES.update((name, '\n'.join(preludes + [source]))
+                              for name, source in sources.items())
+    return SCRIPT_SOURCES
+
+
+def load_scripts(client):
+    if client not in _client_scripts:
+        _client_scripts[client] = dict((name, client.register_script(source))
+                                       for name, source in read_scripts().items())
+    return _client_scripts[client]
+
+
+def parse_entry(response):
+    value, expired = response
+    return (value, bool(expired))
+
+
+def decode_keys(keys, with_scores=False):
+    """
+    Decodes keys returned by Redis. Values are left as bytes, for
+    serializers to load directly.
+
+    With ``with_scores``, ``keys`` is a flat list of keys and their scores,
+    which is turned into a list of ``(key, score)`` tuples.
+    """
+
+    if with_scores:
+        return [(key.decode('utf-8'), float(score))
+                for key, score in zip(keys[::2], keys[1::2])]
+    return [key.decode('utf-8') for key in keys]
+
+
+def page_args(min_expires_at, max_expires_at, limit, cursor=None):
+    """
+    Returns the arguments of ``range_page.lua``, for the page following
+    ``cursor``, as returned by ``next_cursor``.
+    """
+
+    args = [min_expires_at, max_expires_at, limit]
+    if cursor is not None:
+        score, ties, key = cursor
+        args.extend([key, repr(score), ties])
+    return args
+
+
+class BaseRedisBackend(BaseBackend):
+    """
+    Options, locks and script calls shared by ``RedisBackend`` and
+    ``AsyncRedisBackend``, which connect with their own flavour of client.
+    """
+
+    supports_leases = True
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, client=None, **kwargs):
         self.ttl_key = kwargs.pop('ttl_key', 'freon:cache:ttls')
-        self.client = redis.StrictRedis(host=host, port=port, db=db,
-                                        password=password, decode_responses=True,
-                                        **kwargs)
+        self.lock_timeout = kwargs.pop('lock_timeout', 1)
+        self.invalidation_channel = kwargs.pop('invalidation_channel', None)
+        self.invalidation_origin = kwargs.pop('invalidation_origin', None)
+        self.tag_prefix = kwargs.pop('tag_prefix', 'freon:cache')
+        # Set the sorted set is listed in, if it is a namespace's (see with_ttl_key)
+        self.indexes_key = None
+        if client is None:
+            client = self._connect(host=host, port=port, db=db, password=password, **kwargs)
+        self.client = client
         self.register_scripts()
 
     def get_lock(self, name):
-        return self.client.lock("%s_lock" % name, timeout=1)
+        return self.client.lock(self._lock_name(name), timeout=self.lock_timeout)
+
+    def with_ttl_key(self, ttl_key):
+        """
+        Returns a backend sharing this one's client, keeping expiry times in
+        the sorted set at ``ttl_key``.
+
+        Writes register that sorted set in this backend's
+        ``<ttl_key>#indexes`` set, which this backend's ``reap`` goes through
+        as well.
+        """
+
+        backend = copy.copy(self)
+        backend.ttl_key = ttl_key
+        backend.indexes_key = self.indexes_key or '%s#indexes' % self.ttl_key
+        return backend
+
+    def register_scripts(self):
+        self._scripts = load_scripts(self.client)
+
+    def run_script(self, name, keys=[], args=[]):
+        return self._scripts[name](keys, args, client=self.client)
+
+    def _connect(self, **kwargs):
+        raise NotImplementedError()
+
+    def _lock_name(self, key):
+        return "%s_lock" % key
+
+    def _write_args(self):
+        return [self.invalidation_channel or '', self.invalidation_origin or '', self.tag_prefix,
+                self.indexes_key or '']
+
+    def _reap_args(self, grace, limit):
+        # Only the parent's reap goes through the namespaces' sorted sets
+        indexes = '' if self.indexes_key else '%s#indexes' % self.ttl_key
+        return [grace, limit, self.tag_prefix, indexes]
+
+    def _parse(self, response, parse):
+        return parse(response)
+
+
+class BaseRedisPipeline(object):
+    """
+    Queuing shared by ``RedisPipeline`` and ``AsyncRedisPipeline``, to be
+    mixed in before their backend class.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.ttl_key = backend.ttl_key
+        self.lock_timeout = backend.lock_timeout
+        self.invalidation_channel = backend.invalidation_channel
+        self.invalidation_origin = backend.invalidation_origin
+        self.tag_prefix = backend.tag_prefix
+        self.indexes_key = backend.indexes_key
+        self.client = backend.client.pipeline(transaction=False)
+        self._scripts = backend._scripts
+        self.parsers = []
+
+    def get_lock(self, name):
+        return self.backend.get_lock(name)
+
+    def pipeline(self):
+        return self
+
+    def _results(self, responses):
+        responses = iter(responses)
+        parsers, self.parsers = self.parsers, []
+        # Calls that needed no command (like get_many([])) have no response
+        return [parse(next(responses) if queued else None) for parse, queued in parsers]
+
+    def _parse(self, response, parse):
+        # Queued commands return the pipeline itself
+        self.parsers.append((parse, response is self.client))
+
+
+class RedisBackend(BaseRedisBackend):
+    """
+    Redis backend
+
+    Connection arguments (like ``socket_timeout``, ``max_connections`` or a
+    shared ``connection_pool``) are passed to ``redis.StrictRedis``.
+    Alternatively, an existing ``client`` can be given; it must not decode
+    responses.
+
+    :param ttl_key: (optional) Key of the sorted set holding expiry times. Defaults to ``freon:cache:ttls``.
+    :type ttl_key: string
+    :param lock_timeout: (optional) Seconds after which locks and leases are released, should their holder die. An entry computed for longer is still written with its expired lease, unless another lease was handed out since. Defaults to ``1``.
+    :type lock_timeout: number
+    :param invalidation_channel: (optional) Channel every written or deleted key is published on. Defaults to ``None``, meaning not to publish.
+    :type invalidation_channel: None or string
+    :param invalidation_origin: (optional) Identifies this writer in its invalidations, published as ``<origin>\\0<key>`` rather than ``<key>``, so that its own can be told apart. Defaults to ``None``.
+    :type invalidation_origin: None or string
+    :param tag_prefix: (optional) Prefix of the sets indexing entries by tag (``<tag_prefix>:tag:<tag>``) and tags by entry (``<tag_prefix>:tags:<key>``). Defaults to ``freon:cache``.
+    :type tag_prefix: string
+    :param client: (optional) Client to use instead of connecting to ``host``.
+    :type client: None or redis.StrictRedis
+    """
 
     def get(self, key):
-        value, expired = self.run_script('get', keys=[key, self.ttl_key])
-        return (value, bool(expired))
+        response = self.run_script('get', keys=[key, self.ttl_key])
+        return self._parse(response, parse_entry)
+
+    def get_many(self, keys):
+        if not keys:
+            return self._parse(None, lambda response: [])
+        response = self.run_script('get_many', keys=[self.ttl_key] + list(keys))
+        return self._parse(response, lambda response: [
+            parse_entry(entry) for entry in zip(response[::2], response[1::2])])
+
+    def get_or_lease(self, key):
+        token = uuid.uuid4().hex
+        response = self.run_script('get_or_lease',
+                                   keys=[key, self.ttl_key, self._lock_name(key)],
+                                   args=[token, int(self.lock_timeout * 1000)])
+        return self._parse(response, lambda response: (
+            response[0], bool(response[1]), token if response[2] else None))
 
-    def set(self, key, value, ttl):
-        response = self.run_script('set', keys=[key, self.ttl_key], args=[value, ttl])
-        return bool(response)
+    def set(self, key, value, ttl, tags=None):
+        response = self.run_script('set', keys=[key, self.ttl_key],
+                                   args=self._write_args() + [value, ttl] + list(tags or []))
+        return self._parse(response, bool)
+
+    def set_many(self, items, tags=None):
+        if not items:
+            return self._parse(None, lambda response: True)
+        tags = list(tags or [])
+        keys, args = [self.ttl_key], self._write_args() + [len(tags)] + tags
+        for key, (value, ttl) in items.items():
+            keys.append(key)
+            args.extend([value, ttl])
+        response = self.run_script('set_many', keys=keys, args=args)
+        return self._parse(response, bool)
+
+    def set_with_lease(self, key, value, ttl, lease):
+        response = self.run_script('set_with_lease',
+                                   keys=[key, self.ttl_key, self._lock_name(key)],
+                                   args=self._write_args() + [value, ttl, lease])
+        return self._parse(response, bool)
+
+    def release_lease(self, key, lease):
+        response = self.run_script('release_lease', keys=[self._lock_name(key)], args=[lease])
+        return self._parse(response, bool)
 
     def delete(self, key):
-        response = self.run_script('delete', keys=[key, self.ttl_key])
-        return bool(response)
+        response = self.run_script('delete', keys=[key, self.ttl_key], args=self._write_args())
+        return self._parse(response, bool)
+
+    def delete_many(self, keys):
+        if not keys:
+            return self._parse(None, lambda response: True)
+        response = self.run_script('delete_many', keys=[self.ttl_key] + list(keys),
+                                   args=self._write_args())
+        return self._parse(response, bool)
 
     def exists(self, key):
         response = self.client.exists(key)
-        return bool(response)
+        return self._parse(response, bool)
 
-    def get_expired(self):
-        return self.run_script('get_expired', keys=[self.ttl_key])
+    def get_expired(self, with_scores=False):
+        response = self.run_script('get_expired', keys=[self.ttl_key],
+                                   args=['withscores'] if with_scores else [])
+        return self._parse(response, lambda response: decode_keys(response, with_scores))
 
-    def get_by_ttl(self, ttl):
-        return self.run_script('get_by_ttl', keys=[self.ttl_key], args=[ttl])
+    def get_by_ttl(self, ttl, with_scores=False):
+        response = self.run_script('get_by_ttl', keys=[self.ttl_key],
+                                   args=[ttl, 'withscores'] if with_scores else [ttl])
+        return self._parse(response, lambda response: decode_keys(response, with_scores))
 
-    def register_scripts(self):
-        script_dir = os.path.join(os.path.dirname(__file__), 'scripts')
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Yields expired keys, ordered by expiry time, fetching ``batch_size``
+        of them per round trip.
 
-        self._scripts = {}
-        for filename in glob.glob(os.path.join(script_dir, '*.lua')):
-            with open(filename, 'r') as f:
-                script = self.client.register_script(f.read())
-                name = os.path.splitext(os.path.basename(filename))[0]
-                self._scripts[name] = script
+        Each page is a short script call, resuming right after the last key
+        seen (by rank, so keys sharing an expiry time don't need skipping
+        over), so none of them blocks the server for long, however many keys
+        there are. Keys written or deleted meanwhile may or may not be seen.
+        """
 
-    def run_script(self, name, keys=[], args=[]):
-        return self._scripts[name](keys, args)
+        now = self.client.time()[0]
+        return paginate(self._fetch_range(0, now), batch_size, with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        """
+        Yields keys expiring within ``ttl`` seconds, like ``iter_expired``.
+        """
+
+        now = self.client.time()[0]
+        return paginate(self._fetch_range(now, now + ttl), batch_size, with_scores)
+
+    def reap(self, grace=0, limit=100):
+        """
+        Deletes up to ``limit`` expired entries, in a single script call,
+        from the sorted set at ``ttl_key`` first, then from those of the
+        backends made with ``with_ttl_key`` (namespaces).
+        """
+
+        response = self.run_script('reap', keys=[self.ttl_key],
+                                   args=self._reap_args(grace, limit))
+        return self._parse(response, decode_keys)
+
+    def invalidate_tags(self, tags):
+        """
+        Deletes every entry tagged with any of ``tags``, in a single script
+        call.
+
+        :return: list of deleted keys
+        """
+
+        response = self.run_script('invalidate_tags', keys=[self.ttl_key],
+                                   args=self._write_args() + list(tags))
+        return self._parse(response, decode_keys)
+
+    def incr(self, key):
+        response = self.client.incr(key)
+        return self._parse(response, int)
+
+    def get_counter(self, key):
+        response = self.client.get(key)
+        return self._parse(response, lambda response: int(response or 0))
+
+    def pipeline(self):
+        """
+        Returns a ``RedisPipeline``, queuing calls to be sent in a single
+        round trip.
+        """
+
+        return RedisPipeline(self)
+
+    def subscribe(self, channel, callback):
+        """
+        Calls ``callback`` with every message published on ``channel``, from a
+        daemon thread. Returns the thread, which can be ``stop()``-ed.
+        """
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda message: callback(message['data'])})
+        return pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _fetch_range(self, min_expires_at, max_expires_at):
+        def fetch(cursor, limit):
+            response = self.run_script('range_page', keys=[self.ttl_key],
+                                       args=page_args(min_expires_at, max_expires_at, limit,
+                                                      cursor))
+            return decode_keys(response, with_scores=True)
+        return fetch
+
+    def _connect(self, **kwargs):
+        return redis.StrictRedis(**kwargs)
+
+
+class RedisPipeline(BaseRedisPipeline, RedisBackend):
+    """
+    Queues calls to a ``RedisBackend``, sending them in a single round trip
+    on ``execute``, which returns their results, in order.
+
+    Calls return nothing until then. Locks and subscriptions are taken right
+    away, through the backend; ``iter_expired`` and ``iter_by_ttl`` aren't
+    supported.
+    """
+
+    def execute(self):
+        return self._results(self.client.execute())
+
+    def subscribe(self, channel, callback):
+        return self.backend.subscribe(channel, callback)
@@ -0,0 +1,39 @@
+-- Prepended to every script. Entries' tags are kept in a set per entry,
+-- <prefix>:tags:<key>, and keys in a set per tag, <prefix>:tag:<tag>.
+-- Namespaces' sorted sets are listed in a set of the parent's,
+-- <ttl_key>#indexes, for its reap to go through.
+
+local function untag(prefix, key)
+    local tags_key = prefix .. ':tags:' .. key
+    local tags = redis.call('SMEMBERS', tags_key)
+    if #tags > 0 then
+        for _, name in ipairs(tags) do
+            redis.call('SREM', prefix .. ':tag:' .. name, key)
+        end
+        redis.call('DEL', tags_key)
+    end
+end
+
+local function tag(prefix, key, tags)
+    for _, name in ipairs(tags) do
+        redis.call('SADD', prefix .. ':tags:' .. key, name)
+        redis.call('SADD', prefix .. ':tag:' .. name, key)
+    end
+end
+
+local function register(indexes, zset)
+    if indexes ~= '' then
+        redis.call('SADD', indexes, zset)
+    end
+end
+
+-- Writers with an origin publish <origin>\0<key>, so they can tell their own
+-- invalidations apart
+local function publish(channel, origin, key)
+    if channel ~= '' then
+        if origin ~= '' then
+            key = origin .. '\0' .. key
+        end
+        redis.call('PUBLISH', channel, key)
+    end
+end
@@ -1,6 +1,11 @@
 local key = KEYS[1]
 local zset = KEYS[2]
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
 
 redis.call('DEL', key)
 redis.call('ZREM', zset, key)
+untag(prefix, key)
+publish(channel, origin, key)
 return true
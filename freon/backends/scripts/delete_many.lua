@@ -0,0 +1,12 @@
+local zset = KEYS[1]
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
+
+for i = 2, #KEYS do
+    redis.call('DEL', KEYS[i])
+    redis.call('ZREM', zset, KEYS[i])
+    untag(prefix, KEYS[i])
+    publish(channel, origin, KEYS[i])
+end
+return true
@@ -2,6 +2,10 @@ redis.replicate_commands()
 
 local zset = KEYS[1]
 local ttl = tonumber(ARGV[1])
+local with_scores = ARGV[2]
 local time = redis.call('TIME')[1]
 
+if with_scores then
+    return redis.call('ZRANGEBYSCORE', zset, time, time + ttl, 'WITHSCORES')
+end
 return redis.call('ZRANGEBYSCORE', zset, time, time + ttl)
@@ -1,6 +1,10 @@
 redis.replicate_commands()
 
 local zset = KEYS[1]
+local with_scores = ARGV[1]
 local time = redis.call('TIME')[1]
 
+if with_scores then
+    return redis.call('ZRANGEBYSCORE', zset, 0, time, 'WITHSCORES')
+end
 return redis.call('ZRANGEBYSCORE', zset, 0, time)
@@ -0,0 +1,25 @@
+redis.replicate_commands()
+
+local zset = KEYS[1]
+
+local time = tonumber(redis.call('TIME')[1])
+
+local result = {}
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    local value = redis.call('GET', key)
+
+    if value then
+        local expires_at = tonumber(redis.call('ZSCORE', zset, key))
+        local is_expired = 0
+        if expires_at == nil or expires_at < time then
+            is_expired = 1
+        end
+        table.insert(result, value)
+        table.insert(result, is_expired)
+    else
+        table.insert(result, false)
+        table.insert(result, 1)
+    end
+end
+return result
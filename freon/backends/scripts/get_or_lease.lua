@@ -0,0 +1,24 @@
+redis.replicate_commands()
+
+local key = KEYS[1]
+local zset = KEYS[2]
+local lease = KEYS[3]
+local token = ARGV[1]
+local lease_timeout = tonumber(ARGV[2])
+
+local time = tonumber(redis.call('TIME')[1])
+
+local value = redis.call('GET', key)
+local is_expired = 1
+
+if value then
+    local expires_at = tonumber(redis.call('ZSCORE', zset, key))
+    if expires_at ~= nil and expires_at >= time then
+        return {value, 0, false}
+    end
+end
+
+if redis.call('SET', lease, token, 'NX', 'PX', lease_timeout) then
+    return {value, is_expired, token}
+end
+return {value, is_expired, false}
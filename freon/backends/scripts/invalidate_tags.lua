@@ -0,0 +1,18 @@
+local zset = KEYS[1]
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
+
+local deleted = {}
+for i = 5, #ARGV do
+    for _, key in ipairs(redis.call('SMEMBERS', prefix .. ':tag:' .. ARGV[i])) do
+        if redis.call('DEL', key) == 1 then
+            table.insert(deleted, key)
+        end
+        redis.call('ZREM', zset, key)
+        untag(prefix, key)
+        publish(channel, origin, key)
+    end
+    redis.call('DEL', prefix .. ':tag:' .. ARGV[i])
+end
+return deleted
@@ -0,0 +1,46 @@
+local zset = KEYS[1]
+local min = ARGV[1]
+local max = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local last_key = ARGV[4]
+local last_score = ARGV[5]
+local skip = tonumber(ARGV[6])
+
+if last_key == nil then
+    return redis.call('ZRANGEBYSCORE', zset, min, max, 'WITHSCORES', 'LIMIT', 0, count)
+end
+
+-- Resumes right after the last key, unless it was deleted or moved since
+local score = redis.call('ZSCORE', zset, last_key)
+if score and tonumber(score) == tonumber(last_score) then
+    local rank = redis.call('ZRANK', zset, last_key)
+    local items = redis.call('ZRANGE', zset, rank + 1, rank + count, 'WITHSCORES')
+    local page = {}
+    for i = 1, #items, 2 do
+        if tonumber(items[i + 1]) > max then
+            break
+        end
+        table.insert(page, items[i])
+        table.insert(page, items[i + 1])
+    end
+    return page
+end
+
+-- Otherwise, keys sharing the last expiry time are sorted by name: keeps
+-- those following the last key, reading past the ones already seen
+local page, offset, window = {}, 0, skip + count
+repeat
+    local items = redis.call('ZRANGEBYSCORE', zset, last_score, max, 'WITHSCORES',
+                             'LIMIT', offset, window)
+    for i = 1, #items, 2 do
+        if #page == 2 * count then
+            break
+        end
+        if tonumber(items[i + 1]) > tonumber(last_score) or items[i] > last_key then
+            table.insert(page, items[i])
+            table.insert(page, items[i + 1])
+        end
+    end
+    offset = offset + window
+until #page == 2 * count or #items < 2 * window
+return page
@@ -0,0 +1,32 @@
+redis.replicate_commands()
+
+local zset = KEYS[1]
+local grace = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local prefix = ARGV[3]
+local indexes = ARGV[4]
+
+local time = tonumber(redis.call('TIME')[1])
+local reaped = {}
+
+local function reap(index)
+    local keys = redis.call('ZRANGEBYSCORE', index, 0, time - grace, 'LIMIT', 0, limit - #reaped)
+    for _, key in ipairs(keys) do
+        redis.call('DEL', key)
+        redis.call('ZREM', index, key)
+        untag(prefix, key)
+        table.insert(reaped, key)
+    end
+end
+
+reap(zset)
+-- Then the sorted sets of namespaces, if this is their parent's
+if indexes ~= '' then
+    for _, index in ipairs(redis.call('SMEMBERS', indexes)) do
+        if #reaped >= limit then
+            break
+        end
+        reap(index)
+    end
+end
+return reaped
@@ -0,0 +1,8 @@
+local lease = KEYS[1]
+local token = ARGV[1]
+
+if redis.call('GET', lease) == token then
+    redis.call('DEL', lease)
+    return true
+end
+return false
@@ -2,12 +2,27 @@ redis.replicate_commands()
 
 local key = KEYS[1]
 local zset = KEYS[2]
-local value = ARGV[1]
-local ttl = tonumber(ARGV[2])
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
+local indexes = ARGV[4]
+local value = ARGV[5]
+local ttl = tonumber(ARGV[6])
+local tags = {}
+for i = 7, #ARGV do
+    table.insert(tags, ARGV[i])
+end
 
 local time = redis.call('TIME')[1]
 local expires_at = time + ttl
 
 redis.call('SET', key, value)
 redis.call('ZADD', zset, expires_at, key)
+register(indexes, zset)
+-- Entries written without tags keep the ones they had
+if #tags > 0 then
+    untag(prefix, key)
+    tag(prefix, key, tags)
+end
+publish(channel, origin, key)
 return true
@@ -0,0 +1,31 @@
+redis.replicate_commands()
+
+local zset = KEYS[1]
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
+local indexes = ARGV[4]
+local tag_count = tonumber(ARGV[5])
+local tags = {}
+for i = 6, 5 + tag_count do
+    table.insert(tags, ARGV[i])
+end
+
+local time = redis.call('TIME')[1]
+
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    local value = ARGV[2 * i + 2 + tag_count]
+    local ttl = tonumber(ARGV[2 * i + 3 + tag_count])
+
+    redis.call('SET', key, value)
+    redis.call('ZADD', zset, time + ttl, key)
+    -- Entries written without tags keep the ones they had
+    if tag_count > 0 then
+        untag(prefix, key)
+        tag(prefix, key, tags)
+    end
+    publish(channel, origin, key)
+end
+register(indexes, zset)
+return true
@@ -0,0 +1,29 @@
+redis.replicate_commands()
+
+local key = KEYS[1]
+local zset = KEYS[2]
+local lease = KEYS[3]
+local channel = ARGV[1]
+local origin = ARGV[2]
+local prefix = ARGV[3]
+local indexes = ARGV[4]
+local value = ARGV[5]
+local ttl = tonumber(ARGV[6])
+local token = ARGV[7]
+
+-- A lease that expired while computing the value is fine, as long as nobody
+-- took a new one since
+local holder = redis.call('GET', lease)
+if holder and holder ~= token then
+    return false
+end
+
+local time = redis.call('TIME')[1]
+local expires_at = time + ttl
+
+redis.call('SET', key, value)
+redis.call('ZADD', zset, expires_at, key)
+register(indexes, zset)
+redis.call('DEL', lease)
+publish(channel, origin, key)
+return true
@@ -0,0 +1,306 @@
+from __future__ import absolute_import
+import bisect
+import copy
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from freon.backends.base import BaseBackend
+from freon.backends.redis import RedisBackend
+
+
+def hash_key(key):
+    return int(hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest(), 16)
+
+
+class HashRing(object):
+    """
+    Consistent hash ring, mapping keys to nodes.
+
+    Every node is placed on the ring ``replicas`` times, so keys spread
+    evenly and adding or removing a node only moves the keys it gains or
+    loses.
+    """
+
+    def __init__(self, names, replicas=160):
+        points = sorted((hash_key('%s#%s' % (name, i)), node)
+                        for node, name in enumerate(names)
+                        for i in range(replicas))
+        self.hashes = [hash for hash, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        i = bisect.bisect(self.hashes, hash_key(key))
+        return self.nodes[i % len(self.nodes)]
+
+
+class Listeners(list):
+    def stop(self):
+        for listener in self:
+            listener.stop()
+
+
+class ShardedBackend(BaseBackend):
+    """
+    Spreads keys across several Redis nodes, by consistent hashing
+
+    Every node keeps the expiry times of its own keys, so each script still
+    touches a single node. Multi-key operations are grouped by node and
+    queries over expiry times are fanned out to all nodes, in parallel.
+
+    :param nodes: Connection arguments of each node, passed to ``RedisBackend`` along with ``**kwargs``. A ``name`` identifies the node on the ring; it defaults to ``host:port/db``, so the ring doesn't change when nodes are reordered.
+    :type nodes: list of dicts
+    :param replicas: (optional) Number of points each node has on the ring. Defaults to ``160``.
+    :type replicas: integer
+    :param **kwargs: (optional) Arguments shared by all nodes, like ``ttl_key``.
+
+    Usage::
+
+      >>> cache = Cache(backend='sharded', nodes=[{'host': 'redis1'}, {'host': 'redis2'}])
+    """
+
+    supports_leases = True
+
+    def __init__(self, nodes, replicas=160, **kwargs):
+        names, self.nodes = [], []
+        for node in nodes:
+            config = dict(kwargs, **node)
+            names.append(config.pop('name', None) or '%s:%s/%s' % (
+                config.get('host', 'localhost'), config.get('port', 6379), config.get('db', 0)))
+            self.nodes.append(RedisBackend(**config))
+
+        self.ring = HashRing(names, replicas)
+        self.executor = ThreadPoolExecutor(len(self.nodes))
+
+    def get_node(self, key):
+        return self.nodes[self.ring.get_node(key)]
+
+    def get_lock(self, name):
+        return self.get_node(name).get_lock(name)
+
+    def get(self, key):
+        return self.get_node(key).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        groups = self._group(keys)
+        results = self._fan_out(lambda node, keys: node.get_many(keys), groups)
+
+        found = {}
+        for group, values in zip(groups.values(), results):
+            found.update(zip(group, values))
+        return [found[key] for key in keys]
+
+    def get_or_lease(self, key):
+        return self.get_node(key).get_or_lease(key)
+
+    def set(self, key, value, ttl, tags=None):
+        return self.get_node(key).set(key, value, ttl, tags)
+
+    def set_many(self, items, tags=None):
+        groups = self._group(items)
+        results = self._fan_out(
+            lambda node, keys: node.set_many(dict((key, items[key]) for key in keys), tags),
+            groups)
+        return all(results)
+
+    def set_with_lease(self, key, value, ttl, lease):
+        return self.get_node(key).set_with_lease(key, value, ttl, lease)
+
+    def release_lease(self, key, lease):
+        return self.get_node(key).release_lease(key, lease)
+
+    def delete(self, key):
+        return self.get_node(key).delete(key)
+
+    def delete_many(self, keys):
+        results = self._fan_out(lambda node, keys: node.delete_many(keys), self._group(keys))
+        return all(results)
+
+    def exists(self, key):
+        return self.get_node(key).exists(key)
+
+    def get_expired(self, with_scores=False):
+        return self._merge(self._fan_out(lambda node: node.get_expired(with_scores=True)),
+                           with_scores)
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        return self._merge(self._fan_out(lambda node: node.get_by_ttl(ttl, with_scores=True)),
+                           with_scores)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Yields expired keys of all nodes, merged by expiry time, fetching
+        ``batch_size`` keys per round trip to a node.
+        """
+
+        return self._merge_iter([node.iter_expired(batch_size, with_scores=True)
+                                 for node in self.nodes], with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        return self._merge_iter([node.iter_by_ttl(ttl, batch_size, with_scores=True)
+                                 for node in self.nodes], with_scores)
+
+    def reap(self, grace=0, limit=100):
+        """
+        Deletes up to ``limit`` expired entries from each node.
+        """
+
+        results = self._fan_out(lambda node: node.reap(grace, limit))
+        return [key for keys in results for key in keys]
+
+    def invalidate_tags(self, tags):
+        """
+        Deletes the entries tagged with any of ``tags`` from every node. Each
+        node indexes the tags of its own keys.
+        """
+
+        results = self._fan_out(lambda node: node.invalidate_tags(tags))
+        return [key for keys in results for key in keys]
+
+    def incr(self, key):
+        return self.get_node(key).incr(key)
+
+    def get_counter(self, key):
+        return self.get_node(key).get_counter(key)
+
+    def with_ttl_key(self, ttl_key):
+        backend = copy.copy(self)
+        backend.nodes = [node.with_ttl_key(ttl_key) for node in self.nodes]
+        return backend
+
+    def pipeline(self):
+        """
+        Returns a ``ShardedPipeline``, queuing calls on a pipeline per node.
+        """
+
+        return ShardedPipeline(self)
+
+    def subscribe(self, channel, callback):
+        """
+        Subscribes to ``channel`` on every node. Returns the listening
+        threads, which can be ``stop()``-ed together.
+        """
+
+        return Listeners(node.subscribe(channel, callback) for node in self.nodes)
+
+    def _group(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.ring.get_node(key), []).append(key)
+        return groups
+
+    def _fan_out(self, fn, groups=None):
+        if groups is None:
+            futures = [self.executor.submit(fn, node) for node in self.nodes]
+        else:
+            futures = [self.executor.submit(fn, self.nodes[node], keys)
+                       for node, keys in groups.items()]
+        return [future.result() for future in futures]
+
+    def _merge(self, results, with_scores=False):
+        return list(self._merge_iter(results, with_scores))
+
+    def _merge_iter(self, results, with_scores=False):
+        merged = heapq.merge(*results, key=lambda item: (item[1], item[0]))
+        if with_scores:
+            return merged
+        return (key for key, _ in merged)
+
+
+class ShardedPipeline(object):
+    """
+    Queues calls to a ``ShardedBackend`` on a ``RedisPipeline`` per node,
+    sending them in a single round trip per node, to all nodes in parallel,
+    on ``execute``, which returns their results, in order.
+
+    Calls return nothing until then. Multi-key calls are split by node, just
+    like with the backend. Locks and subscriptions are taken right away,
+    through the backend; queries over expiry times aren't supported.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.pipelines = {}
+        self.counts = {}
+        self.calls = []
+
+    def get(self, key):
+        self._call(key, 'get')
+
+    def get_many(self, keys):
+        keys = list(keys)
+        groups = self.backend._group(keys)
+
+        def combine(results):
+            found = {}
+            for group, values in zip(groups.values(), results):
+                found.update(zip(group, values))
+            return [found[key] for key in keys]
+
+        self.calls.append(([self._queue(node, 'get_many', group)
+                            for node, group in groups.items()], combine))
+
+    def get_or_lease(self, key):
+        self._call(key, 'get_or_lease')
+
+    def set(self, key, value, ttl, tags=None):
+        self._call(key, 'set', value, ttl, tags)
+
+    def set_many(self, items, tags=None):
+        self.calls.append(([self._queue(node, 'set_many', dict((key, items[key]) for key in keys),
+                                        tags)
+                            for node, keys in self.backend._group(items).items()], all))
+
+    def set_with_lease(self, key, value, ttl, lease):
+        self._call(key, 'set_with_lease', value, ttl, lease)
+
+    def release_lease(self, key, lease):
+        self._call(key, 'release_lease', lease)
+
+    def delete(self, key):
+        self._call(key, 'delete')
+
+    def delete_many(self, keys):
+        self.calls.append(([self._queue(node, 'delete_many', group)
+                            for node, group in self.backend._group(keys).items()], all))
+
+    def exists(self, key):
+        self._call(key, 'exists')
+
+    def incr(self, key):
+        self._call(key, 'incr')
+
+    def get_counter(self, key):
+        self._call(key, 'get_counter')
+
+    def get_lock(self, name):
+        return self.backend.get_lock(name)
+
+    def subscribe(self, channel, callback):
+        return self.backend.subscribe(channel, callback)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pipelines, self.pipelines, self.counts = self.pipelines, {}, {}
+        calls, self.calls = self.calls, []
+        futures = dict((node, self.backend.executor.submit(pipeline.execute))
+                       for node, pipeline in pipelines.items())
+        responses = dict((node, future.result()) for node, future in futures.items())
+        return [combine([responses[node][position] for node, position in refs])
+                for refs, combine in calls]
+
+    def _call(self, key, name, *args):
+        self.calls.append(([self._queue(self.backend.ring.get_node(key), name, key, *args)],
+                           lambda results: results[0]))
+
+    def _queue(self, node, name, *args):
+        # Returns where the call's response will be: its node and position
+        if node not in self.pipelines:
+            self.pipelines[node] = self.backend.nodes[node].pipeline()
+            self.counts[node] = 0
+        getattr(self.pipelines[node], name)(*args)
+        self.counts[node] += 1
+        return node, self.counts[node] - 1
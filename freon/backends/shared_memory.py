@@ -0,0 +1,282 @@
+from __future__ import absolute_import
+import contextlib
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from freon.backends.base import BaseBackend
+from freon.backends.memory import LockRegistry
+
+
+MAGIC = b'freon\x00\x01\x00'
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+# state, kind, key length, value length, expiry time, key hash
+SLOT = struct.Struct('<BBHIdQ')
+
+EMPTY, USED, DELETED = 0, 1, 2
+BYTES, TEXT = 0, 1
+
+
+def default_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'freon-cache')
+
+
+def hash_key(key):
+    return int(hashlib.blake2b(key, digest_size=8).hexdigest(), 16)
+
+
+class SharedKeyLock(object):
+    """
+    Lock guarding a single key across all processes sharing the file.
+
+    ``fcntl`` locks belong to whole processes, so threads of the same process
+    are first serialized through a ``KeyLock``.
+    """
+
+    def __init__(self, backend, key):
+        self.backend = backend
+        self.offset = 1 + hash_key(key.encode('utf-8')) % (2 ** 62)
+        self._lock = backend.locks.get(key)
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        start = time.time()
+        if not self._lock.acquire(blocking, blocking_timeout):
+            return False
+
+        while True:
+            try:
+                fcntl.lockf(self.backend.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self.offset)
+                return True
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    self._lock.release()
+                    raise
+
+            self.backend.locks.contended(self._lock.key)
+            if not blocking or (blocking_timeout is not None and
+                                time.time() - start >= blocking_timeout):
+                self._lock.release()
+                return False
+            time.sleep(0.005)
+
+    def release(self):
+        fcntl.lockf(self.backend.fd, fcntl.LOCK_UN, 1, self.offset)
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+
+class SharedMemoryBackend(BaseBackend):
+    """
+    Keeps cached entries in a memory-mapped file, shared by all processes
+    on the host that open it, like the workers of an application server.
+
+    The file holds a fixed-size hash table of ``slots`` slots of
+    ``slot_size`` bytes each, for the key, the (serialized) value and its
+    expiry time. Entries that don't fit in a slot are not cached. When all
+    slots a key may go to are taken, the entry closest to expiring among
+    them is evicted; evictions are counted in ``evictions``.
+
+    Reads and writes are guarded by a lock on the whole file, and
+    ``get_lock`` hands out per-key locks, both held across processes through
+    ``fcntl``. Since those belong to whole processes, a process should only
+    keep one backend per file open. Only available on POSIX systems.
+
+    ``get_expired``, ``get_by_ttl`` and ``reap`` scan the whole table.
+
+    :param path: (optional) File holding the table. Defaults to ``freon-cache`` in ``/dev/shm``, or in the temporary directory.
+    :type path: string
+    :param slots: (optional) Number of slots, only used when creating the file. Defaults to ``65536``.
+    :type slots: integer
+    :param slot_size: (optional) Size of a slot, in bytes, only used when creating the file. Defaults to ``1024``.
+    :type slot_size: integer
+    :param max_probes: (optional) Number of slots a key may go to. Defaults to ``16``.
+    :type max_probes: integer
+    """
+
+    def __init__(self, path=None, slots=65536, slot_size=1024, max_probes=16, **kwargs):
+        self.ttl_key = kwargs.pop('ttl_key', 'freon:cache:ttls')
+        self.path = path or default_path()
+        self.max_probes = max_probes
+        self.locks = LockRegistry()
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self.fd).st_size == 0:
+                os.ftruncate(self.fd, HEADER_SIZE + slots * slot_size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, slots, slot_size), 0)
+            magic, self.slots, self.slot_size = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+        if magic != MAGIC:
+            os.close(self.fd)
+            raise ValueError('%s is not a freon cache file' % self.path)
+
+        self.map = mmap.mmap(self.fd, HEADER_SIZE + self.slots * self.slot_size)
+
+    def close(self):
+        """
+        Unmaps the file. Entries stay in it, for other processes.
+        """
+
+        self.map.close()
+        os.close(self.fd)
+
+    def get_lock(self, key):
+        return SharedKeyLock(self, key)
+
+    def get(self, key):
+        with self._locked(shared=True):
+            return self._get(key.encode('utf-8'), time.time())
+
+    def get_many(self, keys):
+        with self._locked(shared=True):
+            now = time.time()
+            return [self._get(key.encode('utf-8'), now) for key in keys]
+
+    def set(self, key, value, ttl):
+        with self._locked():
+            return self._set(key.encode('utf-8'), value, time.time() + ttl)
+
+    def set_many(self, items):
+        with self._locked():
+            now = time.time()
+            results = [self._set(key.encode('utf-8'), value, now + ttl)
+                       for key, (value, ttl) in items.items()]
+        return all(results)
+
+    def delete(self, key):
+        with self._locked():
+            self._delete(key.encode('utf-8'))
+        return True
+
+    def delete_many(self, keys):
+        with self._locked():
+            for key in keys:
+                self._delete(key.encode('utf-8'))
+        return True
+
+    def exists(self, key):
+        with self._locked(shared=True):
+            return self._find(key.encode('utf-8'))[0] is not None
+
+    def get_expired(self, with_scores=False):
+        return self._range(0, time.time(), with_scores)
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        now = time.time()
+        return self._range(now, now + ttl, with_scores)
+
+    def reap(self, grace=0, limit=100):
+        with self._locked():
+            max_expires_at = time.time() - grace
+            keys = [(header[4], self._key(offset, header)) for offset, header in self._scan()
+                    if header[4] <= max_expires_at]
+            keys = [key for _, key in sorted(keys)[:limit]]
+            for key in keys:
+                self._delete(key)
+        return [key.decode('utf-8') for key in keys]
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        with self._lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, 1, 0)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 0)
+
+    def _offset(self, slot):
+        return HEADER_SIZE + slot * self.slot_size
+
+    def _probe(self, hash):
+        for i in range(min(self.max_probes, self.slots)):
+            yield self._offset((hash + i) % self.slots)
+
+    def _header(self, offset):
+        return SLOT.unpack_from(self.map, offset)
+
+    def _key(self, offset, header):
+        start = offset + SLOT.size
+        return self.map[start:start + header[2]]
+
+    def _find(self, key):
+        """
+        Returns the offset and header of the slot holding ``key``, and the
+        offset of the slot it may be written to otherwise.
+        """
+
+        hash = hash_key(key)
+        free = victim = None
+        for offset in self._probe(hash):
+            header = self._header(offset)
+            state = header[0]
+            if state == EMPTY:
+                return None, None, free if free is not None else offset
+            if state == DELETED:
+                if free is None:
+                    free = offset
+                continue
+            if header[5] == hash and self._key(offset, header) == key:
+                return offset, header, offset
+            if victim is None or header[4] < victim[1]:
+                victim = (offset, header[4])
+        return None, None, free if free is not None else victim[0]
+
+    def _get(self, key, now):
+        offset, header = self._find(key)[:2]
+        if offset is None:
+            return (None, True)
+
+        start = offset + SLOT.size + header[2]
+        value = self.map[start:start + header[3]]
+        if header[1] == TEXT:
+            value = value.decode('utf-8')
+        return (value, header[4] < now)
+
+    def _set(self, key, value, expires_at):
+        kind = TEXT if isinstance(value, str) else BYTES
+        if kind == TEXT:
+            value = value.encode('utf-8')
+        if SLOT.size + len(key) + len(value) > self.slot_size:
+            return False
+
+        offset, header, target = self._find(key)
+        if offset is None and self._header(target)[0] == USED:
+            self.evictions += 1
+
+        start = target + SLOT.size
+        self.map[start:start + len(key)] = key
+        self.map[start + len(key):start + len(key) + len(value)] = value
+        SLOT.pack_into(self.map, target, USED, kind, len(key), len(value), expires_at,
+                       hash_key(key))
+        return True
+
+    def _delete(self, key):
+        offset = self._find(key)[0]
+        if offset is not None:
+            self.map[offset:offset + 1] = bytes(bytearray([DELETED]))
+
+    def _scan(self):
+        for slot in range(self.slots):
+            offset = self._offset(slot)
+            header = self._header(offset)
+            if header[0] == USED:
+                yield offset, header
+
+    def _range(self, min_expires_at, max_expires_at, with_scores=False):
+        with self._locked(shared=True):
+            keys = [(header[4], self._key(offset, header)) for offset, header in self._scan()
+                    if min_expires_at <= header[4] <= max_expires_at]
+        if with_scores:
+            return [(key.decode('utf-8'), expires_at) for expires_at, key in sorted(keys)]
+        return [key.decode('utf-8') for _, key in sorted(keys)]
@@ -0,0 +1,183 @@
+from __future__ import absolute_import
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from freon.backends.base import BaseBackend, paginate
+from freon.backends.memory import LockRegistry
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS entries ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)',
+    # Superseded by entries_expiry, which pages by expiry time and key
+    'DROP INDEX IF EXISTS entries_expires_at',
+    'CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at, key)',
+    'CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+]
+
+# Stays below SQLite's limit on the number of parameters of a statement
+BATCH_SIZE = 500
+
+
+def batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SqliteBackend(BaseBackend):
+    """
+    Keeps cached entries in a SQLite database, so that they survive
+    restarts.
+
+    The database is in WAL mode, so reads don't wait for writes. Every
+    thread gets its own connection. Values are stored as they are given,
+    text or bytes, and expiry times are indexed.
+
+    Locks are only held within the current process.
+
+    :param path: (optional) Database file. Defaults to ``freon-cache.sqlite`` in the temporary directory.
+    :type path: string
+    :param synchronous: (optional) SQLite's ``synchronous`` setting. ``NORMAL`` doesn't sync on every write in WAL mode, so the latest writes may be lost on power failure, but not on a crash of the process. Defaults to ``NORMAL``.
+    :type synchronous: string
+    """
+
+    def __init__(self, path=None, synchronous='NORMAL', **kwargs):
+        self.ttl_key = kwargs.pop('ttl_key', 'freon:cache:ttls')
+        self.path = path or os.path.join(tempfile.gettempdir(), 'freon-cache.sqlite')
+        self.synchronous = synchronous
+        self.locks = LockRegistry()
+        self._local = threading.local()
+
+        with self.connection as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=%s' % self.synchronous)
+        return connection
+
+    def get_lock(self, key):
+        return self.locks.get(key)
+
+    def get(self, key):
+        row = self.connection.execute('SELECT value, expires_at FROM entries WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return (None, True)
+        return (row[0], row[1] < time.time())
+
+    def get_many(self, keys):
+        keys = list(keys)
+        now, found = time.time(), {}
+        for batch in batches(keys):
+            rows = self.connection.execute(
+                'SELECT key, value, expires_at FROM entries WHERE key IN (%s)' %
+                ', '.join('?' * len(batch)), batch)
+            for key, value, expires_at in rows:
+                found[key] = (value, expires_at < now)
+        return [found.get(key, (None, True)) for key in keys]
+
+    def set(self, key, value, ttl):
+        with self.connection as connection:
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                               (key, value, time.time() + ttl))
+        return True
+
+    def set_many(self, items):
+        now = time.time()
+        with self.connection as connection:
+            connection.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                                   [(key, value, now + ttl)
+                                    for key, (value, ttl) in items.items()])
+        return True
+
+    def delete(self, key):
+        with self.connection as connection:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+        return True
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        with self.connection as connection:
+            for batch in batches(keys):
+                connection.execute('DELETE FROM entries WHERE key IN (%s)' %
+                                   ', '.join('?' * len(batch)), batch)
+        return True
+
+    def exists(self, key):
+        row = self.connection.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone()
+        return row is not None
+
+    def get_expired(self):
+        return self._range(0, time.time())
+
+    def get_by_ttl(self, ttl):
+        now = time.time()
+        return self._range(now, now + ttl)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        """
+        Yields expired keys, ordered by expiry time, querying ``batch_size``
+        of them at a time.
+        """
+
+        return paginate(self._fetch_range(0, time.time()), batch_size, with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        now = time.time()
+        return paginate(self._fetch_range(now, now + ttl), batch_size, with_scores)
+
+    def reap(self, grace=0, limit=100):
+        max_expires_at = time.time() - grace
+        with self.connection as connection:
+            keys = [key for key, in connection.execute(
+                'SELECT key FROM entries WHERE expires_at <= ? '
+                'ORDER BY expires_at, key LIMIT ?', (max_expires_at, limit))]
+            # Entries may have been refreshed since, by another process
+            connection.executemany('DELETE FROM entries WHERE key = ? AND expires_at <= ?',
+                                   [(key, max_expires_at) for key in keys])
+        return keys
+
+    def incr(self, key):
+        with self.connection as connection:
+            # Rather than an upsert, which needs SQLite 3.24
+            connection.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)', (key,))
+            connection.execute('UPDATE counters SET value = value + 1 WHERE key = ?', (key,))
+            return connection.execute('SELECT value FROM counters WHERE key = ?',
+                                      (key,)).fetchone()[0]
+
+    def get_counter(self, key):
+        row = self.connection.execute('SELECT value FROM counters WHERE key = ?',
+                                      (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _fetch_range(self, min_expires_at, max_expires_at):
+        def fetch(cursor, limit):
+            if cursor is None:
+                return self.connection.execute(
+                    'SELECT key, expires_at FROM entries WHERE expires_at BETWEEN ? AND ? '
+                    'ORDER BY expires_at, key LIMIT ?',
+                    (min_expires_at, max_expires_at, limit)).fetchall()
+            score, _, key = cursor
+            # Same as (expires_at, key) > (score, key), without row values
+            # (SQLite 3.15), and still a range scan on the expiry index
+            return self.connection.execute(
+                'SELECT key, expires_at FROM entries '
+                'WHERE expires_at BETWEEN ? AND ? AND (expires_at > ? OR key > ?) '
+                'ORDER BY expires_at, key LIMIT ?',
+                (score, max_expires_at, score, key, limit)).fetchall()
+        return fetch
+
+    def _range(self, min_expires_at, max_expires_at):
+        rows = self.connection.execute(
+            'SELECT key FROM entries WHERE expires_at BETWEEN ? AND ? ORDER BY expires_at, key',
+            (min_expires_at, max_expires_at))
+        return [key for key, in rows]
@@ -1,20 +1,66 @@
+import contextlib
+import copy
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
 
+from freon.memoize import memoize
+from freon.namespace import NamespacedBackend
+from freon.pipeline import Pipeline
+from freon.reaper import Reaper
+from freon.refresher import Refresher
+from freon.serializers.base import BaseSerializer
+from freon.serializers.compressed import CompressedSerializer
+from freon.stats import InstrumentedBackend, InstrumentedSerializer, Stats
+
+
+# First item of the ``[marker, value, delta, expires_at]`` envelopes XFetch
+# stores entries in, telling them apart from plain values
+XFETCH_MARKER = 'freon:xfetch:1'
+
+
+def class_name(name):
+    """
+    Turns a backend or serializer name, like ``fast_json``, into the prefix
+    of its class name, like ``FastJson``.
+    """
+
+    return ''.join(part.capitalize() for part in name.split('_'))
+
 
 class Cache(object):
     """
     Connection to a cache backend
 
-    :param backend: (optional) Name of backend to connect to. Can be one of ``redis`` or ``memory``. Defaults to ``memory``.
+    :param backend: (optional) Name of backend to connect to. Can be one of ``memory``, ``concurrent_memory``, ``shared_memory``, ``sqlite``, ``redis`` or ``sharded`` (Redis nodes). Defaults to ``memory``.
     :type backend: string
-    :param serializer: (optional) Name of serializer used to serialize/deserialize cached values. Can be one of ``msgpack``, ``pickle`` or ``json``. Defaults to ``json``.
-    :type serializer: string
+    :param serializer: (optional) Name of serializer used to serialize/deserialize cached values. Can be one of ``msgpack``, ``pickle``, ``json`` or ``fast_json``, optionally followed by ``+zlib``, ``+lz4`` or ``+zstd`` to compress large values. Can also be a serializer instance, like a ``CompressedSerializer``. Defaults to ``json``.
+    :type serializer: string or BaseSerializer
     :param default_ttl: (optional) Default TTL applied to items that don't have one associated. Value is expressed in seconds. Defaults to ``3600``.
     :type default_ttl: integer
     :param custom_encoder: (optional) Custom encoder to extend the serializer's default behaviour.
     :type custom_encoder: None or callable
     :param custom_decoder: (optional) Custom decoder to extend the serializer's default behaviour.
     :type custom_decoder: None or callable
+    :param wait_timeout: (optional) Seconds to wait for another thread that is already caching a missing entry, instead of returning ``None``. Defaults to ``None``, meaning not to wait.
+    :type wait_timeout: None or number
+    :param return_stale: (optional) Whether ``get`` and ``get_many`` return expired entries. Defaults to ``True``.
+    :type return_stale: bool
+    :param stale_while_revalidate: (optional) Whether ``get_or_set`` returns expired entries right away, refreshing them in the background. Defaults to ``False``.
+    :type stale_while_revalidate: bool
+    :param refresh_workers: (optional) Number of threads refreshing expired entries in the background. Defaults to ``4``.
+    :type refresh_workers: integer
+    :param max_refreshes: (optional) Maximum number of background refreshes running or queued at once; expired entries beyond that are served stale without being refreshed. Defaults to ``100``.
+    :type max_refreshes: integer
+    :param early_refresh_beta: (optional) Enables probabilistic early refreshes (XFetch) in ``get_or_set``, the higher the earlier. ``1`` is a good start. Entries are then stored together with the time it took to compute them and their expiry time. Entries stored without them are read as usual, and never refreshed early. Defaults to ``None``, meaning disabled.
+    :type early_refresh_beta: None or number
+    :param ttl_jitter: (optional) Fraction by which TTLs are randomly shortened or lengthened on ``set`` and ``set_many``, so entries written together don't expire together. Defaults to ``0``.
+    :type ttl_jitter: number
+    :param stats: (optional) Reports hits, misses, lock contention and latencies, to a sink (or list of sinks) or through a ``freon.stats.Stats``. Defaults to ``None``, meaning disabled, at no cost.
+    :type stats: None, BaseSink, list of BaseSink or Stats
     :param **kwargs: (optional) Extra arguments, passed to the selected backend.
 
     Usage::
@@ -26,34 +72,69 @@ class Cache(object):
     """
 
     def __init__(self, backend='memory', serializer='json', default_ttl=3600,
-                 custom_encoder=None, custom_decoder=None, **kwargs):
+                 custom_encoder=None, custom_decoder=None, wait_timeout=None,
+                 return_stale=True, stale_while_revalidate=False, refresh_workers=4,
+                 max_refreshes=100, early_refresh_beta=None, ttl_jitter=0, stats=None,
+                 **kwargs):
 
         self.backend = self._load_backend(backend, **kwargs)
         self.serializer = self._load_serializer(serializer, custom_encoder, custom_decoder)
         self.default_ttl = default_ttl
+        self.wait_timeout = wait_timeout
+        self.return_stale = return_stale
+        self.stale_while_revalidate = stale_while_revalidate
+        self.refresh_workers = refresh_workers
+        self.max_refreshes = max_refreshes
+        self.early_refresh_beta = early_refresh_beta
+        self.ttl_jitter = ttl_jitter
+
+        self.stats = stats if stats is None or isinstance(stats, Stats) else Stats(stats)
+        if self.stats is not None:
+            self.backend = InstrumentedBackend(self.backend, self.stats)
+            self.serializer = InstrumentedSerializer(self.serializer, self.stats)
+
+        self.memoized = {}
+
+        # Counts reads for a refresher, once one is started
+        self._reads = None
+
+        self._refreshes = set()
+        self._refreshes_lock = threading.Lock()
+        self._executor = None
 
-    # TODO: configure if don't want to be constructivist and always return what
-    # there is, even if expired
     def get(self, key):
         """
         Retrieves a cached entry by given key.
 
         If the key doesn't exist, ``None`` is returned. If the key exists but
-        is expired, the cached entry is still returned.
+        is expired, the cached entry is still returned, unless
+        ``self.return_stale`` is off.
 
         :param key: Key of cached entry to be retrieved
         :type key: string
         :return: cached object or ``None``
         """
 
-        value, _ = self.backend.get(key)
+        value, expired = self.backend.get(key)
+        return self._entry(key, value, expired)
 
-        if value is None:
-            return None
+    def get_many(self, keys):
+        """
+        Retrieves several cached entries by their keys, in a single backend call.
 
-        return self.serializer.loads(value)
+        Keys that don't exist are left out of the result. Just like with
+        ``get``, expired entries are still returned, unless
+        ``self.return_stale`` is off.
 
-    def set(self, key, value, ttl=None):
+        :param keys: Keys of cached entries to be retrieved
+        :type keys: list of strings
+        :return: dict of cached objects, by key
+        """
+
+        keys = list(keys)
+        return self._entries(keys, self.backend.get_many(keys))
+
+    def set(self, key, value, ttl=None, tags=None):
         """
         Caches an entry by key and by TTL.
 
@@ -78,32 +159,71 @@ class Cache(object):
         :type value: string or callable
         :param ttl: (optional) TTL to be associated with the cached entry. Defaults to ``self.default_ttl``
         :type ttl: integer, callable or ``None``
+        :param tags: (optional) Tags the entry can be invalidated by, with ``invalidate_tags``. They replace the entry's earlier tags, which are kept when ``tags`` is not given. Supported by the ``memory``, ``concurrent_memory``, ``redis`` and ``sharded`` backends.
+        :type tags: list of strings or ``None``
         :return: cached object or ``None``
         """
 
         lock = self.backend.get_lock(key)
 
         if not lock.acquire(False):
+            if self.stats is not None:
+                self.stats.contention(key)
             return None
 
         try:
-            if callable(value):
-                value = value()
-            if callable(ttl):
-                ttl = ttl(value)
-            elif not ttl:
-                ttl = self.default_ttl
-
-            result = self.backend.set(key, self.serializer.dumps(value), ttl)
-            return value if result else None
+            return self._store(key, value, ttl, tags=tags)
         finally:
             lock.release()
 
+    def set_many(self, mapping, ttl=None, tags=None):
+        """
+        Caches several entries, in a single backend call.
+
+        Values can be callables, just like with ``set``. TTL can be an integer
+        or a callable applied to every entry, or a dict holding a TTL (integer
+        or callable) for each key; keys missing from it get ``self.default_ttl``.
+
+        Unlike ``set``, this method doesn't use a lock, since it is meant for
+        warming many entries at once rather than for racing producers.
+
+        :param mapping: Entries to be cached, by key
+        :type mapping: dict
+        :param ttl: (optional) TTL to be associated with the cached entries. Defaults to ``self.default_ttl``
+        :type ttl: integer, callable, dict or ``None``
+        :param tags: (optional) Tags every entry can be invalidated by, like with ``set``
+        :type tags: list of strings or ``None``
+        :return: dict of cached objects, by key, or an empty dict
+        """
+
+        values, items = self._items(mapping, ttl)
+        if tags:
+            result = self.backend.set_many(items, list(tags))
+        else:
+            result = self.backend.set_many(items)
+        return values if result else {}
+
     def get_or_set(self, key, new_value, ttl=None):
         """
         Tries to retrieve a cached entry by key. If the value does not exist,
         it caches the entry by key and TTL.
 
+        If the entry is missing and another thread is already caching it, this
+        waits up to ``self.wait_timeout`` seconds for that thread and returns
+        what it cached, rather than computing the value once more.
+
+        If the entry is expired and ``self.stale_while_revalidate`` is on, the
+        expired entry is returned right away, while a background thread caches
+        the new one. Only one refresh per key runs at a time.
+
+        If ``self.early_refresh_beta`` is set, fresh entries may be treated as
+        expired ahead of time, with a probability that rises as their expiry
+        time nears and with the time it took to compute them.
+
+        On backends supporting leases (like ``redis``), reading the entry and
+        taking the lock happen in a single call, and so do writing the entry
+        and releasing the lock.
+
         :param key: Key of cached entry to be retrieved or under which the entry will be cached
         :type key: string
         :param new_value: The actual entry to be cached
@@ -113,13 +233,179 @@ class Cache(object):
         :return: cached object, newly cached object or ``None``
         """
 
-        value, expired = self.backend.get(key)
+        if self.backend.supports_leases:
+            value, expired, lease = self.backend.get_or_lease(key)
+        else:
+            (value, expired), lease = self.backend.get(key), None
+        # Leasing backends only hand out a lease if nobody else is caching the entry
+        busy = self.backend.supports_leases and lease is None
+        if self.stats is not None:
+            self._record(key, value, expired, busy)
+        if self._reads is not None:
+            self._reads.add(key)
+
+        if value is None:
+            result = None if busy else self._update(key, new_value, ttl, lease)
+            if result is None and self.wait_timeout:
+                return self._wait_for(key)
+            return result
+
+        value, delta, expires_at = self._decode(value)
+        if not expired and self.early_refresh_beta is not None:
+            expired = self._expires_early(delta, expires_at)
+            busy = False
+
+        if not expired:
+            return self._loaded(key, value, expired)
 
-        if value is None or expired:
-            result = self.set(key, new_value, ttl)
-            return result if result else value
+        if busy:
+            return self._loaded(key, value, expired)
 
-        return self.serializer.loads(value)
+        if self.stale_while_revalidate:
+            self.refresh(key, new_value, ttl, lease)
+            return self._loaded(key, value, expired)
+
+        result = self._update(key, new_value, ttl, lease)
+        return result if result is not None else self._loaded(key, value, expired)
+
+    def memoize(self, ttl=None, key_fn=None, namespace=None):
+        """
+        Decorator caching a function's results, by its arguments.
+
+        Keys are made of the function's namespace and a hash of its arguments,
+        bound to its signature so that ``f(1)`` and ``f(x=1)`` share an entry.
+        Only arguments made of ``None``, booleans, numbers, strings, bytes,
+        dataclass instances, lists, tuples, sets and dicts can be hashed;
+        calls with anything else raise a ``TypeError``. ``key_fn``, if given,
+        is called with the arguments instead and returns the part of the key
+        that identifies them. Coroutine functions are
+        supported too, although backend calls still block the event loop; use
+        ``AsyncCache.memoize`` to avoid that.
+
+        The decorated function gets a few extras:
+
+        * ``key(*args, **kwargs)`` returns the key of a call;
+        * ``invalidate(*args, **kwargs)`` deletes the cached result of a call;
+        * ``stats`` holds hit/miss counters and latencies, also available in
+          ``self.memoized`` by namespace.
+
+        :param ttl: (optional) TTL to be associated with cached results. Defaults to ``self.default_ttl``
+        :type ttl: integer, callable or ``None``
+        :param key_fn: (optional) Builds the argument part of keys. Defaults to hashing the arguments.
+        :type key_fn: None or callable
+        :param namespace: (optional) Prefix of the function's keys. Defaults to its module and qualified name.
+        :type namespace: None or string
+        :return: decorator
+
+        Usage::
+
+          >>> @cache.memoize(ttl=60)
+          ... def expensive_operation(foo, bar=None):
+          ...     return foo
+          >>> expensive_operation('baz')
+          'baz'
+          >>> expensive_operation.invalidate('baz')
+          True
+        """
+
+        def decorator(func):
+            return memoize(self, func, ttl, key_fn, namespace)
+        return decorator
+
+    def namespace(self, name, generation_ttl=0):
+        """
+        Returns a cache whose keys live in namespace ``name``, so that all of
+        them can be invalidated at once with ``invalidate_namespace``. It
+        shares this cache's backend and settings.
+
+        Keys are prefixed with the namespace's generation number, which is
+        kept in the backend and read on every call, unless
+        ``generation_ttl`` allows caching it. Invalidating bumps the
+        number; older entries are never read again, and expire or get
+        reaped like any other: ``reap`` and ``start_reaper`` on this cache
+        go through every namespace. ``get_expired`` and ``get_by_ttl`` only
+        return keys of the current generation, without their prefix.
+
+        :param name: Name of the namespace, like ``tenant:42``
+        :type name: string
+        :param generation_ttl: (optional) Seconds the generation number is cached for, in this process. Defaults to ``0``.
+        :type generation_ttl: number
+        :return: namespaced cache
+
+        Usage::
+
+          >>> tenant = cache.namespace('tenant:42')
+          >>> tenant.set('foo', 'bar')
+          'bar'
+          >>> tenant.invalidate_namespace()
+          1
+          >>> tenant.get('foo')
+          None
+        """
+
+        return self._namespaced(NamespacedBackend(self.backend, name, generation_ttl))
+
+    def invalidate_namespace(self, name=None):
+        """
+        Invalidates every entry of a namespace at once, by bumping its
+        generation number in a single atomic operation.
+
+        :param name: (optional) Name of the namespace. Defaults to this cache's, if it is namespaced.
+        :type name: string or ``None``
+        :return: new generation number
+        """
+
+        if name is not None:
+            return self.namespace(name).backend.invalidate()
+        if not isinstance(self.backend, NamespacedBackend):
+            raise ValueError('Cache is not namespaced')
+        return self.backend.invalidate()
+
+    def invalidate_tags(self, tags):
+        """
+        Deletes every entry tagged with any of ``tags``, in a single backend
+        call (a single script, on Redis).
+
+        :param tags: Tags of the entries to be deleted
+        :type tags: list of strings
+        :return: list of deleted keys
+        """
+
+        return self.backend.invalidate_tags(list(tags))
+
+    def refresh(self, key, new_value, ttl=None, lease=None):
+        """
+        Caches an entry by key and TTL in the background, using ``set``.
+
+        Nothing is scheduled if the entry is already being refreshed by this
+        cache, or if ``self.max_refreshes`` refreshes are already pending.
+
+        :param key: Key under which the entry will be cached
+        :type key: string
+        :param new_value: The actual entry to be cached
+        :type new_value: string or callable
+        :param ttl: (optional) TTL to be associated with the cached entry. Defaults to ``self.default_ttl``
+        :type ttl: integer, callable or ``None``
+        :param lease: (optional) Lease on the entry, as handed out by the backend's ``get_or_lease``. It is released if nothing is scheduled.
+        :type lease: string or ``None``
+        :return: ``concurrent.futures.Future`` of the cached object, or ``None`` if nothing was scheduled
+        """
+
+        with self._refreshes_lock:
+            scheduled = key not in self._refreshes and len(self._refreshes) < self.max_refreshes
+            if scheduled:
+                self._refreshes.add(key)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.refresh_workers)
+
+        if not scheduled:
+            if lease is not None:
+                self.backend.release_lease(key, lease)
+            return None
+
+        future = self._executor.submit(self._update, key, new_value, ttl, lease)
+        future.add_done_callback(lambda _: self._refreshed(key))
+        return future
 
     def delete(self, key):
         """
@@ -132,6 +418,17 @@ class Cache(object):
 
         return self.backend.delete(key)
 
+    def delete_many(self, keys):
+        """
+        Deletes several cached entries by their keys, in a single backend call.
+
+        :param keys: Keys of cached entries to be deleted
+        :type keys: list of strings
+        :return: bool
+        """
+
+        return self.backend.delete_many(list(keys))
+
     def exists(self, key):
         """
         Checks whether a cached entry exists by key.
@@ -163,12 +460,253 @@ class Cache(object):
 
         return self.backend.get_by_ttl(ttl)
 
+    def iter_expired(self, batch_size=1000):
+        """
+        Yields expired keys, ordered by expiry time, fetching ``batch_size``
+        of them at a time, so that memory stays bounded and no single backend
+        call takes long, however many keys there are.
+
+        :param batch_size: (optional) Number of keys fetched per backend call. Defaults to ``1000``.
+        :type batch_size: integer
+        :return: iterator of strings
+        """
+
+        return self.backend.iter_expired(batch_size)
+
+    def iter_by_ttl(self, ttl, batch_size=1000):
+        """
+        Yields keys that will expire within the specified threshold, like
+        ``iter_expired``.
+
+        :param ttl: Number of seconds from the current time when yielded keys will expire
+        :type ttl: integer
+        :param batch_size: (optional) Number of keys fetched per backend call. Defaults to ``1000``.
+        :type batch_size: integer
+        :return: iterator of strings
+        """
+
+        return self.backend.iter_by_ttl(ttl, batch_size)
+
+    def reap(self, grace=0, batch_size=100):
+        """
+        Deletes up to ``batch_size`` entries that expired more than ``grace``
+        seconds ago.
+
+        :param grace: (optional) Seconds an entry is kept after it expired. Defaults to ``0``.
+        :type grace: number
+        :param batch_size: (optional) Maximum number of keys to delete. Defaults to ``100``.
+        :type batch_size: integer
+        :return: list of deleted keys
+        """
+
+        return self.backend.reap(grace, batch_size)
+
+    def start_reaper(self, interval=60, grace=0, batch_size=100):
+        """
+        Starts a daemon thread that keeps reaping expired entries in the
+        background. See ``freon.reaper.Reaper``.
+
+        :return: the started ``Reaper``, which can be ``stop()``-ed
+        """
+
+        reaper = Reaper(self.backend, interval, grace, batch_size)
+        reaper.start()
+        return reaper
+
+    def start_refresher(self, loaders, window=60, interval=10, workers=4, max_pending=100,
+                        min_reads=0):
+        """
+        Starts a daemon thread that recomputes entries before they expire,
+        with the given loaders, most read and soonest expiring first. Reads
+        through this cache are counted from now on. See
+        ``freon.refresher.Refresher``.
+
+        Usage::
+
+          >>> refresher = cache.start_refresher({
+          ...     'user:*': load_user,
+          ...     'report:*': Loader(build_report, ttl=300, rate=5),
+          ... }, window=60)
+
+        :return: the started ``Refresher``, which can be ``stop()``-ed
+        """
+
+        refresher = Refresher(self, loaders, window, interval, workers, max_pending, min_reads)
+        self._reads = refresher.reads
+        refresher.start()
+        return refresher
+
+    def _refreshed(self, key):
+        with self._refreshes_lock:
+            self._refreshes.discard(key)
+
+    @contextlib.contextmanager
+    def pipeline(self):
+        """
+        Context manager queuing ``get``, ``get_many``, ``set``, ``set_many``,
+        ``delete``, ``delete_many`` and ``exists`` calls, to be sent to the
+        backend in a single batch (a single round trip, for ``redis``) when
+        the block exits without an error.
+
+        Results are then available, in order, as the pipeline's ``results``.
+        Just like ``set_many``, ``set`` doesn't use a lock in a pipeline.
+
+        Usage::
+
+          >>> with cache.pipeline() as pipeline:
+          ...     pipeline.set('foo', 'bar')
+          ...     pipeline.get('baz')
+          >>> pipeline.results
+          ['bar', None]
+        """
+
+        pipeline = Pipeline(self)
+        yield pipeline
+        pipeline.execute()
+
+    def _namespaced(self, backend):
+        cache = copy.copy(self)
+        cache.backend = backend
+        cache.memoized = {}
+        cache._reads = None
+        cache._refreshes = type(self._refreshes)()
+        cache._refreshes_lock = threading.Lock()
+        return cache
+
+    def _entry(self, key, value, expired):
+        if self.stats is not None:
+            self._record(key, value, expired)
+        if self._reads is not None:
+            self._reads.add(key)
+        if value is None or (expired and not self.return_stale):
+            return None
+
+        return self._load(key, value, expired)
+
+    def _entries(self, keys, entries):
+        result = {}
+        for key, (value, expired) in zip(keys, entries):
+            if self.stats is not None:
+                self._record(key, value, expired)
+            if self._reads is not None:
+                self._reads.add(key)
+            if value is not None and (self.return_stale or not expired):
+                result[key] = self._load(key, value, expired)
+        return result
+
+    def _record(self, key, value, expired, busy=False):
+        if value is None:
+            self.stats.miss(key)
+        elif expired:
+            self.stats.stale_hit(key)
+        else:
+            self.stats.hit(key)
+
+        if busy and (value is None or expired):
+            self.stats.contention(key)
+
+    def _items(self, mapping, ttl):
+        values, items = {}, {}
+        for key, value in mapping.items():
+            key_ttl = ttl.get(key) if isinstance(ttl, dict) else ttl
+
+            value, delta = self._compute(value)
+            key_ttl = self._ttl(key_ttl, value)
+
+            values[key] = value
+            items[key] = (self._dump(value, delta, key_ttl), key_ttl)
+        return values, items
+
+    def _update(self, key, value, ttl, lease):
+        if lease is None:
+            return self.set(key, value, ttl)
+
+        try:
+            return self._store(key, value, ttl, lease)
+        except BaseException:
+            self.backend.release_lease(key, lease)
+            raise
+
+    def _store(self, key, value, ttl, lease=None, tags=None):
+        value, delta = self._compute(value)
+        ttl = self._ttl(ttl, value)
+        value_dump = self._dump(value, delta, ttl)
+
+        if tags:
+            result = self.backend.set(key, value_dump, ttl, list(tags))
+        elif lease is None:
+            result = self.backend.set(key, value_dump, ttl)
+        else:
+            # Whoever took the lease over, if it expired meanwhile, caches
+            # their own value; this one is still good to return
+            self.backend.set_with_lease(key, value_dump, ttl, lease)
+            return value
+        return value if result else None
+
+    def _compute(self, value):
+        if not callable(value):
+            return value, 0
+
+        start = time.time()
+        value = value()
+        return value, time.time() - start
+
+    def _ttl(self, ttl, value):
+        if callable(ttl):
+            ttl = ttl(value)
+        elif not ttl:
+            ttl = self.default_ttl
+
+        if self.ttl_jitter:
+            ttl = int(round(ttl * (1 + random.uniform(-self.ttl_jitter, self.ttl_jitter))))
+        return ttl
+
+    def _dump(self, value, delta, ttl):
+        if self.early_refresh_beta is None:
+            return self.serializer.dumps(value)
+        return self.serializer.dumps([XFETCH_MARKER, value, delta, time.time() + ttl])
+
+    def _decode(self, value):
+        value = self.serializer.loads(value)
+        if isinstance(value, list) and len(value) == 4 and value[0] == XFETCH_MARKER:
+            return tuple(value[1:])
+        return value, None, None
+
+    def _expires_early(self, delta, expires_at):
+        if expires_at is None:
+            # Stored without XFetch
+            return False
+        # XFetch: -log(u) for a uniform u in (0, 1] is exponentially distributed
+        gap = -delta * self.early_refresh_beta * math.log(1 - random.random())
+        return time.time() + gap >= expires_at
+
+    def _load(self, key, value, expired):
+        return self._loaded(key, self._decode(value)[0], expired)
+
+    def _loaded(self, key, value, expired):
+        return value
+
+    def _wait_for(self, key):
+        lock = self.backend.get_lock(key)
+
+        if not lock.acquire(blocking=True, blocking_timeout=self.wait_timeout):
+            return None
+        lock.release()
+
+        return self.get(key)
+
     def _load_backend(self, name, **config):
         module = import_module("freon.backends.%s" % name)
-        backend_cls = getattr(module, "%sBackend" % name.capitalize())
+        backend_cls = getattr(module, "%sBackend" % class_name(name))
         return backend_cls(**config)
 
     def _load_serializer(self, name, *config):
+        if isinstance(name, BaseSerializer):
+            return name
+        if '+' in name:
+            name, compression = name.split('+', 1)
+            return CompressedSerializer(self._load_serializer(name, *config), compression)
+
         module = import_module("freon.serializers.%s" % name)
-        serializer_cls = getattr(module, "%sSerializer" % name.capitalize())
+        serializer_cls = getattr(module, "%sSerializer" % class_name(name))
         return serializer_cls(*config)
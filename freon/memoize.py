@@ -0,0 +1,190 @@
+import dataclasses
+import functools
+import hashlib
+import inspect
+import threading
+import time
+
+
+class MemoizeStats(object):
+    """
+    Hit/miss counters and latencies of a memoized function.
+
+    ``hit_time`` and ``miss_time`` are the total seconds spent in calls that
+    were served from the cache, respectively computed.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_time += seconds
+            else:
+                self.misses += 1
+                self.miss_time += seconds
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return float(self.hits) / calls if calls else 0.0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_time': self.hit_time,
+            'miss_time': self.miss_time,
+            'hit_rate': self.hit_rate,
+        }
+
+
+def function_namespace(func):
+    return '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+
+
+# Types whose ``repr`` is the same in every process
+STABLE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+def normalize(value):
+    """
+    Turns a value into one whose ``repr`` doesn't depend on insertion order,
+    hash randomization or memory addresses, so that keys are stable across
+    processes.
+
+    Only ``None``, booleans, numbers, strings, bytes, dataclass instances
+    and lists, tuples, sets and dicts of those are supported.
+
+    :raises TypeError: if ``value`` holds anything else
+    """
+
+    if isinstance(value, STABLE_TYPES):
+        return value
+    if isinstance(value, dict):
+        return ('dict', sorted(((normalize(k), normalize(v)) for k, v in value.items()), key=repr))
+    if isinstance(value, (set, frozenset)):
+        return ('set', sorted((normalize(item) for item in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, [normalize(item) for item in value])
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return (function_namespace(type(value)),
+                [(field.name, normalize(getattr(value, field.name)))
+                 for field in dataclasses.fields(value)])
+    raise TypeError("Can't build a stable key from a %s argument; pass a key_fn instead"
+                    % type(value).__name__)
+
+
+def make_key(namespace, signature, args, kwargs, key_fn=None):
+    if key_fn is not None:
+        return 'freon:memoize:%s:%s' % (namespace, key_fn(*args, **kwargs))
+
+    if signature is not None:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        args, kwargs = bound.args, bound.kwargs
+
+    payload = repr(normalize((args, kwargs)))
+    digest = hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    return 'freon:memoize:%s:%s' % (namespace, digest)
+
+
+def memoize(cache, func, ttl=None, key_fn=None, namespace=None):
+    """
+    Wraps ``func`` so that its results are cached in ``cache``, by arguments.
+
+    See ``Cache.memoize``.
+    """
+
+    namespace = namespace or function_namespace(func)
+    stats = cache.memoized.setdefault(namespace, MemoizeStats())
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        signature = None
+
+    def key(*args, **kwargs):
+        return make_key(namespace, signature, args, kwargs, key_fn)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.time()
+            cache_key = key(*args, **kwargs)
+
+            value, expired = cache.backend.get(cache_key)
+            if value is not None and not expired:
+                value = cache._load(cache_key, value, expired)
+                stats.record(True, time.time() - start)
+                return value
+
+            value = await func(*args, **kwargs)
+            cache.set(cache_key, value, ttl)
+            stats.record(False, time.time() - start)
+            return value
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            computed = []
+
+            def compute():
+                computed.append(True)
+                return func(*args, **kwargs)
+
+            value = cache.get_or_set(key(*args, **kwargs), compute, ttl)
+            if value is None and not computed:
+                # Someone else is computing it and there's nothing to serve
+                value = compute()
+            stats.record(not computed, time.time() - start)
+            return value
+
+    wrapper.key = key
+    wrapper.invalidate = lambda *args, **kwargs: cache.delete(key(*args, **kwargs))
+    wrapper.stats = stats
+    return wrapper
+
+
+def memoize_async(cache, func, ttl=None, key_fn=None, namespace=None):
+    """
+    Same as ``memoize``, for ``AsyncCache``. The returned wrapper is always a
+    coroutine function, and ``func`` may be a regular or a coroutine function.
+    """
+
+    namespace = namespace or function_namespace(func)
+    stats = cache.memoized.setdefault(namespace, MemoizeStats())
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        signature = None
+
+    def key(*args, **kwargs):
+        return make_key(namespace, signature, args, kwargs, key_fn)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.time()
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return func(*args, **kwargs)
+
+        value = await cache.get_or_set(key(*args, **kwargs), compute, ttl)
+        if value is None and not computed:
+            value = compute()
+            if inspect.isawaitable(value):
+                value = await value
+        stats.record(not computed, time.time() - start)
+        return value
+
+    wrapper.key = key
+    wrapper.invalidate = lambda *args, **kwargs: cache.delete(key(*args, **kwargs))
+    wrapper.stats = stats
+    return wrapper
@@ -0,0 +1,309 @@
+import copy
+import time
+
+
+def generation_key(name):
+    return 'freon:generation:%s' % name
+
+
+def key_prefix(name, generation):
+    return 'freon:ns:%s#%d:' % (name, generation)
+
+
+def strip_keys(prefix, keys, with_scores=False):
+    """
+    Returns the keys starting with ``prefix``, without it. Keys of other
+    generations are left out.
+    """
+
+    if with_scores:
+        return [(key[len(prefix):], score) for key, score in keys if key.startswith(prefix)]
+    return [key[len(prefix):] for key in keys if key.startswith(prefix)]
+
+
+def strip_item(prefix, item, with_scores=False):
+    """
+    Returns a key (or ``(key, score)`` item) without ``prefix``, or ``None``
+    if it belongs to another generation.
+    """
+
+    key = item[0] if with_scores else item
+    if not key.startswith(prefix):
+        return None
+    return (key[len(prefix):], item[1]) if with_scores else key[len(prefix):]
+
+
+class NamespacedBackend(object):
+    """
+    Backend view prefixing keys with a namespace and its generation number.
+
+    The generation is a counter in the backend; bumping it (``invalidate``)
+    makes every entry of the namespace unreachable at once. Stale
+    generations are never read again; they expire, and are reaped, like any
+    other entry.
+
+    Expiry times are kept in a sorted set (or index) of the namespace's own,
+    ``<ttl_key>:<name>``, on backends that support it (``redis``,
+    ``sharded`` and ``memory``), so expiry queries only go through the
+    namespace's keys. ``reap`` deletes expired entries of every generation,
+    and returns their full keys; reaping the parent backend goes through
+    every namespace too. On ``memory``, namespaces share the parent's store,
+    so ``max_entries`` and ``max_bytes`` bound all of them together. The
+    backend must support counters, which ``shared_memory`` doesn't.
+
+    Tags are scoped to the namespace too (``<name>:<tag>``), so that
+    ``invalidate_tags`` leaves other namespaces' entries alone. It returns
+    full keys, like ``reap``.
+
+    :param backend: Backend holding the entries and the generation counter
+    :type backend: BaseBackend
+    :param name: Name of the namespace
+    :type name: string
+    :param generation_ttl: (optional) Seconds the generation number is cached for, in the current process. Invalidations from other processes may take that long to be seen. Defaults to ``0``, meaning it is read on every call.
+    :type generation_ttl: number
+    """
+
+    def __init__(self, backend, name, generation_ttl=0):
+        self.backend = backend
+        self.name = name
+        self.generation_key = generation_key(name)
+        self.generation_ttl = generation_ttl
+        self.entries = backend.with_ttl_key('%s:%s' % (backend.ttl_key, name))
+        self._generation = None
+        self._read_at = 0
+
+    def generation(self):
+        if self._generation is None or time.time() - self._read_at >= self.generation_ttl:
+            self._generation = self.backend.get_counter(self.generation_key)
+            self._read_at = time.time()
+        return self._generation
+
+    def invalidate(self):
+        """
+        Bumps the generation number, in a single atomic operation.
+
+        :return: new generation number
+        """
+
+        self._generation = self.backend.incr(self.generation_key)
+        self._read_at = time.time()
+        return self._generation
+
+    def get_lock(self, key):
+        return self.entries.get_lock(self._key(key))
+
+    def get(self, key):
+        return self.entries.get(self._key(key))
+
+    def get_many(self, keys):
+        prefix = self._prefix()
+        return self.entries.get_many([prefix + key for key in keys])
+
+    def get_or_lease(self, key):
+        return self.entries.get_or_lease(self._key(key))
+
+    def set(self, key, value, ttl, tags=None):
+        if tags:
+            return self.entries.set(self._key(key), value, ttl, self._tags(tags))
+        return self.entries.set(self._key(key), value, ttl)
+
+    def set_many(self, items, tags=None):
+        prefix = self._prefix()
+        items = dict((prefix + key, item) for key, item in items.items())
+        if tags:
+            return self.entries.set_many(items, self._tags(tags))
+        return self.entries.set_many(items)
+
+    def set_with_lease(self, key, value, ttl, lease):
+        return self.entries.set_with_lease(self._key(key), value, ttl, lease)
+
+    def release_lease(self, key, lease):
+        return self.entries.release_lease(self._key(key), lease)
+
+    def delete(self, key):
+        return self.entries.delete(self._key(key))
+
+    def delete_many(self, keys):
+        prefix = self._prefix()
+        return self.entries.delete_many([prefix + key for key in keys])
+
+    def exists(self, key):
+        return self.entries.exists(self._key(key))
+
+    def get_expired(self, with_scores=False):
+        keys = self.entries.get_expired(with_scores=True) if with_scores else \
+            self.entries.get_expired()
+        return strip_keys(self._prefix(), keys, with_scores)
+
+    def get_by_ttl(self, ttl, with_scores=False):
+        keys = self.entries.get_by_ttl(ttl, with_scores=True) if with_scores else \
+            self.entries.get_by_ttl(ttl)
+        return strip_keys(self._prefix(), keys, with_scores)
+
+    def iter_expired(self, batch_size=1000, with_scores=False):
+        items = self.entries.iter_expired(batch_size, with_scores=True) if with_scores else \
+            self.entries.iter_expired(batch_size)
+        return self._strip_iter(items, with_scores)
+
+    def iter_by_ttl(self, ttl, batch_size=1000, with_scores=False):
+        items = self.entries.iter_by_ttl(ttl, batch_size, with_scores=True) if with_scores else \
+            self.entries.iter_by_ttl(ttl, batch_size)
+        return self._strip_iter(items, with_scores)
+
+    def reap(self, grace=0, limit=100):
+        return self.entries.reap(grace, limit)
+
+    def invalidate_tags(self, tags):
+        return self.entries.invalidate_tags(self._tags(tags))
+
+    def pipeline(self):
+        """
+        Returns a view queuing calls on the backend's pipeline, with the
+        generation number read once, now.
+        """
+
+        view = copy.copy(self)
+        view.entries = self.entries.pipeline()
+        view._generation, view._read_at = self.generation(), float('inf')
+        return view
+
+    def _prefix(self):
+        return key_prefix(self.name, self.generation())
+
+    def _key(self, key):
+        return self._prefix() + key
+
+    def _tags(self, tags):
+        return ['%s:%s' % (self.name, tag) for tag in tags]
+
+    def _strip_iter(self, items, with_scores):
+        prefix = self._prefix()
+        for item in items:
+            item = strip_item(prefix, item, with_scores)
+            if item is not None:
+                yield item
+
+    def __getattr__(self, name):
+        if name == 'entries':
+            # Not set yet, while being copied
+            raise AttributeError(name)
+        return getattr(self.entries, name)
+
+
+class AsyncNamespacedLock(object):
+    """
+    Lock on a key of an ``AsyncNamespacedBackend``, resolved to the key of
+    the current generation when acquired.
+    """
+
+    def __init__(self, backend, key):
+        self.backend = backend
+        self.key = key
+        self.lock = None
+
+    async def acquire(self, blocking=True, blocking_timeout=None):
+        self.lock = self.backend.entries.get_lock(await self.backend._key(self.key))
+        return await self.lock.acquire(blocking=blocking, blocking_timeout=blocking_timeout)
+
+    async def release(self):
+        return await self.lock.release()
+
+
+class AsyncNamespacedBackend(NamespacedBackend):
+    """
+    Same as ``NamespacedBackend``, for asyncio backends.
+    """
+
+    async def generation(self):
+        if self._generation is None or time.time() - self._read_at >= self.generation_ttl:
+            self._generation = await self.backend.get_counter(self.generation_key)
+            self._read_at = time.time()
+        return self._generation
+
+    async def invalidate(self):
+        self._generation = await self.backend.incr(self.generation_key)
+        self._read_at = time.time()
+        return self._generation
+
+    def get_lock(self, key):
+        return AsyncNamespacedLock(self, key)
+
+    async def get(self, key):
+        return await self.entries.get(await self._key(key))
+
+    async def get_many(self, keys):
+        prefix = await self._prefix()
+        return await self.entries.get_many([prefix + key for key in keys])
+
+    async def get_or_lease(self, key):
+        return await self.entries.get_or_lease(await self._key(key))
+
+    async def set(self, key, value, ttl, tags=None):
+        if tags:
+            return await self.entries.set(await self._key(key), value, ttl, self._tags(tags))
+        return await self.entries.set(await self._key(key), value, ttl)
+
+    async def set_many(self, items, tags=None):
+        prefix = await self._prefix()
+        items = dict((prefix + key, item) for key, item in items.items())
+        if tags:
+            return await self.entries.set_many(items, self._tags(tags))
+        return await self.entries.set_many(items)
+
+    async def set_with_lease(self, key, value, ttl, lease):
+        return await self.entries.set_with_lease(await self._key(key), value, ttl, lease)
+
+    async def release_lease(self, key, lease):
+        return await self.entries.release_lease(await self._key(key), lease)
+
+    async def delete(self, key):
+        return await self.entries.delete(await self._key(key))
+
+    async def delete_many(self, keys):
+        prefix = await self._prefix()
+        return await self.entries.delete_many([prefix + key for key in keys])
+
+    async def exists(self, key):
+        return await self.entries.exists(await self._key(key))
+
+    async def get_expired(self, with_scores=False):
+        keys = await (self.entries.get_expired(with_scores=True) if with_scores else
+                      self.entries.get_expired())
+        return strip_keys(await self._prefix(), keys, with_scores)
+
+    async def get_by_ttl(self, ttl, with_scores=False):
+        keys = await (self.entries.get_by_ttl(ttl, with_scores=True) if with_scores else
+                      self.entries.get_by_ttl(ttl))
+        return strip_keys(await self._prefix(), keys, with_scores)
+
+    async def reap(self, grace=0, limit=100):
+        return await self.entries.reap(grace, limit)
+
+    async def invalidate_tags(self, tags):
+        return await self.entries.invalidate_tags(self._tags(tags))
+
+    async def pipeline(self):
+        """
+        Returns a view queuing calls on the backend's pipeline, with the
+        generation number read once, now; must be awaited, unlike on other
+        backends. Queued calls are those of the backend's pipeline, to be
+        awaited when they are coroutines.
+        """
+
+        view = NamespacedBackend(self.backend, self.name, self.generation_ttl)
+        view.entries = self.entries.pipeline()
+        view._generation, view._read_at = await self.generation(), float('inf')
+        return view
+
+    async def _prefix(self):
+        return key_prefix(self.name, await self.generation())
+
+    async def _key(self, key):
+        return await self._prefix() + key
+
+    async def _strip_iter(self, items, with_scores):
+        prefix = await self._prefix()
+        async for item in items:
+            item = strip_item(prefix, item, with_scores)
+            if item is not None:
+                yield item
@@ -0,0 +1,145 @@
+import inspect
+
+
+class Pipeline(object):
+    """
+    Queues cache operations, sending them to the backend in a single batch
+    on ``execute``. See ``Cache.pipeline``.
+
+    Values and TTLs are computed and serialized as soon as operations are
+    queued; results are deserialized on ``execute``.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.backend = cache.backend.pipeline()
+        self.callbacks = []
+        self.results = None
+
+    def get(self, key):
+        self.backend.get(key)
+        self.callbacks.append(lambda entry: self.cache._entry(key, *entry))
+
+    def get_many(self, keys):
+        keys = list(keys)
+        self.backend.get_many(keys)
+        self.callbacks.append(lambda entries: self.cache._entries(keys, entries))
+
+    def set(self, key, value, ttl=None):
+        values, items = self.cache._items({key: value}, ttl)
+        self.backend.set(key, *items[key])
+        self.callbacks.append(lambda result: values[key] if result else None)
+
+    def set_many(self, mapping, ttl=None):
+        values, items = self.cache._items(mapping, ttl)
+        self.backend.set_many(items)
+        self.callbacks.append(lambda result: values if result else {})
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self.callbacks.append(lambda result: result)
+
+    def delete_many(self, keys):
+        self.backend.delete_many(list(keys))
+        self.callbacks.append(lambda result: result)
+
+    def exists(self, key):
+        self.backend.exists(key)
+        self.callbacks.append(lambda result: result)
+
+    def execute(self):
+        """
+        Sends all queued operations to the backend.
+
+        :return: list of results, in the order operations were queued
+        """
+
+        callbacks, self.callbacks = self.callbacks, []
+        responses = self.backend.execute()
+        self.results = [callback(response) for callback, response in zip(callbacks, responses)]
+        return self.results
+
+
+async def queue(result):
+    # Calls on asyncio backends' pipelines are coroutines, which queue when awaited
+    if inspect.isawaitable(result):
+        await result
+
+
+class AsyncPipeline(object):
+    """
+    Same as ``Pipeline``, for an ``AsyncCache``. See ``AsyncCache.pipeline``.
+
+    Operations are queued on the backend on ``execute``, once their values
+    and TTLs, which may be awaitables, are computed.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.backend = None
+        self.operations = []
+        self.callbacks = []
+        self.results = None
+
+    def get(self, key):
+        self.operations.append((self._get, (key,)))
+
+    def get_many(self, keys):
+        self.operations.append((self._get_many, (list(keys),)))
+
+    def set(self, key, value, ttl=None):
+        self.operations.append((self._set, (key, value, ttl)))
+
+    def set_many(self, mapping, ttl=None):
+        self.operations.append((self._set_many, (dict(mapping), ttl)))
+
+    def delete(self, key):
+        self.operations.append((self._call, ('delete', key)))
+
+    def delete_many(self, keys):
+        self.operations.append((self._call, ('delete_many', list(keys))))
+
+    def exists(self, key):
+        self.operations.append((self._call, ('exists', key)))
+
+    async def execute(self):
+        """
+        Sends all queued operations to the backend.
+
+        :return: list of results, in the order operations were queued
+        """
+
+        operations, self.operations = self.operations, []
+        self.backend = self.cache.backend.pipeline()
+        if inspect.isawaitable(self.backend):
+            # Namespaced backends read their generation first
+            self.backend = await self.backend
+        for operation, args in operations:
+            await operation(*args)
+
+        callbacks, self.callbacks = self.callbacks, []
+        responses = await self.backend.execute()
+        self.results = [callback(response) for callback, response in zip(callbacks, responses)]
+        return self.results
+
+    async def _get(self, key):
+        await queue(self.backend.get(key))
+        self.callbacks.append(lambda entry: self.cache._entry(key, *entry))
+
+    async def _get_many(self, keys):
+        await queue(self.backend.get_many(keys))
+        self.callbacks.append(lambda entries: self.cache._entries(keys, entries))
+
+    async def _set(self, key, value, ttl):
+        values, items = await self.cache._items({key: value}, ttl)
+        await queue(self.backend.set(key, *items[key]))
+        self.callbacks.append(lambda result: values[key] if result else None)
+
+    async def _set_many(self, mapping, ttl):
+        values, items = await self.cache._items(mapping, ttl)
+        await queue(self.backend.set_many(items))
+        self.callbacks.append(lambda result: values if result else {})
+
+    async def _call(self, name, *args):
+        await queue(getattr(self.backend, name)(*args))
+        self.callbacks.append(lambda result: result)
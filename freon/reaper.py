@@ -0,0 +1,53 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Reaper(threading.Thread):
+    """
+    Daemon thread deleting entries that expired more than ``grace`` seconds
+    ago, in batches of at most ``batch_size`` keys.
+
+    Full batches are followed right away by the next one, so that a backlog
+    is worked through in short steps; otherwise the reaper sleeps for
+    ``interval`` seconds. Errors, like lost connections, are logged and
+    counted in ``failed``, and the reaper tries again ``interval`` seconds
+    later.
+
+    :param backend: Backend to be reaped
+    :type backend: BaseBackend
+    :param interval: (optional) Seconds to sleep between runs. Defaults to ``60``.
+    :type interval: number
+    :param grace: (optional) Seconds an entry is kept after it expired. Defaults to ``0``.
+    :type grace: number
+    :param batch_size: (optional) Maximum number of keys deleted at once. Defaults to ``100``.
+    :type batch_size: integer
+    """
+
+    def __init__(self, backend, interval=60, grace=0, batch_size=100):
+        super(Reaper, self).__init__(name='freon-reaper')
+        self.daemon = True
+        self.backend = backend
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = batch_size
+        self.reaped = 0
+        self.failed = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        delay = 0
+        while not self._stopped.wait(delay):
+            try:
+                keys = self.backend.reap(self.grace, self.batch_size)
+            except Exception:
+                logger.exception('Failed to reap expired entries')
+                self.failed += 1
+                delay = self.interval
+                continue
+            self.reaped += len(keys)
+            delay = 0 if len(keys) >= self.batch_size else self.interval
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,358 @@
+import asyncio
+import collections
+import fnmatch
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AccessCounter(object):
+    """
+    Counts reads of a cache, by key. Counts are halved on every ``decay``,
+    so they favour recent reads, and keys that aren't read anymore are
+    dropped.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def decay(self):
+        """
+        Halves every count.
+
+        :return: counts before decaying
+        """
+
+        with self._lock:
+            counts = self.counts
+            self.counts = collections.Counter(
+                dict((key, count // 2) for key, count in counts.items() if count > 1))
+        return counts
+
+
+class Loader(object):
+    """
+    Computes values of keys for a ``Refresher``.
+
+    :param function: Called with a key, returns its value
+    :type function: callable
+    :param ttl: (optional) TTL of refreshed entries, like with ``Cache.set``. Defaults to the cache's ``default_ttl``.
+    :type ttl: integer, callable or ``None``
+    :param rate: (optional) Maximum number of refreshes per second, with bursts of as many. Defaults to ``None``, meaning unlimited.
+    :type rate: number or ``None``
+    """
+
+    def __init__(self, function, ttl=None, rate=None):
+        self.function = function
+        self.ttl = ttl
+        self.rate = rate
+        self._tokens = rate
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token from the loader's bucket.
+
+        :return: whether a refresh is allowed now
+        """
+
+        if self.rate is None:
+            return True
+
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class BaseRefresher(object):
+    """
+    Keeps the loaders of a refresher, and ranks the entries due for a
+    refresh. See ``Refresher``.
+    """
+
+    def __init__(self, cache, loaders=None, window=60, interval=10, max_pending=100,
+                 min_reads=0, batch_size=1000, **kwargs):
+        super(BaseRefresher, self).__init__(**kwargs)
+        self.cache = cache
+        self.window = window
+        self.interval = interval
+        self.max_pending = max_pending
+        self.min_reads = min_reads
+        self.batch_size = batch_size
+        self.loaders = []
+        for pattern, loader in (loaders or {}).items():
+            self.loaders.append((pattern, loader if isinstance(loader, Loader) else
+                                 Loader(loader)))
+        self.reads = AccessCounter()
+        self.pending = set()
+        self.refreshed = 0
+        self.failed = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def register(self, pattern, function, ttl=None, rate=None):
+        """
+        Registers a loader for the keys matching ``pattern``, after the
+        existing ones. See ``Loader``.
+
+        :return: the registered ``Loader``
+        """
+
+        loader = Loader(function, ttl, rate)
+        self.loaders.append((pattern, loader))
+        return loader
+
+    def loader_for(self, key):
+        for pattern, loader in self.loaders:
+            if fnmatch.fnmatchcase(key, pattern):
+                return loader
+        return None
+
+    def _capacity(self):
+        with self._lock:
+            return self.max_pending - len(self.pending)
+
+    def _rank(self, due, capacity, reads, now, key, expires_at):
+        # Keeps the ``capacity`` most urgent entries in the ``due`` heap
+        count = reads.get(key, 0)
+        if count < self.min_reads or key in self.pending:
+            return
+        loader = self.loader_for(key)
+        if loader is None:
+            return
+
+        urgency = (count + 1) / (max(expires_at - now, 0) + 1)
+        if len(due) < capacity:
+            heapq.heappush(due, (urgency, key, loader))
+        elif urgency > due[0][0]:
+            heapq.heapreplace(due, (urgency, key, loader))
+
+    def _select(self, due):
+        # Most urgent first, leaving throttled loaders out
+        selected = []
+        for _, key, loader in sorted(due, key=lambda item: item[0], reverse=True):
+            if not loader.acquire():
+                with self._lock:
+                    self.throttled += 1
+                continue
+            with self._lock:
+                self.pending.add(key)
+            selected.append((key, loader))
+        return selected
+
+    def _failed(self, key):
+        logger.exception('Failed to refresh %s', key)
+        with self._lock:
+            self.failed += 1
+
+    def _refreshed(self, value):
+        with self._lock:
+            if value is not None:
+                self.refreshed += 1
+
+    def _done(self, key):
+        with self._lock:
+            self.pending.discard(key)
+
+
+class Refresher(BaseRefresher, threading.Thread):
+    """
+    Daemon thread recomputing entries before they expire (refresh-ahead),
+    so that readers of hot keys never find them expired.
+
+    Every ``interval`` seconds, keys expiring within ``window`` seconds are
+    streamed from the backend (see ``Cache.iter_by_ttl``). Those matching a
+    registered loader are ranked by how often they were read through the
+    cache since the previous run, and by how soon they expire, and the top
+    ones are recomputed on a pool of ``workers`` threads.
+
+    Refreshes go through ``Cache.set``, so they take the entry's lock like
+    any other write: an entry already being computed elsewhere is left
+    alone. Every loader can be rate limited.
+
+    Reads are counted by the cache the refresher was started on, with
+    ``Cache.start_refresher``, in the current process only. A refresher
+    running where the cache isn't read should keep ``min_reads`` at ``0``.
+    Errors, like lost connections or failing loaders, are logged, and the
+    next run goes ahead as planned.
+
+    :param cache: Cache whose entries are refreshed
+    :type cache: Cache
+    :param loaders: (optional) Loaders by glob-style key pattern, like ``user:*:profile``: functions called with a key and returning its value, or ``Loader``-s, for a TTL or a rate limit. The first pattern matching a key wins.
+    :type loaders: dict
+    :param window: (optional) Seconds before expiry entries become due for a refresh. Defaults to ``60``.
+    :type window: number
+    :param interval: (optional) Seconds to sleep between runs. Defaults to ``10``.
+    :type interval: number
+    :param workers: (optional) Number of threads computing values. Defaults to ``4``.
+    :type workers: integer
+    :param max_pending: (optional) Maximum number of refreshes running or queued at once. Defaults to ``100``.
+    :type max_pending: integer
+    :param min_reads: (optional) Reads since the previous run (halved every run) an entry needs to be refreshed. Defaults to ``0``.
+    :type min_reads: integer
+    :param batch_size: (optional) Number of keys fetched per backend call. Defaults to ``1000``.
+    :type batch_size: integer
+    """
+
+    def __init__(self, cache, loaders=None, window=60, interval=10, workers=4, max_pending=100,
+                 min_reads=0, batch_size=1000):
+        super(Refresher, self).__init__(cache, loaders, window, interval, max_pending, min_reads,
+                                        batch_size, name='freon-refresher')
+        self.daemon = True
+        self._executor = ThreadPoolExecutor(workers)
+        self._stopped = threading.Event()
+
+    def run(self):
+        delay = 0
+        while not self._stopped.wait(delay):
+            try:
+                self.schedule()
+            except Exception:
+                logger.exception('Failed to schedule refreshes')
+            delay = self.interval
+        self._executor.shutdown(wait=False)
+
+    def stop(self):
+        self._stopped.set()
+
+    def schedule(self):
+        """
+        Schedules refreshes of the entries due, most urgent first, up to
+        ``max_pending`` of them.
+
+        Urgency grows with reads and shrinks with the time left: an entry
+        read 10 times and expiring in 20 seconds goes before one read 10
+        times and expiring in 40, or read 4 times and expiring in 10.
+
+        :return: list of the scheduled keys
+        """
+
+        reads = self.reads.decay()
+        capacity = self._capacity()
+        if capacity <= 0 or not self.loaders:
+            return []
+
+        now, due = time.time(), []
+        for key, expires_at in self.cache.backend.iter_by_ttl(self.window, self.batch_size,
+                                                              with_scores=True):
+            self._rank(due, capacity, reads, now, key, expires_at)
+
+        scheduled = []
+        for key, loader in self._select(due):
+            future = self._executor.submit(self._refresh, key, loader)
+            future.add_done_callback(lambda _, key=key: self._done(key))
+            scheduled.append(key)
+        return scheduled
+
+    def _refresh(self, key, loader):
+        try:
+            value = self.cache.set(key, lambda: loader.function(key), loader.ttl)
+        except Exception:
+            self._failed(key)
+            return None
+        self._refreshed(value)
+        return value
+
+
+class AsyncRefresher(BaseRefresher):
+    """
+    Same as ``Refresher``, for an ``AsyncCache``: runs as a task of the event
+    loop, and recomputes entries on tasks too, ``workers`` of them at most at
+    once. Loaders may return awaitables.
+
+    See ``AsyncCache.start_refresher``.
+    """
+
+    def __init__(self, cache, loaders=None, window=60, interval=10, workers=4, max_pending=100,
+                 min_reads=0, batch_size=1000):
+        super(AsyncRefresher, self).__init__(cache, loaders, window, interval, max_pending,
+                                             min_reads, batch_size)
+        self.workers = workers
+        self.task = None
+        # Refresh tasks; the event loop only keeps weak references to them
+        self._tasks = set()
+        self._semaphore = None
+
+    def start(self):
+        """
+        Starts the refresher's task on the running event loop.
+
+        :return: the started ``asyncio.Task``
+        """
+
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    async def run(self):
+        while True:
+            try:
+                await self.schedule()
+            except Exception:
+                logger.exception('Failed to schedule refreshes')
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        """
+        Cancels the refresher's task. Refreshes already scheduled go on.
+        """
+
+        if self.task is not None:
+            self.task.cancel()
+
+    async def schedule(self):
+        """
+        Schedules refreshes of the entries due. See ``Refresher.schedule``.
+
+        :return: list of the scheduled keys
+        """
+
+        if self._semaphore is None:
+            # Made on the event loop the refresher runs on
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        reads = self.reads.decay()
+        capacity = self._capacity()
+        if capacity <= 0 or not self.loaders:
+            return []
+
+        now, due = time.time(), []
+        async for key, expires_at in self.cache.backend.iter_by_ttl(
+                self.window, self.batch_size, with_scores=True):
+            self._rank(due, capacity, reads, now, key, expires_at)
+
+        scheduled = []
+        for key, loader in self._select(due):
+            task = asyncio.ensure_future(self._refresh(key, loader))
+            self._tasks.add(task)
+            task.add_done_callback(lambda task, key=key: self._done(key, task))
+            scheduled.append(key)
+        return scheduled
+
+    async def _refresh(self, key, loader):
+        async with self._semaphore:
+            try:
+                value = await self.cache.set(key, lambda: loader.function(key), loader.ttl)
+            except Exception:
+                self._failed(key)
+                return None
+        self._refreshed(value)
+        return value
+
+    def _done(self, key, task=None):
+        self._tasks.discard(task)
+        super(AsyncRefresher, self)._done(key)
@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+import zlib
+
+from freon.serializers.base import BaseSerializer
+
+
+# Never the first byte of a msgpack, pickle or UTF-8 encoded JSON payload
+MARKER = b'\xc1'
+
+
+class ZlibCompressor(object):
+    id = 1
+
+    def __init__(self, level=6, dictionary=None):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Compressor(object):
+    id = 2
+
+    def __init__(self, level=0, dictionary=None):
+        import lz4.frame
+        self.lz4 = lz4.frame
+        self.level = level
+
+    def compress(self, data):
+        return self.lz4.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return self.lz4.decompress(data)
+
+
+class ZstdCompressor(object):
+    id = 3
+
+    def __init__(self, level=3, dictionary=None):
+        import zstandard
+        if isinstance(dictionary, bytes):
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+        self.level = level
+        self.compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        self.decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+
+COMPRESSORS = {
+    'zlib': ZlibCompressor,
+    'lz4': Lz4Compressor,
+    'zstd': ZstdCompressor,
+}
+
+
+class CompressedSerializer(BaseSerializer):
+    """
+    Wraps a serializer, compressing its payloads above a size threshold
+
+    Compressed payloads are prefixed with a marker byte and the id of the
+    algorithm used, so entries written uncompressed (including those written
+    before compression was turned on) or with another algorithm still decode.
+    ``lz4`` and ``zstd`` require the ``lz4`` and ``zstandard`` packages.
+
+    :param serializer: Serializer whose payloads are compressed
+    :type serializer: BaseSerializer
+    :param compression: (optional) Algorithm used. Can be one of ``zlib``, ``lz4`` or ``zstd``. Defaults to ``zlib``.
+    :type compression: string
+    :param threshold: (optional) Payloads smaller than this many bytes are left uncompressed. Defaults to ``1024``.
+    :type threshold: integer
+    :param level: (optional) Compression level. Defaults to the algorithm's own default.
+    :type level: None or integer
+    :param dictionary: (optional) Trained dictionary, for ``zstd`` only. See ``train_dictionary``.
+    :type dictionary: None or bytes
+
+    Usage::
+
+      >>> from freon.serializers.compressed import CompressedSerializer
+      >>> from freon.serializers.msgpack import MsgpackSerializer
+      >>> cache = Cache(serializer=CompressedSerializer(MsgpackSerializer(), 'zstd'))
+    """
+
+    def __init__(self, serializer, compression='zlib', threshold=1024, level=None,
+                 dictionary=None):
+        super(CompressedSerializer, self).__init__(serializer.custom_encoder,
+                                                   serializer.custom_decoder)
+        if dictionary is not None and compression != 'zstd':
+            raise ValueError('Only zstd supports dictionaries')
+
+        self.serializer = serializer
+        self.threshold = threshold
+        self.compressor = self._load_compressor(compression, level, dictionary)
+        self.decompressors = {self.compressor.id: self.compressor}
+
+    def dumps(self, data):
+        data = self.serializer.dumps(data)
+
+        payload = data.encode('utf-8') if isinstance(data, str) else data
+        if len(payload) < self.threshold:
+            return data
+
+        compressed = self.compressor.compress(payload)
+        if len(compressed) + 2 >= len(payload):
+            return data
+        return MARKER + bytes(bytearray([self.compressor.id])) + compressed
+
+    def loads(self, data):
+        if isinstance(data, bytes) and data[:1] == MARKER:
+            # Slicing a memoryview doesn't copy the payload
+            data = self._decompressor(bytearray(data[1:2])[0]).decompress(memoryview(data)[2:])
+        return self.serializer.loads(data)
+
+    def _decompressor(self, id):
+        if id not in self.decompressors:
+            for compressor_cls in COMPRESSORS.values():
+                if compressor_cls.id == id:
+                    self.decompressors[id] = compressor_cls()
+                    break
+            else:
+                raise ValueError('Unknown compression id: %s' % id)
+        return self.decompressors[id]
+
+    def _load_compressor(self, name, level, dictionary):
+        config = {'dictionary': dictionary}
+        if level is not None:
+            config['level'] = level
+        return COMPRESSORS[name](**config)
+
+
+def train_dictionary(serializer, samples, size=16384):
+    """
+    Trains a ``zstd`` dictionary on sample values, for ``CompressedSerializer``.
+
+    Dictionaries pay off for many small, similar values, which otherwise
+    compress poorly on their own. Values compressed with a dictionary can only
+    be decompressed with the very same one, so it should be stored alongside
+    the code (or cache) using it.
+
+    :param serializer: Serializer the values will be cached with
+    :type serializer: BaseSerializer
+    :param samples: Representative values to be cached
+    :type samples: iterable
+    :param size: (optional) Maximum size of the dictionary, in bytes. Defaults to ``16384``.
+    :type size: integer
+    :return: the dictionary, as bytes
+    """
+
+    import zstandard
+
+    payloads = []
+    for sample in samples:
+        payload = serializer.dumps(sample)
+        payloads.append(payload.encode('utf-8') if isinstance(payload, str) else payload)
+    return zstandard.train_dictionary(size, payloads).as_bytes()
@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+import dataclasses
+import datetime
+import json
+import uuid
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from freon.serializers.base import BaseSerializer
+
+
+def encode_builtin(obj):
+    """
+    Encodes the types orjson supports natively, for when it isn't installed.
+    """
+
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if type(obj).__module__ == 'numpy' and hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+def decode_objects(value, object_hook):
+    """
+    Calls ``object_hook`` on every decoded object, innermost first, the way
+    ``json.loads`` does.
+    """
+
+    if isinstance(value, dict):
+        return object_hook(dict((k, decode_objects(v, object_hook)) for k, v in value.items()))
+    if isinstance(value, list):
+        return [decode_objects(item, object_hook) for item in value]
+    return value
+
+
+class FastJsonSerializer(BaseSerializer):
+    """
+    JSON serializer backed by orjson, if installed, or the standard library.
+
+    Datetimes, UUIDs, dataclasses and numpy arrays are encoded out of the box,
+    so ``custom_encoder`` is only called for other types. Payloads are
+    interchangeable with ``JsonSerializer``'s.
+    """
+
+    def __init__(self, custom_encoder=None, custom_decoder=None):
+        super(FastJsonSerializer, self).__init__(custom_encoder, custom_decoder)
+        if orjson is not None:
+            self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, data):
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, default=self.custom_encoder, option=self.options)
+            except orjson.JSONEncodeError:
+                # Like integers wider than 64 bits; the standard library copes with those
+                pass
+        return json.dumps(data, default=self._encode)
+
+    def loads(self, data):
+        if orjson is None:
+            return json.loads(data, object_hook=self.custom_decoder)
+
+        data = orjson.loads(data)
+        if self.custom_decoder is not None:
+            data = decode_objects(data, self.custom_decoder)
+        return data
+
+    def _encode(self, obj):
+        try:
+            return encode_builtin(obj)
+        except TypeError:
+            if self.custom_encoder is None:
+                raise
+            return self.custom_encoder(obj)
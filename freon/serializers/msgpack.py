@@ -1,12 +1,85 @@
 from __future__ import absolute_import
+import datetime
+import decimal
+import uuid
 import msgpack
 
 from freon.serializers.base import BaseSerializer
 
 
+class ExtType(object):
+    """
+    Packs instances of ``cls`` as msgpack extension type ``code``.
+
+    :param code: Extension type code, between ``0`` and ``127``
+    :type code: integer
+    :param cls: Class whose instances are packed (subclasses aren't)
+    :type cls: type
+    :param encode: Turns an instance into bytes
+    :type encode: callable
+    :param decode: Turns bytes back into an instance
+    :type decode: callable
+    """
+
+    def __init__(self, code, cls, encode, decode):
+        self.code = code
+        self.cls = cls
+        self.encode = encode
+        self.decode = decode
+
+
+def _encode_str(obj):
+    return str(obj).encode('utf-8')
+
+
+COMMON_EXT_TYPES = [
+    ExtType(1, datetime.datetime, _encode_str,
+            lambda data: datetime.datetime.fromisoformat(data.decode('utf-8'))),
+    ExtType(2, datetime.date, _encode_str,
+            lambda data: datetime.date.fromisoformat(data.decode('utf-8'))),
+    ExtType(3, decimal.Decimal, _encode_str,
+            lambda data: decimal.Decimal(data.decode('utf-8'))),
+    ExtType(4, uuid.UUID, lambda obj: obj.bytes, lambda data: uuid.UUID(bytes=bytes(data))),
+]
+
+
 class MsgpackSerializer(BaseSerializer):
+    """
+    msgpack serializer
+
+    Objects handled by ``custom_encoder`` are decoded back by calling
+    ``custom_decoder`` on every map in the payload. Extension types only
+    cost a callback for the objects they pack, on both ends.
+
+    :param ext_types: (optional) Extension types to pack objects with, like ``COMMON_EXT_TYPES`` (datetimes, dates, decimals and UUIDs). They take precedence over ``custom_encoder``.
+    :type ext_types: None or list of ExtType
+    """
+
+    def __init__(self, custom_encoder=None, custom_decoder=None, ext_types=None):
+        super(MsgpackSerializer, self).__init__(custom_encoder, custom_decoder)
+        self.encoders = dict((ext_type.cls, ext_type) for ext_type in ext_types or [])
+        self.decoders = dict((ext_type.code, ext_type.decode) for ext_type in ext_types or [])
+
     def dumps(self, data):
-        return msgpack.dumps(data, use_bin_type=True, default=self.custom_encoder)
+        default = self._encode if self.encoders else self.custom_encoder
+        return msgpack.dumps(data, use_bin_type=True, default=default)
 
     def loads(self, data):
+        if self.decoders:
+            return msgpack.loads(data, raw=False, object_hook=self.custom_decoder,
+                                 ext_hook=self._decode)
         return msgpack.loads(data, raw=False, object_hook=self.custom_decoder)
+
+    def _encode(self, obj):
+        ext_type = self.encoders.get(type(obj))
+        if ext_type is not None:
+            return msgpack.ExtType(ext_type.code, ext_type.encode(obj))
+        if self.custom_encoder is not None:
+            return self.custom_encoder(obj)
+        raise TypeError('Cannot serialize %r' % (obj,))
+
+    def _decode(self, code, data):
+        decode = self.decoders.get(code)
+        if decode is None:
+            return msgpack.ExtType(code, data)
+        return decode(data)
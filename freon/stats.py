@@ -0,0 +1,386 @@
+import bisect
+import inspect
+import socket
+import threading
+import time
+
+from freon.serializers.base import BaseSerializer
+
+
+# Upper bounds, in seconds, of latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Backend methods whose round trips are timed
+BACKEND_METHODS = ('get', 'get_many', 'get_or_lease', 'set', 'set_many', 'set_with_lease',
+                   'release_lease', 'delete', 'delete_many', 'exists', 'get_expired',
+                   'get_by_ttl', 'reap', 'invalidate_tags', 'incr', 'get_counter')
+
+
+def key_prefix(depth=1, separator=':'):
+    """
+    Returns a ``key_group`` function grouping keys by their first ``depth``
+    segments, so that ``user:42:profile`` is reported as ``user``.
+    """
+
+    def group(key):
+        return separator.join(key.split(separator, depth)[:depth])
+    return group
+
+
+class Histogram(object):
+    """
+    Latencies bucketed by upper bound, along with their count and sum.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket holding the ``q``-th percentile,
+        or ``inf`` if it is beyond the last bucket.
+        """
+
+        rank, seen = q / 100.0 * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen and seen >= rank:
+                return bound
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+
+class BaseSink(object):
+    """
+    Receives counter increments and latencies, along with their tags.
+    """
+
+    def incr(self, name, value, tags):
+        raise NotImplementedError()
+
+    def timing(self, name, seconds, tags):
+        raise NotImplementedError()
+
+
+class MemorySink(BaseSink):
+    """
+    Aggregates counters and latency histograms in-process, by name and tags.
+
+    Usage::
+
+      >>> sink = MemorySink()
+      >>> cache = Cache(stats=sink)
+      >>> cache.get('foo')
+      >>> sink.counter('misses')
+      1
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value, tags):
+        series = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            self.counters[series] = self.counters.get(series, 0) + value
+
+    def timing(self, name, seconds, tags):
+        series = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            histogram = self.histograms.get(series)
+            if histogram is None:
+                histogram = self.histograms[series] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def counter(self, name, **tags):
+        """
+        Returns the value of a counter, summed over the series matching
+        ``tags``.
+        """
+
+        return sum(value for series, value in self.counters.items()
+                   if self._matches(series, name, tags))
+
+    def histogram(self, name, **tags):
+        """
+        Returns the histogram of a latency, merged over the series matching
+        ``tags``.
+        """
+
+        merged = Histogram(self.buckets)
+        for series, histogram in self.histograms.items():
+            if self._matches(series, name, tags):
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.total += histogram.total
+        return merged
+
+    def _matches(self, series, name, tags):
+        series_name, series_tags = series
+        series_tags = dict(series_tags)
+        return series_name == name and all(series_tags.get(k) == v for k, v in tags.items())
+
+
+class CallbackSink(BaseSink):
+    """
+    Calls ``callback(kind, name, value, tags)`` for every event, ``kind``
+    being ``counter`` or ``timing``.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def incr(self, name, value, tags):
+        self.callback('counter', name, value, tags)
+
+    def timing(self, name, seconds, tags):
+        self.callback('timing', name, seconds, tags)
+
+
+class StatsdSink(BaseSink):
+    """
+    Sends events to a StatsD server over UDP, without waiting for replies.
+
+    Tags are sent DogStatsD-style (``|#group:user``) if ``tagged`` is on, and
+    appended to metric names otherwise.
+
+    :param host: (optional) StatsD host. Defaults to ``localhost``.
+    :type host: string
+    :param port: (optional) StatsD port. Defaults to ``8125``.
+    :type port: integer
+    :param prefix: (optional) Prefix of metric names. Defaults to ``freon``.
+    :type prefix: string
+    :param tagged: (optional) Whether the server supports DogStatsD tags. Defaults to ``False``.
+    :type tagged: bool
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='freon', tagged=False):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.tagged = tagged
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def incr(self, name, value, tags):
+        self._send(name, '%d|c' % value, tags)
+
+    def timing(self, name, seconds, tags):
+        self._send(name, '%.3f|ms' % (seconds * 1000), tags)
+
+    def _send(self, name, value, tags):
+        name = '%s.%s' % (self.prefix, name)
+        if not tags:
+            line = '%s:%s' % (name, value)
+        elif self.tagged:
+            line = '%s:%s|#%s' % (name, value,
+                                  ','.join('%s:%s' % item for item in sorted(tags.items())))
+        else:
+            line = '%s.%s:%s' % (name, '.'.join(v for _, v in sorted(tags.items())), value)
+
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except (IOError, OSError):
+            # Metrics are best effort
+            pass
+
+
+class PrometheusSink(BaseSink):
+    """
+    Exposes events as ``prometheus_client`` counters and histograms, labelled
+    by tags. Requires the ``prometheus_client`` package.
+
+    :param registry: (optional) Registry metrics are registered with. Defaults to ``prometheus_client``'s default one.
+    :param namespace: (optional) Prefix of metric names. Defaults to ``freon``.
+    :type namespace: string
+    :param buckets: (optional) Upper bounds of histogram buckets, in seconds.
+    :type buckets: tuple of numbers
+    """
+
+    def __init__(self, registry=None, namespace='freon', buckets=DEFAULT_BUCKETS):
+        import prometheus_client
+        self.prometheus = prometheus_client
+        self.registry = registry if registry is not None else prometheus_client.REGISTRY
+        self.namespace = namespace
+        self.buckets = buckets
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value, tags):
+        self._metric(self.prometheus.Counter, name, tags, {}).labels(**tags).inc(value)
+
+    def timing(self, name, seconds, tags):
+        metric = self._metric(self.prometheus.Histogram, name + '_seconds', tags,
+                              {'buckets': self.buckets})
+        metric.labels(**tags).observe(seconds)
+
+    def _metric(self, cls, name, tags, options):
+        labels = tuple(sorted(tags))
+        metric = self.metrics.get((name, labels))
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get((name, labels))
+                if metric is None:
+                    metric = self.metrics[(name, labels)] = cls(
+                        name.replace('.', '_'), 'freon %s' % name, labels,
+                        namespace=self.namespace, registry=self.registry, **options)
+        return metric
+
+
+class OpenTelemetrySink(BaseSink):
+    """
+    Records events as OpenTelemetry counters and histograms, with tags as
+    attributes. Requires the ``opentelemetry-api`` package.
+
+    :param meter: (optional) Meter instruments are created with. Defaults to the global meter provider's ``freon`` meter.
+    """
+
+    def __init__(self, meter=None):
+        if meter is None:
+            from opentelemetry import metrics
+            meter = metrics.get_meter('freon')
+        self.meter = meter
+        self.instruments = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value, tags):
+        self._instrument('create_counter', 'freon.%s' % name, '1').add(value, tags)
+
+    def timing(self, name, seconds, tags):
+        self._instrument('create_histogram', 'freon.%s' % name, 's').record(seconds, tags)
+
+    def _instrument(self, factory, name, unit):
+        instrument = self.instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self.instruments.get(name)
+                if instrument is None:
+                    instrument = self.instruments[name] = getattr(self.meter, factory)(
+                        name, unit=unit)
+        return instrument
+
+
+class Stats(object):
+    """
+    Reports cache events to one or more sinks.
+
+    Counters are ``hits``, ``stale_hits`` (expired entries found),
+    ``misses`` and ``lock_contention`` (writes given up because another
+    thread or process holds the entry's lock). Latencies are ``serialize``,
+    ``deserialize`` and ``backend``, the latter tagged by ``operation``.
+
+    :param sinks: Sink or list of sinks events are sent to
+    :type sinks: BaseSink or list of BaseSink
+    :param key_group: (optional) Function mapping keys to a ``group`` tag of counters, like ``key_prefix()``. Defaults to ``None``, meaning counters aren't tagged.
+    :type key_group: None or callable
+    """
+
+    def __init__(self, sinks, key_group=None):
+        self.sinks = list(sinks) if isinstance(sinks, (list, tuple)) else [sinks]
+        self.key_group = key_group
+
+    def incr(self, name, key=None, value=1):
+        tags = {'group': self.key_group(key)} if self.key_group and key is not None else {}
+        for sink in self.sinks:
+            sink.incr(name, value, tags)
+
+    def timing(self, name, seconds, **tags):
+        for sink in self.sinks:
+            sink.timing(name, seconds, tags)
+
+    def hit(self, key):
+        self.incr('hits', key)
+
+    def stale_hit(self, key):
+        self.incr('stale_hits', key)
+
+    def miss(self, key):
+        self.incr('misses', key)
+
+    def contention(self, key):
+        self.incr('lock_contention', key)
+
+
+class InstrumentedSerializer(BaseSerializer):
+    """
+    Wraps a serializer, timing ``dumps`` and ``loads``.
+    """
+
+    def __init__(self, serializer, stats):
+        self.serializer = serializer
+        self.stats = stats
+
+    def dumps(self, data):
+        start = time.perf_counter()
+        try:
+            return self.serializer.dumps(data)
+        finally:
+            self.stats.timing('serialize', time.perf_counter() - start)
+
+    def loads(self, data):
+        start = time.perf_counter()
+        try:
+            return self.serializer.loads(data)
+        finally:
+            self.stats.timing('deserialize', time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+
+class InstrumentedBackend(object):
+    """
+    Wraps a backend, timing the round trips of its data operations.
+    Coroutine methods are timed until they complete. Anything else, like
+    ``get_lock``, goes straight to the backend.
+    """
+
+    def __init__(self, backend, stats):
+        self.backend = backend
+        self.stats = stats
+
+        for name in BACKEND_METHODS:
+            method = getattr(backend, name, None)
+            if method is not None:
+                setattr(self, name, self._timed(name, method))
+
+    def _timed(self, name, method):
+        stats = self.stats
+
+        if inspect.iscoroutinefunction(method):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    stats.timing('backend', time.perf_counter() - start, operation=name)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stats.timing('backend', time.perf_counter() - start, operation=name)
+        return timed
+
+    def with_ttl_key(self, ttl_key):
+        return InstrumentedBackend(self.backend.with_ttl_key(ttl_key), self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
@@ -0,0 +1,176 @@
+import uuid
+
+from freon.backends.memory import MemoryBackend
+from freon.cache import Cache
+from freon.namespace import NamespacedBackend
+
+
+class TieredCache(Cache):
+    """
+    Cache with an in-process L1 of deserialized entries in front of the
+    selected backend
+
+    Fresh entries read from or written to the backend are also kept in a
+    bounded, LRU-evicted L1 for ``l1_ttl`` seconds, so hot keys are served
+    without a round trip or deserialization. Expired entries always go to the
+    backend, so the regular refresh and dog-pile logic still applies.
+
+    When the backend can publish and subscribe to invalidations (like
+    ``redis`` does), every write and delete, from any node, evicts the
+    affected key from all other L1s. Each instance publishes with an origin
+    of its own (``origin``), so that its own writes don't evict what it just
+    put in its L1.
+
+    With ``stats`` on, entries served from the L1 are counted as ``l1_hits``
+    rather than ``hits``.
+
+    Namespaces (see ``namespace``) share the L1, keeping their entries under
+    their full keys, generation included, which are also the ones other
+    nodes' invalidations carry. Invalidating a namespace leaves its entries
+    in the L1 unreachable, until they expire.
+
+    :param l1_max_entries: (optional) Maximum number of entries kept in the L1. Defaults to ``1024``.
+    :type l1_max_entries: integer
+    :param l1_ttl: (optional) Seconds an entry is served from the L1. Defaults to ``5``.
+    :type l1_ttl: number
+    :param invalidation_channel: (optional) Channel invalidations are published on. Defaults to ``freon:cache:invalidations``.
+    :type invalidation_channel: string
+    :param **kwargs: (optional) Extra arguments, passed to ``Cache``.
+
+    Usage::
+
+      >>> from freon.tiered import TieredCache
+      >>> cache = TieredCache(backend='redis', l1_ttl=10)
+      >>> cache.get('foobar')
+      None
+    """
+
+    def __init__(self, backend='redis', l1_max_entries=1024, l1_ttl=5,
+                 invalidation_channel='freon:cache:invalidations', **kwargs):
+
+        self.origin = uuid.uuid4().hex
+        super(TieredCache, self).__init__(backend=backend,
+                                          invalidation_channel=invalidation_channel,
+                                          invalidation_origin=self.origin, **kwargs)
+        self.local = MemoryBackend(max_entries=l1_max_entries)
+        self.l1_ttl = l1_ttl
+
+        self.listener = None
+        if hasattr(self.backend, 'subscribe'):
+            self.listener = self.backend.subscribe(invalidation_channel, self._invalidated)
+
+    def get(self, key):
+        value = self._get_local(key, self._local_key(key))
+        if value is not None:
+            return value
+
+        return super(TieredCache, self).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        result, missing = {}, []
+        for key, local_key in zip(keys, self._local_keys(keys)):
+            value = self._get_local(key, local_key)
+            if value is not None:
+                result[key] = value
+            else:
+                missing.append(key)
+
+        if missing:
+            result.update(super(TieredCache, self).get_many(missing))
+        return result
+
+    def set(self, key, value, ttl=None, tags=None):
+        result = super(TieredCache, self).set(key, value, ttl, tags)
+        if result is not None:
+            self.local.set(self._local_key(key), result, self.l1_ttl)
+        return result
+
+    def set_many(self, mapping, ttl=None, tags=None):
+        result = super(TieredCache, self).set_many(mapping, ttl, tags)
+        keys = list(result)
+        self.local.set_many(dict((local_key, (result[key], self.l1_ttl))
+                                 for key, local_key in zip(keys, self._local_keys(keys))))
+        return result
+
+    def get_or_set(self, key, new_value, ttl=None):
+        value = self._get_local(key, self._local_key(key))
+        if value is not None:
+            return value
+
+        return super(TieredCache, self).get_or_set(key, new_value, ttl)
+
+    def delete(self, key):
+        self.local.delete(self._local_key(key))
+        return super(TieredCache, self).delete(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        self.local.delete_many(self._local_keys(keys))
+        return super(TieredCache, self).delete_many(keys)
+
+    def invalidate_tags(self, tags):
+        # Namespaced backends return full keys already
+        keys = super(TieredCache, self).invalidate_tags(tags)
+        self.local.delete_many(keys)
+        return keys
+
+    def invalidate(self, key):
+        """
+        Evicts an entry from the L1 only.
+
+        :param key: Key of cached entry to be evicted
+        :type key: string
+        """
+
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        self.local.delete(self._local_key(key))
+
+    def close(self):
+        """
+        Stops listening for invalidations.
+        """
+
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _invalidated(self, message):
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        origin, separator, key = message.partition('\0')
+        if not separator:
+            origin, key = None, message
+        if origin != self.origin:
+            self.invalidate(key)
+
+    def _get_local(self, key, local_key):
+        value, expired = self.local.get(local_key)
+        if expired:
+            return None
+        if self.stats is not None:
+            self.stats.incr('l1_hits', key)
+        if self._reads is not None:
+            self._reads.add(key)
+        return value
+
+    def _loaded(self, key, value, expired):
+        if not expired:
+            self.local.set(self._local_key(key), value, self.l1_ttl)
+        return value
+
+    def _namespaced(self, backend):
+        cache = super(TieredCache, self)._namespaced(backend)
+        # The listener stays this cache's to close
+        cache.listener = None
+        return cache
+
+    def _local_key(self, key):
+        return self._local_keys([key])[0]
+
+    def _local_keys(self, keys):
+        if isinstance(self.backend, NamespacedBackend):
+            prefix = self.backend._prefix()
+            return [prefix + key for key in keys]
+        return list(keys)
@@ -22,10 +22,19 @@ setup(
     zip_safe=False,
     include_package_data=True,
     platforms='any',
+    python_requires='>=3.7',
     extras_require={
+        'fast_json': ['orjson'],
+        'lz4': ['lz4'],
+        'opentelemetry': ['opentelemetry-api'],
+        'prometheus': ['prometheus_client'],
+        'zstd': ['zstandard'],
         'dev': [
-            'redis',
+            'redis>=4.2',
             'msgpack',
+            'lz4',
+            'orjson',
+            'zstandard',
             'pytest',
             'mock'
         ]
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from freon.backends.async_memory import AsyncMemoryBackend
+
+from tests import BaseTestCase
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AsyncMemoryTestCase(BaseTestCase):
+    def setUp(self):
+        self.backend = AsyncMemoryBackend(ttl_key='freon:cache:test_ttl')
+
+    def set_key(self, key, value, ttl=0):
+        self.backend.store[key] = value
+        self.backend.store['freon:cache:test_ttl'][key] = time.time() + ttl
+
+
+class OperationsTests(AsyncMemoryTestCase):
+    def test_get(self):
+        self.set_key('foo', 'bar', 123)
+        assert run(self.backend.get('foo')) == ('bar', False)
+
+    def test_set(self):
+        assert run(self.backend.set('foo', 'bar', 123)) is True
+        assert self.backend.store['foo'] == 'bar'
+
+    def test_delete(self):
+        self.set_key('foo', 'bar')
+        assert run(self.backend.delete('foo')) is True
+        assert 'foo' not in self.backend.store
+
+    def test_exists(self):
+        self.set_key('foo', 'bar')
+        assert run(self.backend.exists('foo')) is True
+
+    def test_get_expired(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        assert run(self.backend.get_expired()) == ['foo']
+
+
+    def test_iter_expired(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+
+        async def collect(items):
+            return [item async for item in items]
+
+        assert run(collect(self.backend.iter_expired(batch_size=1))) == ['foo']
+        assert run(collect(self.backend.iter_by_ttl(124))) == ['bar']
+
+
+class LockTests(AsyncMemoryTestCase):
+    def test_second_acquire_fails_while_held(self):
+        async def scenario():
+            first, second = self.backend.get_lock('foo'), self.backend.get_lock('foo')
+            assert await first.acquire(blocking=False) is True
+            assert await second.acquire(blocking=False) is False
+            await first.release()
+            assert await second.acquire(blocking=False) is True
+            await second.release()
+
+        run(scenario())
+
+    def test_locks_are_per_key(self):
+        async def scenario():
+            assert await self.backend.get_lock('foo').acquire(blocking=False) is True
+            assert await self.backend.get_lock('bar').acquire(blocking=False) is True
+
+        run(scenario())
+
+    def test_released_locks_are_forgotten(self):
+        async def scenario():
+            lock = self.backend.get_lock('foo')
+            await lock.acquire()
+            await lock.release()
+
+        run(scenario())
+        assert self.backend.locks == {}
+
+    def test_waiters_keep_lock_registered(self):
+        async def scenario():
+            first, second = self.backend.get_lock('foo'), self.backend.get_lock('foo')
+            await first.acquire()
+            waiter = asyncio.ensure_future(second.acquire())
+            await asyncio.sleep(0)
+            await first.release()
+            assert await self.backend.get_lock('foo').acquire(blocking=False) is False
+            await waiter
+            await second.release()
+
+        run(scenario())
+        assert self.backend.locks == {}
@@ -0,0 +1,148 @@
+import asyncio
+import pytest
+import redis
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freon.backends.async_redis import AsyncRedisBackend
+
+from tests import BaseTestCase
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AsyncRedisTestCase(BaseTestCase):
+    def setUp(self):
+        self.backend = AsyncRedisBackend(db=15, ttl_key='freon:cache:test_ttl')
+        self.client = redis.StrictRedis(db=15, decode_responses=True)
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def set_key(self, key, value, ttl=0):
+        self.client.set(key, value)
+        self.client.zadd('freon:cache:test_ttl', {key: time.time() + ttl})
+
+
+class GetTests(AsyncRedisTestCase):
+    def test_with_existing_expired_key(self):
+        self.set_key('foo', 'bar', -123)
+        assert run(self.backend.get('foo')) == (b'bar', True)
+
+    def test_with_not_existing_key(self):
+        assert run(self.backend.get('foo')) == (None, True)
+
+    def test_get_many(self):
+        self.set_key('foo', 'bar', 123)
+        assert run(self.backend.get_many(['foo', 'baz'])) == [(b'bar', False), (None, True)]
+
+
+class SetTests(AsyncRedisTestCase):
+    def test_set(self):
+        assert run(self.backend.set('foo', 'bar', 1234)) is True
+        assert self.client.get('foo') == 'bar'
+        assert self.client.zscore('freon:cache:test_ttl', 'foo') == pytest.approx(time.time() + 1234)
+
+    def test_set_many(self):
+        assert run(self.backend.set_many({'foo': ('bar', 12), 'baz': ('qux', 34)})) is True
+        assert self.client.mget('foo', 'baz') == ['bar', 'qux']
+
+
+class LeaseTests(AsyncRedisTestCase):
+    # Each test runs in a single event loop, which pooled connections are bound to
+
+    def test_get_or_lease_and_set_with_lease(self):
+        async def scenario():
+            value, expired, lease = await self.backend.get_or_lease('foo')
+            assert (value, expired) == (None, True)
+            assert await self.backend.get_or_lease('foo') == (None, True, None)
+            assert await self.backend.set_with_lease('foo', 'bar', 123, lease) is True
+            assert await self.backend.get_or_lease('foo') == (b'bar', False, None)
+
+        run(scenario())
+
+    def test_release_lease(self):
+        async def scenario():
+            lease = (await self.backend.get_or_lease('foo'))[2]
+            assert await self.backend.release_lease('foo', lease) is True
+
+        run(scenario())
+        assert self.client.exists('foo_lock') == 0
+
+
+class DeleteTests(AsyncRedisTestCase):
+    def test_delete(self):
+        self.set_key('foo', 'bar')
+        assert run(self.backend.delete('foo')) is True
+        assert self.client.get('foo') is None
+
+    def test_delete_many(self):
+        self.set_key('foo', 'bar')
+        self.set_key('baz', 'qux')
+        assert run(self.backend.delete_many(['foo', 'baz'])) is True
+        assert self.client.exists('foo', 'baz') == 0
+
+
+class ExpiryTests(AsyncRedisTestCase):
+    def test_get_expired(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        assert run(self.backend.get_expired()) == ['foo']
+
+    def test_iter_expired(self):
+        keys = ['key%02d' % i for i in range(10)]
+        for key in keys:
+            self.set_key(key, key, -123)
+        self.set_key('later', 'foo', 123)
+
+        async def scenario():
+            assert [key async for key in self.backend.iter_expired(batch_size=3)] == \
+                await self.backend.get_expired()
+            assert [key async for key in self.backend.iter_by_ttl(124, batch_size=3)] == \
+                ['later']
+
+        run(scenario())
+
+    def test_get_by_ttl(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        self.set_key('baz', 'baz', 1234)
+        assert run(self.backend.get_by_ttl(124)) == ['bar']
+
+
+class PipelineTests(AsyncRedisTestCase):
+    def test_sends_calls_in_a_single_round_trip(self):
+        self.set_key('foo', 'bar', 123)
+
+        async def scenario():
+            pipeline = self.backend.pipeline()
+            with mock.patch.object(self.backend.client, 'execute_command') as execute_command:
+                assert await pipeline.get('foo') is None
+                await pipeline.set('baz', 'qux', 123)
+                await pipeline.get_many([])
+                await pipeline.exists('baz')
+                execute_command.assert_not_called()
+            return await pipeline.execute()
+
+        assert run(scenario()) == [(b'bar', False), True, [], True]
+        assert self.client.get('baz') == 'qux'
+
+    def test_with_cache(self):
+        from freon.async_cache import AsyncCache
+
+        cache = AsyncCache(backend='redis', db=15, ttl_key='freon:cache:test_ttl')
+
+        async def scenario():
+            async with cache.pipeline() as pipeline:
+                pipeline.set('foo', {'bar': 1})
+                pipeline.get('foo')
+                pipeline.get_many(['foo', 'baz'])
+            return pipeline.results
+
+        assert run(scenario()) == [{'bar': 1}, {'bar': 1}, {'foo': {'bar': 1}}]
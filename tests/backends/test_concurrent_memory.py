@@ -0,0 +1,131 @@
+import threading
+
+from freon.backends.concurrent_memory import ConcurrentMemoryBackend
+
+from tests import BaseTestCase
+
+
+class ConcurrentMemoryTestCase(BaseTestCase):
+    def setUp(self):
+        self.backend = ConcurrentMemoryBackend(shards=4, ttl_key='freon:cache:test_ttl')
+        self.keys = ['key%s' % i for i in range(40)]
+
+
+class ShardingTests(ConcurrentMemoryTestCase):
+    def test_keys_are_spread_across_shards(self):
+        for key in self.keys:
+            self.backend.set(key, 'foo', 123)
+        assert all(len(shard.store) > 1 for shard in self.backend.shards)
+
+    def test_keys_and_expiry_times_live_on_the_same_shard(self):
+        self.backend.set('foo', 'bar', 123)
+        shard = self.backend.get_shard('foo')
+        assert shard.store['foo'] == 'bar'
+        assert 'foo' in shard.store['freon:cache:test_ttl']
+
+    def test_limits_are_split_between_shards(self):
+        backend = ConcurrentMemoryBackend(shards=4, max_entries=100, max_bytes=1000)
+        assert [shard.max_entries for shard in backend.shards] == [25] * 4
+        assert [shard.max_bytes for shard in backend.shards] == [250] * 4
+
+    def test_evictions_are_summed(self):
+        backend = ConcurrentMemoryBackend(shards=2, max_entries=2)
+        for key in self.keys:
+            backend.set(key, 'foo', 123)
+        assert backend.evictions == len(self.keys) - 2
+
+    def test_locks_are_per_key(self):
+        lock = self.backend.get_lock('foo')
+        assert lock.acquire(blocking=False) is True
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+        lock.release()
+
+
+class OperationsTests(ConcurrentMemoryTestCase):
+    def test_get(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.set('baz', 'qux', -123)
+        assert self.backend.get('foo') == ('bar', False)
+        assert self.backend.get('baz') == ('qux', True)
+        assert self.backend.get('quux') == (None, True)
+
+    def test_get_many_keeps_order(self):
+        for key in self.keys[::2]:
+            self.backend.set(key, key, 123)
+        assert self.backend.get_many(self.keys) == [
+            (key, False) if i % 2 == 0 else (None, True) for i, key in enumerate(self.keys)]
+
+    def test_set_many(self):
+        assert self.backend.set_many(dict((key, (key, 123)) for key in self.keys)) is True
+        assert all(self.backend.exists(key) for key in self.keys)
+
+    def test_delete_and_delete_many(self):
+        for key in self.keys:
+            self.backend.set(key, key, 123)
+        assert self.backend.delete(self.keys[0]) is True
+        assert self.backend.delete_many(self.keys[1:]) is True
+        assert not any(self.backend.exists(key) for key in self.keys)
+
+    def test_get_expired_merges_shards_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.backend.set(key, key, -100 + i)
+        self.backend.set('fresh', 'foo', 123)
+        assert self.backend.get_expired() == self.keys
+
+    def test_get_by_ttl_merges_shards_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.backend.set(key, key, 100 + i)
+        self.backend.set('later', 'foo', 1000)
+        assert self.backend.get_by_ttl(200) == self.keys
+        assert [key for key, _ in self.backend.get_by_ttl(200, with_scores=True)] == self.keys
+
+    def test_iter_merges_shards_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.backend.set(key, key, -100 + i)
+        self.backend.set('later', 'foo', 123)
+        assert list(self.backend.iter_expired(batch_size=3)) == self.keys
+        assert list(self.backend.iter_by_ttl(124, batch_size=3)) == ['later']
+
+
+    def test_reap(self):
+        for key in self.keys:
+            self.backend.set(key, key, -123)
+        assert sorted(self.backend.reap()) == sorted(self.keys)
+        assert not any(self.backend.exists(key) for key in self.keys)
+
+    def test_invalidate_tags_fans_out_to_shards(self):
+        self.backend.set_many(dict((key, (key, 123)) for key in self.keys[:20]), ['even'])
+        self.backend.set(self.keys[20], 'foo', 123, ['odd'])
+        assert sorted(self.backend.invalidate_tags(['even'])) == sorted(self.keys[:20])
+        assert not any(self.backend.exists(key) for key in self.keys[:20])
+        assert self.backend.exists(self.keys[20])
+
+
+class ThreadSafetyTests(ConcurrentMemoryTestCase):
+    def test_entries_and_expiry_times_stay_in_step(self):
+        backend = ConcurrentMemoryBackend(shards=4, max_entries=20)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(2000):
+                    key = self.keys[(n + i) % len(self.keys)]
+                    if i % 3 == 0:
+                        backend.delete(key)
+                    else:
+                        backend.set(key, i, 123)
+                    backend.get(key)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        for shard in backend.shards:
+            ttls = shard.store[backend.ttl_key]
+            assert set(shard.store) - {backend.ttl_key} == set(ttls)
+            assert len(ttls) <= shard.max_entries
@@ -0,0 +1,80 @@
+from freon.backends.eviction import (
+    LfuEvictionPolicy, LruEvictionPolicy, TtlEvictionPolicy, load_policy)
+
+from tests import BaseTestCase
+
+
+class LruTests(BaseTestCase):
+    def setUp(self):
+        self.policy = LruEvictionPolicy()
+        for key in ('foo', 'bar', 'baz'):
+            self.policy.add(key, 0)
+
+    def test_evicts_oldest(self):
+        assert self.policy.victim() == 'foo'
+
+    def test_touch_refreshes_key(self):
+        self.policy.touch('foo')
+        assert self.policy.victim() == 'bar'
+
+    def test_add_refreshes_existing_key(self):
+        self.policy.add('foo', 0)
+        assert self.policy.victim() == 'bar'
+
+    def test_remove(self):
+        self.policy.remove('foo')
+        assert self.policy.victim() == 'bar'
+
+
+class LfuTests(BaseTestCase):
+    def setUp(self):
+        self.policy = LfuEvictionPolicy()
+        for key in ('foo', 'bar', 'baz'):
+            self.policy.add(key, 0)
+
+    def test_evicts_least_recent_among_least_used(self):
+        assert self.policy.victim() == 'foo'
+
+    def test_evicts_least_used(self):
+        self.policy.touch('foo')
+        self.policy.touch('bar')
+        assert self.policy.victim() == 'baz'
+
+    def test_remove_least_used(self):
+        for key in ('foo', 'bar'):
+            self.policy.touch(key)
+            self.policy.touch(key)
+        self.policy.remove('baz')
+        assert self.policy.victim() == 'foo'
+
+    def test_touch_missing_key(self):
+        self.policy.touch('qux')
+        assert 'qux' not in self.policy.counts
+
+
+class TtlTests(BaseTestCase):
+    def setUp(self):
+        self.policy = TtlEvictionPolicy()
+        self.policy.add('foo', 30)
+        self.policy.add('bar', 10)
+        self.policy.add('baz', 20)
+
+    def test_evicts_closest_to_expiring(self):
+        assert self.policy.victim() == 'bar'
+
+    def test_readd_updates_expiry(self):
+        self.policy.add('bar', 40)
+        assert self.policy.victim() == 'baz'
+
+    def test_remove(self):
+        self.policy.remove('bar')
+        assert self.policy.victim() == 'baz'
+
+
+class LoadPolicyTests(BaseTestCase):
+    def test_by_name(self):
+        assert isinstance(load_policy('lfu'), LfuEvictionPolicy) is True
+
+    def test_instance(self):
+        policy = LruEvictionPolicy()
+        assert load_policy(policy) is policy
@@ -0,0 +1,104 @@
+from freon.backends.expiry import ExpiryIndex
+
+from tests import BaseTestCase
+
+
+class ExpiryIndexTests(BaseTestCase):
+    def setUp(self):
+        self.index = ExpiryIndex()
+        for i, key in enumerate(['foo', 'bar', 'baz', 'qux', 'quux']):
+            self.index[key] = 10 * (5 - i)
+
+    def test_behaves_like_dict(self):
+        assert self.index['foo'] == 50
+        assert dict(self.index) == {'foo': 50, 'bar': 40, 'baz': 30, 'qux': 20, 'quux': 10}
+
+    def test_range_is_inclusive_and_ordered(self):
+        assert self.index.range(20, 40) == ['qux', 'baz', 'bar']
+
+    def test_range_without_matches(self):
+        assert self.index.range(60, 70) == []
+
+    def test_range_on_empty_index(self):
+        assert ExpiryIndex().range(0, 10) == []
+
+    def test_range_skips_deleted_keys(self):
+        del self.index['baz']
+        assert self.index.range(20, 40) == ['qux', 'bar']
+
+    def test_range_uses_latest_expiry(self):
+        self.index['baz'] = 60
+        self.index['foo'] = 25
+        assert self.index.range(20, 40) == ['qux', 'foo', 'bar']
+
+    def test_range_does_not_duplicate_rewritten_keys(self):
+        self.index['baz'] = 30
+        assert self.index.range(30, 30) == ['baz']
+
+    def test_rewrites_replace_entries(self):
+        for i in range(1000):
+            self.index['foo'] = i
+        assert len(self.index.entries) == len(self.index) == 5
+        assert self.index.range(999, 999) == ['foo']
+
+    def test_pop(self):
+        assert self.index.pop('baz') == 30
+        assert self.index.pop('baz', None) is None
+        key, _ = self.index.popitem()
+        assert self.index.range(0, 100) == sorted(self.index, key=self.index.get)
+        assert key not in self.index.range(0, 100)
+
+    def test_clear(self):
+        self.index.clear()
+        assert self.index.range(0, 100) == []
+
+    def test_update(self):
+        self.index.update({'corge': 15})
+        assert self.index.range(15, 15) == ['corge']
+
+    def test_expired(self):
+        self.index['qux'] = 35
+        assert self.index.expired(40, 10) == ['quux', 'baz', 'qux', 'bar']
+        assert 'bar' in self.index
+
+    def test_expired_respects_limit(self):
+        assert self.index.expired(100, 2) == ['quux', 'qux']
+
+
+class PageTests(BaseTestCase):
+    def setUp(self):
+        self.index = ExpiryIndex()
+        for i in range(100):
+            self.index['key%02d' % i] = i // 3
+
+    def walk(self, min_expires_at, max_expires_at, limit, between_pages=None):
+        items, cursor = [], None
+        while True:
+            page, cursor = self.index.page(min_expires_at, max_expires_at, limit, cursor)
+            items.extend(page)
+            if len(page) < limit:
+                return items
+            if between_pages:
+                between_pages()
+
+    def test_pages_through_range_in_order(self):
+        keys = ['key%02d' % i for i in range(30, 93)]
+        assert self.walk(10, 30, 7) == [(key, int(key[3:]) // 3) for key in keys]
+        assert [key for key, _ in self.walk(10, 30, 7)] == self.index.range(10, 30)
+
+    def test_page_larger_than_range(self):
+        items, _ = self.index.page(0, 1, 10)
+        assert items == [('key00', 0), ('key01', 0), ('key02', 0), ('key03', 1),
+                         ('key04', 1), ('key05', 1)]
+
+    def test_writes_between_pages(self):
+        writes = iter(range(1000, 2000))
+        keys = [key for key, _ in self.walk(0, 40, 5, lambda: self.index.update(
+            {'new%d' % next(writes): 99}))]
+        assert keys == self.index.range(0, 40)
+
+    def test_follows_rewritten_and_deleted_entries(self):
+        self.index['key10'] = 3
+        self.index['key11'] = 50
+        del self.index['key12']
+        assert [key for key, _ in self.walk(3, 3, 2)] == ['key09', 'key10']
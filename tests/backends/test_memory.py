@@ -1,7 +1,13 @@
+import gc
+import os
+import pickle
 import pytest
+import shutil
+import tempfile
+import threading
 import time
 
-from freon.backends.memory import MemoryBackend
+from freon.backends.memory import LockRegistry, MemoryBackend
 
 from tests import BaseTestCase
 
@@ -41,6 +47,16 @@ class GetTests(MemoryTestCase):
         assert len(response) == 2
 
 
+class GetManyTests(MemoryTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar', -123)
+        self.set_key('baz', 'qux', 123)
+        assert self.backend.get_many(['foo', 'quux', 'baz']) == [('bar', True), (None, True), ('qux', False)]
+
+    def test_with_no_keys(self):
+        assert self.backend.get_many([]) == []
+
+
 class SetTests(MemoryTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar', 123)
@@ -55,6 +71,17 @@ class SetTests(MemoryTestCase):
         assert self.backend.set('foo', 'baz', 1234) is True
 
 
+class SetManyTests(MemoryTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar', 123)
+        self.backend.set_many({'foo': ('baz', 1234), 'qux': ('quux', 12)})
+        self.assert_set('foo', 'baz', 1234)
+        self.assert_set('qux', 'quux', 12)
+
+    def test_returns_true(self):
+        assert self.backend.set_many({'foo': ('bar', 1234)}) is True
+
+
 class DeleteTests(MemoryTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar')
@@ -69,6 +96,19 @@ class DeleteTests(MemoryTestCase):
         assert self.backend.delete('foo') is True
 
 
+class DeleteManyTests(MemoryTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar')
+        self.set_key('baz', 'qux')
+        self.backend.delete_many(['foo', 'baz', 'quux'])
+        self.assert_deleted('foo')
+        self.assert_deleted('baz')
+        self.assert_deleted('quux')
+
+    def test_returns_true(self):
+        assert self.backend.delete_many(['foo']) is True
+
+
 class ExistsTests(MemoryTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar')
@@ -84,6 +124,16 @@ class GetExpiredTests(MemoryTestCase):
         self.set_key('bar', 'bar', 123)
         assert self.backend.get_expired() == ['foo']
 
+    def test_ordered_by_expiry_time(self):
+        self.set_key('foo', 'foo', -12)
+        self.set_key('bar', 'bar', -123)
+        assert self.backend.get_expired() == ['bar', 'foo']
+
+    def test_with_deleted_key(self):
+        self.set_key('foo', 'foo', -123)
+        self.backend.delete('foo')
+        assert self.backend.get_expired() == []
+
 
 class GetByTtl(MemoryTestCase):
     def test_with_expired_and_not_expired_key(self):
@@ -93,3 +143,320 @@ class GetByTtl(MemoryTestCase):
         # Python's time() precision is different than Redis' so we want to make
         # sure we include the right keys in the response
         assert self.backend.get_by_ttl(124) == ['bar']
+
+    def test_with_overwritten_key(self):
+        self.set_key('foo', 'foo', 123)
+        self.backend.set('foo', 'foo', 1234)
+        assert self.backend.get_by_ttl(124) == []
+
+
+class IterTests(MemoryTestCase):
+    def setUp(self):
+        super(IterTests, self).setUp()
+        self.keys = ['key%02d' % i for i in range(25)]
+        for i, key in enumerate(self.keys):
+            self.set_key(key, key, -100 + i)
+        self.set_key('later', 'foo', 123)
+
+    def test_iter_expired(self):
+        assert list(self.backend.iter_expired(batch_size=4)) == self.keys
+
+    def test_iter_by_ttl(self):
+        assert list(self.backend.iter_by_ttl(124, batch_size=4)) == ['later']
+
+    def test_with_scores(self):
+        assert list(self.backend.iter_expired(batch_size=4, with_scores=True)) == \
+            self.backend.get_expired(with_scores=True)
+
+    def test_lock_is_not_held_between_batches(self):
+        keys = self.backend.iter_expired(batch_size=4)
+        next(keys)
+        assert self.backend._lock.acquire(False) is True
+        self.backend._lock.release()
+
+
+class GetLockTests(MemoryTestCase):
+    def test_same_lock_for_same_key(self):
+        assert self.backend.get_lock('foo') is self.backend.get_lock('foo')
+
+    def test_different_locks_for_different_keys(self):
+        assert self.backend.get_lock('foo') is not self.backend.get_lock('bar')
+
+    def test_lock_blocks_other_producers(self):
+        lock = self.backend.get_lock('foo')
+        assert lock.acquire(False) is True
+        assert self.backend.get_lock('foo').acquire(False) is False
+        lock.release()
+        assert self.backend.get_lock('foo').acquire(False) is True
+
+    def test_unused_locks_are_dropped(self):
+        self.backend.get_lock('foo')
+        gc.collect()
+        assert len(self.backend.locks) == 0
+
+    def test_blocking_acquire_times_out(self):
+        lock = self.backend.get_lock('foo')
+        lock.acquire()
+        assert self.backend.get_lock('foo').acquire(blocking=True, blocking_timeout=0.01) is False
+
+    def test_counts_contention(self):
+        lock = self.backend.get_lock('foo')
+        lock.acquire()
+        self.backend.get_lock('foo').acquire(False)
+        self.backend.get_lock('foo').acquire(False)
+        assert self.backend.locks.contention['foo'] == 2
+
+    def test_waiter_is_woken_up_on_release(self):
+        lock = self.backend.get_lock('foo')
+        lock.acquire()
+        threading.Timer(0.01, lock.release).start()
+        assert self.backend.get_lock('foo').acquire(blocking=True, blocking_timeout=1) is True
+
+    def test_contention_counts_are_bounded(self):
+        locks = LockRegistry(max_contended=4)
+        for i in range(5):
+            locks.contended('key%d' % i)
+        assert len(locks.contention) <= 4
+
+
+class BoundedTests(BaseTestCase):
+    def test_unbounded_by_default(self):
+        backend = MemoryBackend()
+        for i in range(100):
+            backend.set(str(i), 'foo', 123)
+        assert backend.evictions == 0
+        assert len(backend.store) == 101
+
+    def test_max_entries(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('foo', 'foo', 123)
+        backend.set('bar', 'bar', 123)
+        backend.get('foo')
+        backend.set('baz', 'baz', 123)
+        assert backend.exists('foo') is True
+        assert backend.exists('bar') is False
+        assert backend.exists('baz') is True
+        assert backend.evictions == 1
+
+    def test_max_bytes(self):
+        backend = MemoryBackend(max_bytes=10)
+        backend.set('foo', 'abcd', 123)
+        backend.set('bar', 'abcd', 123)
+        backend.set('baz', 'abcd', 123)
+        assert backend.exists('foo') is False
+        assert backend.bytes == 8
+
+    def test_overwrites_and_deletes_are_accounted(self):
+        backend = MemoryBackend(max_bytes=10)
+        backend.set('foo', 'abcd', 123)
+        backend.set('foo', 'ab', 123)
+        backend.set('bar', 'abcd', 123)
+        backend.delete('bar')
+        assert backend.bytes == 2
+        assert backend.evictions == 0
+
+    def test_expired_entries_are_dropped_from_ttl_store(self):
+        backend = MemoryBackend(max_entries=1)
+        backend.set('foo', 'foo', 123)
+        backend.set('bar', 'bar', 123)
+        assert 'foo' not in backend.store[backend.ttl_key]
+
+    def test_eviction_policy(self):
+        backend = MemoryBackend(max_entries=2, eviction_policy='ttl')
+        backend.set('foo', 'foo', 1234)
+        backend.set('bar', 'bar', 12)
+        backend.set('baz', 'baz', 123)
+        assert backend.exists('bar') is False
+
+    def test_reads_touch_the_policy_under_the_lock(self):
+        backend = MemoryBackend(max_entries=10, eviction_policy='lfu')
+        backend.set('foo', 'foo', 123)
+        touch = backend.policy.touch
+        owned = []
+
+        def locked_touch(key):
+            owned.append(backend._lock._is_owned())
+            return touch(key)
+
+        backend.policy.touch = locked_touch
+        backend.get('foo')
+        backend.get_many(['foo'])
+        assert owned == [True, True]
+
+
+class ReapTests(MemoryTestCase):
+    def test_deletes_expired_keys(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        assert self.backend.reap() == ['foo']
+        self.assert_deleted('foo')
+        assert self.backend.exists('bar') is True
+
+    def test_respects_grace_period(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', -12)
+        assert self.backend.reap(grace=60) == ['foo']
+        assert self.backend.exists('bar') is True
+
+    def test_respects_limit(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', -12)
+        assert self.backend.reap(limit=1) == ['foo']
+        assert self.backend.reap(limit=1) == ['bar']
+        assert self.backend.reap(limit=1) == []
+
+    def test_skips_overwritten_keys(self):
+        self.set_key('foo', 'foo', -123)
+        self.backend.set('foo', 'bar', 123)
+        assert self.backend.reap() == []
+        assert self.backend.get('foo') == ('bar', False)
+
+
+class SnapshotTests(MemoryTestCase):
+    def setUp(self):
+        super(SnapshotTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_restores_entries_with_their_expiry_times(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.set('baz', b'qux', -123)
+        assert self.backend.snapshot(self.path) == 2
+
+        backend = MemoryBackend(ttl_key='freon:cache:test_ttl')
+        assert backend.restore(self.path) == 2
+        assert backend.get('foo') == ('bar', False)
+        assert backend.get('baz') == (b'qux', True)
+        assert backend.store['freon:cache:test_ttl']['foo'] == \
+            self.backend.store['freon:cache:test_ttl']['foo']
+
+    def test_keeps_entries_written_in_the_meantime(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.snapshot(self.path)
+
+        backend = MemoryBackend(ttl_key='freon:cache:test_ttl')
+        backend.set('foo', 'baz', 123)
+        assert backend.restore(self.path) == 0
+        assert backend.get('foo') == ('baz', False)
+
+    def test_respects_bounds(self):
+        for i in range(10):
+            self.backend.set('key%s' % i, 'foo', 123)
+        self.backend.snapshot(self.path)
+
+        backend = MemoryBackend(max_entries=5)
+        backend.restore(self.path)
+        assert len(backend.store[backend.ttl_key]) == 5
+
+    def test_with_missing_snapshot(self):
+        assert self.backend.restore(self.path) == 0
+
+    def test_with_other_file(self):
+        with open(self.path, 'wb') as f:
+            pickle.dump('foo', f)
+        with pytest.raises(ValueError):
+            self.backend.restore(self.path)
+
+    def test_replaces_snapshot_atomically(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.snapshot(self.path)
+        self.backend.snapshot(self.path)
+        assert os.listdir(self.directory) == ['snapshot']
+
+    def test_restores_in_background(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.snapshot(self.path)
+
+        backend = MemoryBackend(ttl_key='freon:cache:test_ttl')
+        thread = backend.start_restore(self.path)
+        assert thread.daemon is True
+        thread.join(5)
+        assert backend.get('foo') == ('bar', False)
+
+
+class CounterTests(MemoryTestCase):
+    def test_incr(self):
+        assert self.backend.get_counter('foo') == 0
+        assert self.backend.incr('foo') == 1
+        assert self.backend.incr('foo') == 2
+        assert self.backend.get_counter('foo') == 2
+        assert self.backend.exists('foo') is False
+
+    def test_with_ttl_key(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', 123)
+        assert self.backend.with_ttl_key('freon:cache:other_ttl').get('foo') == ('bar', False)
+        assert backend.with_ttl_key('freon:cache:test_ttl') is self.backend
+        assert self.backend.exists('foo') is False
+        assert self.backend.get_by_ttl(200) == []
+        assert backend.get_lock('foo') is self.backend.get_lock('foo')
+
+    def test_ttl_keys_share_limits(self):
+        backend = MemoryBackend(max_entries=2)
+        other = backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', 123)
+        other.set('baz', 'qux', 123)
+        other.set('quux', 'corge', 123)
+        assert backend.exists('foo') is False
+        assert other.get_many(['baz', 'quux']) == [('qux', False), ('corge', False)]
+        assert backend.evictions == other.evictions == 1
+
+    def test_empty_indexes_of_ttl_keys_are_dropped(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', -123)
+        assert self.backend.reap() == ['foo']
+        assert 'freon:cache:other_ttl' not in self.backend.store
+        backend.set('foo', 'bar', -123)
+        assert backend.get_expired() == ['foo']
+
+    def test_reap_goes_through_backends_of_ttl_keys(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', -123)
+        backend.set('baz', 'qux', -12)
+        self.backend.set('quux', 'corge', -123)
+        assert self.backend.reap(limit=2) == ['quux', 'foo']
+        assert backend.reap() == ['baz']
+
+
+class TagTests(MemoryTestCase):
+    def test_invalidate_tags(self):
+        self.backend.set('foo', 'bar', 123, ['user:1'])
+        self.backend.set_many({'baz': ('qux', 123), 'quux': ('corge', 123)}, ['user:1', 'user:2'])
+        self.backend.set('grault', 'garply', 123, ['user:3'])
+        assert sorted(self.backend.invalidate_tags(['user:1'])) == ['baz', 'foo', 'quux']
+        for key in ('foo', 'baz', 'quux'):
+            self.assert_deleted(key)
+        assert self.backend.tags == {'user:3': {'grault'}}
+        assert self.backend.key_tags == {'grault': {'user:3'}}
+
+    def test_set_replaces_tags(self):
+        self.backend.set('foo', 'bar', 123, ['user:1'])
+        self.backend.set('foo', 'baz', 123, ['user:2'])
+        assert self.backend.invalidate_tags(['user:1']) == []
+        self.backend.set('foo', 'qux', 123)
+        assert self.backend.tags == {'user:2': {'foo'}}
+
+    def test_writes_without_tags_keep_them(self):
+        self.backend.set('foo', 'bar', -123, ['user:1'])
+        self.backend.set('foo', 'baz', 123)
+        self.backend.set_many({'foo': ('qux', 123)})
+        assert self.backend.invalidate_tags(['user:1']) == ['foo']
+        self.assert_deleted('foo')
+
+    def test_index_is_cleaned_up(self):
+        self.backend.set('foo', 'bar', -123, ['user:1'])
+        self.backend.set('baz', 'qux', 123, ['user:1'])
+        self.backend.reap()
+        assert self.backend.tags == {'user:1': {'baz'}}
+        self.backend.delete('baz')
+        assert self.backend.tags == {}
+        assert self.backend.key_tags == {}
+
+    def test_evicted_entries_are_untagged(self):
+        backend = MemoryBackend(max_entries=1)
+        backend.set('foo', 'bar', 123, ['user:1'])
+        backend.set('baz', 'qux', 123, ['user:1'])
+        assert backend.tags == {'user:1': {'baz'}}
@@ -2,11 +2,30 @@ import pytest
 import redis
 import time
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 from freon.backends.redis import RedisBackend
 
 from tests import BaseTestCase
 
 
+def read_messages(pubsub, count, timeout=1):
+    """
+    Returns the data of the next ``count`` messages, or of those received
+    within ``timeout`` seconds.
+    """
+
+    data, deadline = [], time.time() + timeout
+    while len(data) < count and time.time() < deadline:
+        message = pubsub.get_message(timeout=0.01)
+        if message:
+            data.append(message['data'])
+    return data
+
+
 class RedisTestCase(BaseTestCase):
     def setUp(self):
         self.backend = RedisBackend(db=15, ttl_key='freon:cache:test_ttl')
@@ -31,11 +50,11 @@ class RedisTestCase(BaseTestCase):
 class GetTests(RedisTestCase):
     def test_with_existing_expired_key(self):
         self.set_key('foo', 'bar', -123)
-        assert self.backend.get('foo') == ('bar', True)
+        assert self.backend.get('foo') == (b'bar', True)
 
     def test_with_existing_not_expired_key(self):
         self.set_key('foo', 'bar', 123)
-        assert self.backend.get('foo') == ('bar', False)
+        assert self.backend.get('foo') == (b'bar', False)
 
     def test_with_not_existing_key(self):
         assert self.backend.get('foo') == (None, True)
@@ -46,6 +65,16 @@ class GetTests(RedisTestCase):
         assert len(response) == 2
 
 
+class GetManyTests(RedisTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar', -123)
+        self.set_key('baz', 'qux', 123)
+        assert self.backend.get_many(['foo', 'quux', 'baz']) == [(b'bar', True), (None, True), (b'qux', False)]
+
+    def test_with_no_keys(self):
+        assert self.backend.get_many([]) == []
+
+
 class SetTests(RedisTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar', 123)
@@ -60,6 +89,17 @@ class SetTests(RedisTestCase):
         assert self.backend.set('foo', 'baz', 1234) is True
 
 
+class SetManyTests(RedisTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar', 123)
+        self.backend.set_many({'foo': ('baz', 1234), 'qux': ('quux', 12)})
+        self.assert_set('foo', 'baz', 1234)
+        self.assert_set('qux', 'quux', 12)
+
+    def test_returns_true(self):
+        assert self.backend.set_many({'foo': ('bar', 1234)}) is True
+
+
 class DeleteTests(RedisTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar')
@@ -74,6 +114,19 @@ class DeleteTests(RedisTestCase):
         assert self.backend.delete('foo') is True
 
 
+class DeleteManyTests(RedisTestCase):
+    def test_with_existing_and_not_existing_keys(self):
+        self.set_key('foo', 'bar')
+        self.set_key('baz', 'qux')
+        self.backend.delete_many(['foo', 'baz', 'quux'])
+        self.assert_deleted('foo')
+        self.assert_deleted('baz')
+        self.assert_deleted('quux')
+
+    def test_returns_true(self):
+        assert self.backend.delete_many(['foo']) is True
+
+
 class ExistsTests(RedisTestCase):
     def test_with_existing_key(self):
         self.set_key('foo', 'bar')
@@ -89,6 +142,10 @@ class GetExpiredTests(RedisTestCase):
         self.set_key('bar', 'bar', 123)
         assert self.backend.get_expired() == ['foo']
 
+    def test_with_scores(self):
+        self.client.zadd('freon:cache:test_ttl', {'foo': 123})
+        assert self.backend.get_expired(with_scores=True) == [('foo', 123.0)]
+
 
 class GetByTtl(RedisTestCase):
     def test_with_expired_and_not_expired_key(self):
@@ -98,3 +155,337 @@ class GetByTtl(RedisTestCase):
         # Python's time() precision is different than Redis' so we want to make
         # sure we include the right keys in the response
         assert self.backend.get_by_ttl(124) == ['bar']
+
+    def test_with_scores(self):
+        self.set_key('foo', 'foo', 123)
+        [(key, expires_at)] = self.backend.get_by_ttl(124, with_scores=True)
+        assert (key, expires_at) == ('foo', pytest.approx(time.time() + 123))
+
+
+class IterTests(RedisTestCase):
+    def setUp(self):
+        super(IterTests, self).setUp()
+        self.keys = ['key%02d' % i for i in range(25)]
+        for i, key in enumerate(self.keys):
+            self.client.zadd('freon:cache:test_ttl', {key: 1000 + i // 4})
+        self.set_key('later', 'foo', 123)
+
+    def test_iter_expired_pages_through_ties(self):
+        assert list(self.backend.iter_expired(batch_size=3)) == self.keys
+        assert list(self.backend.iter_expired(batch_size=25)) == self.keys
+
+    def test_iter_by_ttl(self):
+        assert list(self.backend.iter_by_ttl(124, batch_size=3)) == ['later']
+
+    def test_one_script_call_per_page(self):
+        with mock.patch.object(self.backend, 'run_script',
+                               wraps=self.backend.run_script) as run_script:
+            keys = list(self.backend.iter_expired(batch_size=10, with_scores=True))
+        assert keys == self.backend.get_expired(with_scores=True)
+        assert [call[1]['args'][3:] for call in run_script.call_args_list] == [
+            [], ['key09', '1002.0', 2], ['key19', '1004.0', 4]]
+
+    def test_resumes_when_last_key_is_gone(self):
+        keys = self.backend.iter_expired(batch_size=3)
+        assert [next(keys) for _ in range(3)] == self.keys[:3]
+        self.client.zrem('freon:cache:test_ttl', 'key02')
+        assert list(keys) == self.keys[3:]
+
+
+class BinaryValuesTests(RedisTestCase):
+    def test_values_are_returned_as_bytes(self):
+        value = b'\x80\xff\x00'
+        self.backend.set('foo', value, 123)
+        assert self.backend.get('foo') == (value, False)
+        assert self.backend.get_many(['foo']) == [(value, False)]
+
+    def test_binary_serializers_round_trip(self):
+        from freon.cache import Cache
+
+        for serializer in ['pickle', 'msgpack', 'json+zlib']:
+            cache = Cache(backend='redis', serializer=serializer, db=15,
+                          ttl_key='freon:cache:test_ttl')
+            value = {'foo': ['bar'] * 1000}
+            assert cache.set(serializer, value) == value
+            assert cache.get(serializer) == value
+
+    def test_keys_are_returned_as_strings(self):
+        self.set_key('foo', 'bar', -123)
+        assert self.backend.get_expired() == ['foo']
+        assert self.backend.reap() == ['foo']
+
+
+class ReapTests(RedisTestCase):
+    def test_deletes_expired_keys(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        assert self.backend.reap() == ['foo']
+        self.assert_deleted('foo')
+        assert self.backend.exists('bar') is True
+
+    def test_respects_grace_period(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', -12)
+        assert self.backend.reap(grace=60) == ['foo']
+        assert self.backend.exists('bar') is True
+
+    def test_respects_limit(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', -12)
+        assert self.backend.reap(limit=1) == ['foo']
+        assert self.backend.reap(limit=1) == ['bar']
+        assert self.backend.reap(limit=1) == []
+
+    def test_cleans_up_keys_deleted_outside_freon(self):
+        self.set_key('foo', 'foo', -123)
+        self.client.delete('foo')
+        assert self.backend.reap() == ['foo']
+        self.assert_deleted('foo')
+
+
+class LeaseTests(RedisTestCase):
+    def test_get_or_lease_with_not_expired_key_returns_no_lease(self):
+        self.set_key('foo', 'bar', 123)
+        assert self.backend.get_or_lease('foo') == (b'bar', False, None)
+        assert self.client.exists('foo_lock') == 0
+
+    def test_get_or_lease_with_expired_key_returns_lease(self):
+        self.set_key('foo', 'bar', -123)
+        value, expired, lease = self.backend.get_or_lease('foo')
+        assert (value, expired) == (b'bar', True)
+        assert self.client.get('foo_lock') == lease
+
+    def test_get_or_lease_with_not_existing_key_returns_lease(self):
+        value, expired, lease = self.backend.get_or_lease('foo')
+        assert (value, expired) == (None, True)
+        assert lease is not None
+
+    def test_get_or_lease_hands_out_one_lease_at_a_time(self):
+        assert self.backend.get_or_lease('foo')[2] is not None
+        assert self.backend.get_or_lease('foo') == (None, True, None)
+
+    def test_lease_expires_with_lock_timeout(self):
+        self.backend.get_or_lease('foo')
+        assert self.client.pttl('foo_lock') == pytest.approx(1000, abs=100)
+
+    def test_lease_is_compatible_with_lock(self):
+        self.backend.get_or_lease('foo')
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+
+    def test_set_with_lease_sets_key_and_releases_lease(self):
+        lease = self.backend.get_or_lease('foo')[2]
+        assert self.backend.set_with_lease('foo', 'bar', 123, lease) is True
+        self.assert_set('foo', 'bar', 123)
+        assert self.client.exists('foo_lock') == 0
+
+    def test_set_with_lost_lease_does_nothing(self):
+        self.backend.get_or_lease('foo')
+        assert self.backend.set_with_lease('foo', 'bar', 123, 'qux') is False
+        self.assert_deleted('foo')
+
+    def test_set_with_expired_lease(self):
+        lease = self.backend.get_or_lease('foo')[2]
+        self.client.delete('foo_lock')
+        assert self.backend.set_with_lease('foo', 'bar', 123, lease) is True
+        self.assert_set('foo', 'bar', 123)
+
+    def test_set_with_lease_taken_over(self):
+        lease = self.backend.get_or_lease('foo')[2]
+        self.client.delete('foo_lock')
+        self.backend.get_or_lease('foo')
+        assert self.backend.set_with_lease('foo', 'bar', 123, lease) is False
+        self.assert_deleted('foo')
+
+    def test_release_lease(self):
+        lease = self.backend.get_or_lease('foo')[2]
+        assert self.backend.release_lease('foo', 'qux') is False
+        assert self.backend.release_lease('foo', lease) is True
+        assert self.client.exists('foo_lock') == 0
+
+
+class InvalidationTests(RedisTestCase):
+    def setUp(self):
+        super(InvalidationTests, self).setUp()
+        self.backend = RedisBackend(db=15, ttl_key='freon:cache:test_ttl',
+                                    invalidation_channel='freon:cache:test_invalidations')
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe('freon:cache:test_invalidations')
+
+    def tearDown(self):
+        self.pubsub.close()
+        super(InvalidationTests, self).tearDown()
+
+    def test_writes_are_published(self):
+        self.backend.set('foo', 'bar', 123)
+        self.backend.set_many({'baz': ('qux', 123)})
+        assert read_messages(self.pubsub, 2) == ['foo', 'baz']
+
+    def test_deletes_are_published(self):
+        self.backend.delete('foo')
+        self.backend.delete_many(['bar', 'baz'])
+        assert read_messages(self.pubsub, 3) == ['foo', 'bar', 'baz']
+
+    def test_origin_is_published(self):
+        backend = RedisBackend(db=15, ttl_key='freon:cache:test_ttl',
+                               invalidation_channel='freon:cache:test_invalidations',
+                               invalidation_origin='abc')
+        backend.set('foo', 'bar', 123)
+        pipeline = backend.pipeline()
+        pipeline.delete('foo')
+        pipeline.execute()
+        assert read_messages(self.pubsub, 2) == ['abc\0foo', 'abc\0foo']
+
+    def test_nothing_is_published_by_default(self):
+        RedisBackend(db=15, ttl_key='freon:cache:test_ttl').set('foo', 'bar', 123)
+        assert read_messages(self.pubsub, 1, timeout=0.1) == []
+
+
+class PipelineTests(RedisTestCase):
+    def test_sends_calls_in_a_single_round_trip(self):
+        self.set_key('foo', 'bar', 123)
+        pipeline = self.backend.pipeline()
+        with mock.patch.object(self.backend.client, 'execute_command') as execute_command:
+            pipeline.get('foo')
+            pipeline.set('baz', 'qux', 123)
+            pipeline.get_many([])
+            pipeline.exists('baz')
+            execute_command.assert_not_called()
+        assert pipeline.execute() == [(b'bar', False), True, [], True]
+        self.assert_set('baz', 'qux', 123)
+
+    def test_calls_return_nothing_until_executed(self):
+        pipeline = self.backend.pipeline()
+        assert pipeline.set('foo', 'bar', 123) is None
+        self.assert_deleted('foo')
+        pipeline.execute()
+        self.assert_set('foo', 'bar', 123)
+
+    def test_with_cache(self):
+        from freon.cache import Cache
+
+        cache = Cache(backend='redis', db=15, ttl_key='freon:cache:test_ttl')
+        with cache.pipeline() as pipeline:
+            pipeline.set('foo', {'bar': 1})
+            pipeline.get('foo')
+            pipeline.get_many(['foo', 'baz'])
+        assert pipeline.results == [{'bar': 1}, {'bar': 1}, {'foo': {'bar': 1}}]
+
+    def test_get_lock_goes_through_the_backend(self):
+        lock = self.backend.pipeline().get_lock('foo')
+        assert lock.acquire(blocking=False) is True
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+        lock.release()
+
+
+class ClientTests(RedisTestCase):
+    def test_with_injected_client(self):
+        client = redis.StrictRedis(db=15)
+        backend = RedisBackend(client=client, ttl_key='freon:cache:test_ttl')
+        assert backend.client is client
+        backend.set('foo', 'bar', 123)
+        self.assert_set('foo', 'bar', 123)
+
+    def test_passes_connection_arguments(self):
+        pool = redis.ConnectionPool(db=15)
+        with mock.patch('redis.StrictRedis') as mock_client:
+            RedisBackend(connection_pool=pool, socket_timeout=0.1)
+        assert mock_client.call_args[1]['connection_pool'] is pool
+        assert mock_client.call_args[1]['socket_timeout'] == 0.1
+
+    def test_scripts_are_registered_once_per_client(self):
+        client = redis.StrictRedis(db=15)
+        backends = [RedisBackend(client=client) for _ in range(2)]
+        assert backends[0]._scripts is backends[1]._scripts
+
+    def test_scripts_are_read_once(self):
+        with mock.patch('freon.backends.redis.open') as mock_open:
+            RedisBackend(db=15)
+            mock_open.assert_not_called()
+
+
+class CounterTests(RedisTestCase):
+    def test_incr(self):
+        assert self.backend.get_counter('foo') == 0
+        assert self.backend.incr('foo') == 1
+        assert self.backend.incr('foo') == 2
+        assert self.backend.get_counter('foo') == 2
+
+    def test_with_ttl_key(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', 123)
+        assert backend.client is self.backend.client
+        assert self.client.zscore('freon:cache:other_ttl', 'foo') is not None
+        assert self.client.zscore('freon:cache:test_ttl', 'foo') is None
+        assert self.backend.ttl_key == 'freon:cache:test_ttl'
+
+    def test_reap_goes_through_sorted_sets_of_ttl_keys(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', -123)
+        backend.set_many({'baz': ('qux', -12)})
+        self.backend.set('quux', 'corge', -123)
+        assert self.client.smembers('freon:cache:test_ttl#indexes') == {'freon:cache:other_ttl'}
+        assert self.backend.reap(limit=2) == ['quux', 'foo']
+        assert backend.reap() == ['baz']
+        backend.set('foo', 'bar', -123)
+        self.backend.set('quux', 'corge', -123)
+        assert backend.reap() == ['foo']
+        assert self.client.exists('quux') == 1
+
+
+class TagTests(RedisTestCase):
+    def test_set_indexes_tags(self):
+        self.backend.set('foo', 'bar', 123, ['user:1', 'user:2'])
+        self.assert_set('foo', 'bar', 123)
+        assert self.client.smembers('freon:cache:tag:user:1') == {'foo'}
+        assert self.client.smembers('freon:cache:tags:foo') == {'user:1', 'user:2'}
+
+    def test_set_replaces_tags(self):
+        self.backend.set('foo', 'bar', 123, ['user:1'])
+        self.backend.set('foo', 'baz', 123, ['user:2'])
+        assert self.client.exists('freon:cache:tag:user:1') == 0
+        self.backend.set('foo', 'qux', 123)
+        assert self.client.smembers('freon:cache:tag:user:2') == {'foo'}
+
+    def test_writes_without_tags_keep_them(self):
+        self.backend.set('foo', 'bar', -123, ['user:1'])
+        _, _, lease = self.backend.get_or_lease('foo')
+        self.backend.set_with_lease('foo', 'baz', 123, lease)
+        self.backend.set('foo', 'qux', 123)
+        self.backend.set_many({'foo': ('quux', 123)})
+        assert self.backend.invalidate_tags(['user:1']) == ['foo']
+        self.assert_deleted('foo')
+
+    def test_invalidate_tags(self):
+        self.backend.set('foo', 'bar', 123, ['user:1'])
+        self.backend.set_many({'baz': ('qux', 123), 'quux': ('corge', 123)}, ['user:1', 'user:2'])
+        self.backend.set('grault', 'garply', 123, ['user:3'])
+        assert sorted(self.backend.invalidate_tags(['user:1'])) == ['baz', 'foo', 'quux']
+        for key in ('foo', 'baz', 'quux'):
+            self.assert_deleted(key)
+        assert sorted(self.client.keys('freon:cache:tag*')) == [
+            'freon:cache:tag:user:3', 'freon:cache:tags:grault']
+        assert self.backend.invalidate_tags(['user:1', 'user:2']) == []
+
+    def test_index_is_cleaned_up(self):
+        self.backend.set('foo', 'bar', -123, ['user:1'])
+        self.backend.set('baz', 'qux', 123, ['user:1'])
+        self.backend.reap()
+        assert self.client.smembers('freon:cache:tag:user:1') == {'baz'}
+        self.backend.delete('baz')
+        assert self.client.keys('freon:cache:tag*') == []
+
+    def test_tag_prefix(self):
+        backend = RedisBackend(db=15, ttl_key='freon:cache:test_ttl', tag_prefix='app')
+        backend.set('foo', 'bar', 123, ['user:1'])
+        assert self.client.smembers('app:tag:user:1') == {'foo'}
+        assert backend.pipeline().tag_prefix == 'app'
+
+    def test_invalidations_are_published(self):
+        backend = RedisBackend(db=15, ttl_key='freon:cache:test_ttl',
+                               invalidation_channel='freon:cache:test_invalidations')
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe('freon:cache:test_invalidations')
+        backend.set('foo', 'bar', 123, ['user:1'])
+        backend.invalidate_tags(['user:1'])
+        assert read_messages(pubsub, 2) == ['foo', 'foo']
+        pubsub.close()
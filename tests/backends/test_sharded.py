@@ -0,0 +1,201 @@
+import os
+import time
+
+import redis
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freon.backends.sharded import HashRing, ShardedBackend
+
+from tests import BaseTestCase
+
+
+def parse_nodes(spec):
+    nodes = []
+    for node in spec.split(','):
+        address, db = node.split('/')
+        host, port = address.split(':')
+        nodes.append({'host': host, 'port': int(port), 'db': int(db)})
+    return nodes
+
+
+# Point this at several redis-server processes to test against real nodes
+NODES = parse_nodes(os.environ.get('FREON_SHARDED_NODES',
+                                   'localhost:6379/13,localhost:6379/14,localhost:6379/15'))
+
+
+class HashRingTests(BaseTestCase):
+    def test_spreads_keys_evenly(self):
+        ring = HashRing(['a', 'b', 'c'])
+        counts = [0, 0, 0]
+        for i in range(3000):
+            counts[ring.get_node('key%s' % i)] += 1
+        assert min(counts) > 800
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        before, after = HashRing(['a', 'b']), HashRing(['a', 'b', 'c'])
+        for i in range(1000):
+            key = 'key%s' % i
+            assert after.get_node(key) in (before.get_node(key), 2)
+
+    def test_does_not_depend_on_node_order(self):
+        ring, reversed_ring = HashRing(['a', 'b']), HashRing(['b', 'a'])
+        for i in range(100):
+            key = 'key%s' % i
+            assert ring.get_node(key) == 1 - reversed_ring.get_node(key)
+
+
+class ShardedTestCase(BaseTestCase):
+    def setUp(self):
+        self.backend = ShardedBackend(NODES, ttl_key='freon:cache:test_ttl')
+        self.clients = [redis.StrictRedis(**node) for node in NODES]
+        self.keys = ['key%s' % i for i in range(30)]
+
+    def tearDown(self):
+        for client in self.clients:
+            client.flushdb()
+
+    def client_for(self, key):
+        return self.clients[self.backend.ring.get_node(key)]
+
+    def set_key(self, key, value, ttl=0):
+        client = self.client_for(key)
+        client.set(key, value)
+        client.zadd('freon:cache:test_ttl', {key: time.time() + ttl})
+
+
+class RoutingTests(ShardedTestCase):
+    def test_keys_are_spread_across_nodes(self):
+        for key in self.keys:
+            self.backend.set(key, 'foo', 123)
+        assert all(client.dbsize() > 0 for client in self.clients)
+
+    def test_keys_and_expiry_times_live_on_the_same_node(self):
+        for key in self.keys:
+            self.backend.set(key, 'foo', 123)
+            client = self.client_for(key)
+            assert client.get(key) == b'foo'
+            assert client.zscore('freon:cache:test_ttl', key) is not None
+
+    def test_get(self):
+        self.set_key('foo', 'bar', 123)
+        assert self.backend.get('foo') == (b'bar', False)
+
+    def test_delete(self):
+        self.set_key('foo', 'bar', 123)
+        assert self.backend.delete('foo') is True
+        assert self.backend.exists('foo') is False
+
+    def test_leases(self):
+        value, expired, lease = self.backend.get_or_lease('foo')
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+        assert self.backend.set_with_lease('foo', 'bar', 123, lease) is True
+        assert self.backend.get('foo') == (b'bar', False)
+
+    def test_counters(self):
+        assert self.backend.incr('foo') == 1
+        assert self.client_for('foo').get('foo') == b'1'
+        assert self.backend.get_counter('foo') == 1
+
+    def test_with_ttl_key(self):
+        backend = self.backend.with_ttl_key('freon:cache:other_ttl')
+        backend.set('foo', 'bar', 123)
+        assert backend.ring is self.backend.ring
+        assert self.client_for('foo').zscore('freon:cache:other_ttl', 'foo') is not None
+        assert self.client_for('foo').zscore('freon:cache:test_ttl', 'foo') is None
+
+
+class MultiKeyTests(ShardedTestCase):
+    def test_get_many_keeps_order(self):
+        for i, key in enumerate(self.keys[::2]):
+            self.set_key(key, str(i), 123)
+        expected = [(str(i // 2).encode('utf-8'), False) if i % 2 == 0 else (None, True)
+                    for i in range(len(self.keys))]
+        assert self.backend.get_many(self.keys) == expected
+
+    def test_set_many(self):
+        assert self.backend.set_many(dict((key, (key, 123)) for key in self.keys)) is True
+        assert self.backend.get_many(self.keys) == [(key.encode('utf-8'), False)
+                                                    for key in self.keys]
+
+    def test_delete_many(self):
+        for key in self.keys:
+            self.set_key(key, 'foo', 123)
+        assert self.backend.delete_many(self.keys) is True
+        assert not any(self.backend.exists(key) for key in self.keys)
+
+
+class FanOutTests(ShardedTestCase):
+    def test_get_expired_merges_nodes_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.set_key(key, 'foo', -100 + i)
+        self.set_key('fresh', 'foo', 123)
+        assert self.backend.get_expired() == self.keys
+
+    def test_get_by_ttl_merges_nodes_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.set_key(key, 'foo', 100 + i)
+        self.set_key('later', 'foo', 1000)
+        assert self.backend.get_by_ttl(200) == self.keys
+        scored = self.backend.get_by_ttl(200, with_scores=True)
+        assert [key for key, _ in scored] == self.keys
+        assert [score for _, score in scored] == sorted(score for _, score in scored)
+        assert [key for key, _ in self.backend.get_expired(with_scores=True)] == []
+
+    def test_iter_expired_merges_nodes_by_expiry_time(self):
+        for i, key in enumerate(self.keys):
+            self.set_key(key, 'foo', -100 + i)
+        self.set_key('fresh', 'foo', 123)
+        assert list(self.backend.iter_expired(batch_size=4)) == self.keys
+        assert list(self.backend.iter_by_ttl(124, batch_size=4)) == ['fresh']
+
+
+    def test_reap(self):
+        for key in self.keys:
+            self.set_key(key, 'foo', -123)
+        assert sorted(self.backend.reap()) == sorted(self.keys)
+        assert not any(self.backend.exists(key) for key in self.keys)
+
+    def test_invalidate_tags(self):
+        self.backend.set_many(dict((key, ('foo', 123)) for key in self.keys), ['user:1'])
+        assert sorted(self.backend.invalidate_tags(['user:1'])) == sorted(self.keys)
+        assert not any(self.backend.exists(key) for key in self.keys)
+
+    def test_subscribe_listens_on_every_node(self):
+        listeners = self.backend.subscribe('freon:cache:test_invalidations', lambda data: None)
+        assert len(listeners) == len(NODES)
+        listeners.stop()
+
+
+class PipelineTests(ShardedTestCase):
+    def test_sends_a_single_round_trip_per_node(self):
+        for key in self.keys[:10]:
+            self.set_key(key, 'foo', 123)
+        pipeline = self.backend.pipeline()
+        pipeline.get(self.keys[0])
+        pipeline.get_many(self.keys[:10] + ['missing'])
+        pipeline.set_many(dict((key, ('bar', 123)) for key in self.keys[10:]))
+        pipeline.delete(self.keys[1])
+        pipeline.exists(self.keys[1])
+        pipeline.delete_many([])
+
+        executes = []
+        for node in pipeline.pipelines.values():
+            node.execute = mock.Mock(side_effect=node.execute)
+            executes.append(node.execute)
+        results = pipeline.execute()
+
+        assert len(executes) == len(NODES)
+        assert all(execute.call_count == 1 for execute in executes)
+        assert results == [(b'foo', False), [(b'foo', False)] * 10 + [(None, True)], True,
+                           True, False, True]
+        assert self.backend.get_many(self.keys[10:]) == [(b'bar', False)] * 20
+
+    def test_get_lock_goes_through_the_backend(self):
+        lock = self.backend.pipeline().get_lock('foo')
+        assert lock.acquire(blocking=False) is True
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+        lock.release()
@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import pytest
+import shutil
+import tempfile
+import time
+
+from freon.backends.shared_memory import SharedMemoryBackend
+
+from tests import BaseTestCase
+
+
+def set_in_other_process(path, key, value):
+    SharedMemoryBackend(path).set(key, value, 123)
+
+
+def hold_lock(path, key, locked, release):
+    lock = SharedMemoryBackend(path).get_lock(key)
+    lock.acquire()
+    locked.set()
+    release.wait(5)
+    lock.release()
+
+
+class SharedMemoryTestCase(BaseTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache')
+        self.backend = SharedMemoryBackend(self.path, slots=64, slot_size=128)
+        self.context = multiprocessing.get_context('fork')
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.directory)
+
+
+class GetTests(SharedMemoryTestCase):
+    def test_with_existing_expired_key(self):
+        self.backend.set('foo', 'bar', -123)
+        assert self.backend.get('foo') == ('bar', True)
+
+    def test_with_existing_not_expired_key(self):
+        self.backend.set('foo', 'bar', 123)
+        assert self.backend.get('foo') == ('bar', False)
+
+    def test_with_not_existing_key(self):
+        assert self.backend.get('foo') == (None, True)
+
+    def test_keeps_bytes_and_strings_apart(self):
+        self.backend.set('foo', b'\x80bar', 123)
+        self.backend.set('baz', u'qu\xe9x', 123)
+        assert self.backend.get('foo') == (b'\x80bar', False)
+        assert self.backend.get('baz') == (u'qu\xe9x', False)
+
+    def test_get_many(self):
+        self.backend.set('foo', 'bar', 123)
+        assert self.backend.get_many(['foo', 'baz']) == [('bar', False), (None, True)]
+
+
+class SetTests(SharedMemoryTestCase):
+    def test_overwrites_existing_key(self):
+        self.backend.set('foo', 'bar', 123)
+        assert self.backend.set('foo', 'baz', -123) is True
+        assert self.backend.get('foo') == ('baz', True)
+
+    def test_does_not_cache_entries_larger_than_a_slot(self):
+        assert self.backend.set('foo', 'x' * 128, 123) is False
+        assert self.backend.exists('foo') is False
+
+    def test_set_many(self):
+        assert self.backend.set_many({'foo': ('bar', 123), 'baz': ('qux', -123)}) is True
+        assert self.backend.get_many(['foo', 'baz']) == [('bar', False), ('qux', True)]
+
+    def test_evicts_closest_to_expiring_when_full(self):
+        backend = SharedMemoryBackend(os.path.join(self.directory, 'small'),
+                                      slots=4, slot_size=64, max_probes=4)
+        for i in range(4):
+            backend.set('key%s' % i, 'foo', 100 + i)
+        backend.set('key4', 'foo', 123)
+        assert backend.evictions == 1
+        assert backend.exists('key0') is False
+        assert all(backend.exists('key%s' % i) for i in range(1, 5))
+        backend.close()
+
+
+class DeleteTests(SharedMemoryTestCase):
+    def test_delete(self):
+        self.backend.set('foo', 'bar', 123)
+        assert self.backend.delete('foo') is True
+        assert self.backend.exists('foo') is False
+
+    def test_keys_past_deleted_slots_are_still_found(self):
+        backend = SharedMemoryBackend(os.path.join(self.directory, 'small'),
+                                      slots=4, slot_size=64, max_probes=4)
+        for i in range(4):
+            backend.set('key%s' % i, 'foo', 123)
+        backend.delete_many(['key0', 'key1', 'key2'])
+        assert backend.get('key3') == ('foo', False)
+        backend.set('key3', 'bar', 123)
+        assert backend.get('key3') == ('bar', False)
+        backend.close()
+
+
+class ExpiryTests(SharedMemoryTestCase):
+    def test_get_expired(self):
+        self.backend.set('foo', 'foo', -12)
+        self.backend.set('bar', 'bar', -123)
+        self.backend.set('baz', 'baz', 123)
+        assert self.backend.get_expired() == ['bar', 'foo']
+
+    def test_get_by_ttl(self):
+        self.backend.set('foo', 'foo', -123)
+        self.backend.set('bar', 'bar', 123)
+        self.backend.set('baz', 'baz', 1234)
+        assert self.backend.get_by_ttl(124) == ['bar']
+
+    def test_iter_by_ttl_with_scores(self):
+        self.backend.set('foo', 'foo', 123)
+        [(key, expires_at)] = self.backend.iter_by_ttl(124, with_scores=True)
+        assert key == 'foo'
+        assert expires_at == pytest.approx(time.time() + 123, abs=1)
+
+    def test_reap(self):
+        self.backend.set('foo', 'foo', -123)
+        self.backend.set('bar', 'bar', -12)
+        self.backend.set('baz', 'baz', 123)
+        assert self.backend.reap(limit=1) == ['foo']
+        assert self.backend.reap(grace=60) == []
+        assert self.backend.reap() == ['bar']
+        assert self.backend.exists('baz') is True
+
+
+class SharingTests(SharedMemoryTestCase):
+    def test_entries_are_shared_between_processes(self):
+        process = self.context.Process(target=set_in_other_process,
+                                       args=(self.path, 'foo', 'bar'))
+        process.start()
+        process.join()
+        assert self.backend.get('foo') == ('bar', False)
+
+    def test_existing_file_keeps_its_geometry(self):
+        backend = SharedMemoryBackend(self.path, slots=1024, slot_size=4096)
+        assert (backend.slots, backend.slot_size) == (64, 128)
+        backend.close()
+
+    def test_with_other_file(self):
+        path = os.path.join(self.directory, 'other')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 1024)
+        with pytest.raises(ValueError):
+            SharedMemoryBackend(path)
+
+
+class LockTests(SharedMemoryTestCase):
+    def test_locks_are_held_across_processes(self):
+        locked, release = self.context.Event(), self.context.Event()
+        process = self.context.Process(target=hold_lock, args=(self.path, 'foo', locked, release))
+        process.start()
+        locked.wait(5)
+
+        lock = self.backend.get_lock('foo')
+        assert lock.acquire(blocking=False) is False
+        assert self.backend.get_lock('bar').acquire(blocking=False) is True
+
+        release.set()
+        assert lock.acquire(blocking=True, blocking_timeout=5) is True
+        lock.release()
+        process.join()
+
+    def test_locks_are_held_across_threads(self):
+        lock = self.backend.get_lock('foo')
+        assert lock.acquire(blocking=False) is True
+        assert self.backend.get_lock('foo').acquire(blocking=False) is False
+        lock.release()
+        assert self.backend.get_lock('foo').acquire(blocking=False) is True
+
+    def test_waiting_times_out(self):
+        lock = self.backend.get_lock('foo')
+        lock.acquire()
+        start = time.time()
+        assert self.backend.get_lock('foo').acquire(blocking_timeout=0.05) is False
+        assert time.time() - start == pytest.approx(0.05, abs=0.05)
+
+
+class CacheTests(SharedMemoryTestCase):
+    def test_with_cache(self):
+        from freon.cache import Cache
+
+        cache = Cache(backend='shared_memory', path=self.path)
+        other = Cache(backend='shared_memory', path=self.path)
+        assert cache.get_or_set('foo', lambda: {'bar': 1}) == {'bar': 1}
+        assert other.get_or_set('foo', lambda: {'bar': 2}) == {'bar': 1}
@@ -0,0 +1,151 @@
+import os
+import pytest
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from freon.backends.sqlite import SqliteBackend
+
+from tests import BaseTestCase
+
+
+class SqliteTestCase(BaseTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+        self.backend = SqliteBackend(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def set_key(self, key, value, ttl=0):
+        self.backend.set(key, value, ttl)
+
+    def expires_at(self, key):
+        row = self.backend.connection.execute(
+            'SELECT expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+        return row and row[0]
+
+
+class GetTests(SqliteTestCase):
+    def test_with_existing_expired_key(self):
+        self.set_key('foo', 'bar', -123)
+        assert self.backend.get('foo') == ('bar', True)
+
+    def test_with_existing_not_expired_key(self):
+        self.set_key('foo', 'bar', 123)
+        assert self.backend.get('foo') == ('bar', False)
+
+    def test_with_not_existing_key(self):
+        assert self.backend.get('foo') == (None, True)
+
+    def test_keeps_bytes_and_strings_apart(self):
+        self.set_key('foo', b'\x80bar', 123)
+        self.set_key('baz', u'qu\xe9x', 123)
+        assert self.backend.get('foo') == (b'\x80bar', False)
+        assert self.backend.get('baz') == (u'qu\xe9x', False)
+
+    def test_get_many(self):
+        self.set_key('foo', 'bar', -123)
+        self.set_key('baz', 'qux', 123)
+        assert self.backend.get_many(['foo', 'quux', 'baz']) == [('bar', True), (None, True), ('qux', False)]
+
+    def test_get_many_with_more_keys_than_a_statement_takes(self):
+        keys = ['key%s' % i for i in range(1200)]
+        self.backend.set_many(dict((key, (key, 123)) for key in keys))
+        assert self.backend.get_many(keys) == [(key, False) for key in keys]
+
+
+class SetTests(SqliteTestCase):
+    def test_set(self):
+        assert self.backend.set('foo', 'bar', 123) is True
+        assert self.backend.get('foo') == ('bar', False)
+        assert self.expires_at('foo') == pytest.approx(time.time() + 123)
+
+    def test_overwrites_existing_key(self):
+        self.set_key('foo', 'bar', 123)
+        self.backend.set('foo', 'baz', -123)
+        assert self.backend.get('foo') == ('baz', True)
+
+    def test_set_many(self):
+        assert self.backend.set_many({'foo': ('bar', 12), 'baz': ('qux', 34)}) is True
+        assert self.expires_at('foo') == pytest.approx(time.time() + 12)
+        assert self.expires_at('baz') == pytest.approx(time.time() + 34)
+
+
+class DeleteTests(SqliteTestCase):
+    def test_delete(self):
+        self.set_key('foo', 'bar', 123)
+        assert self.backend.delete('foo') is True
+        assert self.backend.exists('foo') is False
+
+    def test_delete_many(self):
+        self.set_key('foo', 'bar', 123)
+        self.set_key('baz', 'qux', 123)
+        assert self.backend.delete_many(['foo', 'baz', 'quux']) is True
+        assert self.backend.get_many(['foo', 'baz']) == [(None, True), (None, True)]
+
+
+class ExpiryTests(SqliteTestCase):
+    def test_get_expired(self):
+        self.set_key('foo', 'foo', -12)
+        self.set_key('bar', 'bar', -123)
+        self.set_key('baz', 'baz', 123)
+        assert self.backend.get_expired() == ['bar', 'foo']
+
+    def test_get_by_ttl(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', 123)
+        self.set_key('baz', 'baz', 1234)
+        assert self.backend.get_by_ttl(124) == ['bar']
+
+    def test_reap(self):
+        self.set_key('foo', 'foo', -123)
+        self.set_key('bar', 'bar', -12)
+        self.set_key('baz', 'baz', 123)
+        assert self.backend.reap(limit=1) == ['foo']
+        assert self.backend.reap(grace=60) == []
+        assert self.backend.reap() == ['bar']
+        assert self.backend.exists('baz') is True
+
+    def test_iter_expired(self):
+        keys = ['key%02d' % i for i in range(25)]
+        for i, key in enumerate(keys):
+            self.set_key(key, key, -100 + i // 4)
+        self.set_key('later', 'foo', 123)
+        assert list(self.backend.iter_expired(batch_size=3)) == self.backend.get_expired()
+        assert list(self.backend.iter_by_ttl(124, batch_size=3)) == ['later']
+
+
+class PersistenceTests(SqliteTestCase):
+    def test_entries_survive_restarts(self):
+        self.set_key('foo', 'bar', 123)
+        assert SqliteBackend(self.path).get('foo') == ('bar', False)
+
+    def test_uses_wal_mode(self):
+        mode = sqlite3.connect(self.path).execute('PRAGMA journal_mode').fetchone()[0]
+        assert mode == 'wal'
+
+    def test_threads_get_their_own_connections(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.backend.connection))
+        thread.start()
+        thread.join()
+        assert connections[0] is not self.backend.connection
+
+    def test_with_cache(self):
+        from freon.cache import Cache
+
+        cache = Cache(backend='sqlite', path=self.path, serializer='pickle')
+        assert cache.set('foo', {'bar': 1}) == {'bar': 1}
+        assert Cache(backend='sqlite', path=self.path, serializer='pickle').get('foo') == {'bar': 1}
+
+
+class CounterTests(SqliteTestCase):
+    def test_incr(self):
+        assert self.backend.get_counter('foo') == 0
+        assert self.backend.incr('foo') == 1
+        assert self.backend.incr('foo') == 2
+        assert SqliteBackend(self.path).get_counter('foo') == 2
@@ -0,0 +1,283 @@
+import asyncio
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from . import BaseTestCase
+
+from freon.async_cache import AsyncCache
+from freon.backends.async_redis import AsyncRedisBackend
+from freon.serializers.msgpack import MsgpackSerializer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AsyncCacheTestCase(BaseTestCase):
+    def setUp(self):
+        self.cache = AsyncCache()
+        self.cache.backend = self.mock_backend = mock.create_autospec(AsyncRedisBackend)
+        self.cache.serializer = self.mock_serializer = mock.create_autospec(MsgpackSerializer)
+        self.mock_backend.supports_leases = False
+        self.mock_lock = self.mock_backend.get_lock.return_value = mock.AsyncMock()
+        self.mock_lock.acquire.return_value = True
+
+
+class GetTests(AsyncCacheTestCase):
+    def test_with_existing_key(self):
+        self.mock_backend.get.return_value = ('bar', True)
+        self.mock_serializer.loads.return_value = 'baz'
+        assert run(self.cache.get('foo')) == 'baz'
+        self.mock_serializer.loads.assert_called_once_with('bar')
+
+    def test_with_not_existing_key(self):
+        self.mock_backend.get.return_value = (None, True)
+        assert run(self.cache.get('foo')) is None
+
+
+class GetManyTests(AsyncCacheTestCase):
+    def test_returns_existing_keys(self):
+        self.mock_backend.get_many.return_value = [('bar', False), (None, True)]
+        self.mock_serializer.loads.side_effect = lambda value: value
+        assert run(self.cache.get_many(['foo', 'baz'])) == {'foo': 'bar'}
+
+
+class SetTests(AsyncCacheTestCase):
+    def test_returns_none_if_lock_not_acquired(self):
+        self.mock_lock.acquire.return_value = False
+        assert run(self.cache.set('foo', 'bar')) is None
+        self.mock_backend.set.assert_not_called()
+
+    def test_callable_value(self):
+        run(self.cache.set('foo', lambda: 'bar'))
+        self.mock_serializer.dumps.assert_called_once_with('bar')
+
+    def test_coroutine_value(self):
+        async def value():
+            return 'bar'
+
+        run(self.cache.set('foo', value))
+        self.mock_serializer.dumps.assert_called_once_with('bar')
+
+    def test_coroutine_ttl(self):
+        async def ttl(value):
+            return 123
+
+        self.mock_serializer.dumps.return_value = 'bar'
+        run(self.cache.set('foo', 'bar', ttl))
+        self.mock_backend.set.assert_called_once_with('foo', 'bar', 123)
+
+    def test_default_ttl(self):
+        self.cache.default_ttl = 123
+        run(self.cache.set('foo', 'bar'))
+        self.mock_backend.set.assert_called_once_with(mock.ANY, mock.ANY, 123)
+
+    def test_return_cached_value_if_successful(self):
+        self.mock_backend.set.return_value = True
+        assert run(self.cache.set('foo', 'bar')) == 'bar'
+
+    def test_lock_is_released(self):
+        run(self.cache.set('foo', 'bar'))
+        self.mock_lock.release.assert_awaited()
+
+
+class SetManyTests(AsyncCacheTestCase):
+    def test_coroutine_values(self):
+        async def value():
+            return 'bar'
+
+        self.mock_serializer.dumps.side_effect = lambda value: value
+        self.mock_backend.set_many.return_value = True
+        assert run(self.cache.set_many({'foo': value}, 123)) == {'foo': 'bar'}
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 123)})
+
+
+@mock.patch.object(AsyncCache, 'set')
+class GetOrSetTests(AsyncCacheTestCase):
+    def test_with_existing_expired_key_calls_set(self, mock_set):
+        self.mock_backend.get.return_value = ('bar', True)
+        run(self.cache.get_or_set('foo', 'baz'))
+        mock_set.assert_awaited_once_with('foo', 'baz', None)
+
+    def test_with_existing_expired_key_returns_old_cached_value_if_unsuccessful(self, mock_set):
+        self.mock_backend.get.return_value = ('bar', True)
+        self.mock_serializer.loads.return_value = 'qux'
+        mock_set.return_value = None
+        assert run(self.cache.get_or_set('foo', 'baz')) == 'qux'
+
+    def test_with_existing_not_expired_key_returns_cached_value(self, mock_set):
+        self.mock_backend.get.return_value = ('bar', False)
+        self.mock_serializer.loads.return_value = 'bar'
+        assert run(self.cache.get_or_set('foo', 'baz')) == 'bar'
+        mock_set.assert_not_called()
+
+    def test_with_not_existing_key_returns_new_cached_value(self, mock_set):
+        self.mock_backend.get.return_value = (None, True)
+        mock_set.return_value = 'baz'
+        assert run(self.cache.get_or_set('foo', 'baz')) == 'baz'
+
+
+class LeaseTests(AsyncCacheTestCase):
+    def setUp(self):
+        super(LeaseTests, self).setUp()
+        self.mock_backend.supports_leases = True
+        self.mock_serializer.dumps.side_effect = lambda value: value
+        self.mock_serializer.loads.side_effect = lambda value: value
+
+    def test_with_lease_sets_with_lease(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+        self.mock_backend.set_with_lease.return_value = True
+        assert run(self.cache.get_or_set('foo', 'baz', 123)) == 'baz'
+        self.mock_backend.set_with_lease.assert_awaited_once_with('foo', 'baz', 123, 'lease')
+        self.mock_backend.get_lock.assert_not_called()
+
+    def test_returns_value_if_lease_was_lost(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+        self.mock_backend.set_with_lease.return_value = False
+        assert run(self.cache.get_or_set('foo', 'baz', 123)) == 'baz'
+
+    def test_without_lease_returns_stale_value(self):
+        self.mock_backend.get_or_lease.return_value = ('bar', True, None)
+        assert run(self.cache.get_or_set('foo', 'baz')) == 'bar'
+        self.mock_backend.set_with_lease.assert_not_called()
+
+    def test_releases_lease_if_computing_fails(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+
+        async def fail():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            run(self.cache.get_or_set('foo', fail))
+        self.mock_backend.release_lease.assert_awaited_once_with('foo', 'lease')
+
+
+class DelegationTests(AsyncCacheTestCase):
+    def test_delete(self):
+        self.mock_backend.delete.return_value = True
+        assert run(self.cache.delete('foo')) is True
+
+    def test_delete_many(self):
+        run(self.cache.delete_many(['foo', 'bar']))
+        self.mock_backend.delete_many.assert_awaited_once_with(['foo', 'bar'])
+
+    def test_exists(self):
+        self.mock_backend.exists.return_value = False
+        assert run(self.cache.exists('foo')) is False
+
+    def test_get_expired(self):
+        self.mock_backend.get_expired.return_value = ['foo']
+        assert run(self.cache.get_expired()) == ['foo']
+
+    def test_get_by_ttl(self):
+        self.mock_backend.get_by_ttl.return_value = ['foo']
+        assert run(self.cache.get_by_ttl(123)) == ['foo']
+        self.mock_backend.get_by_ttl.assert_awaited_once_with(123)
+
+    def test_invalidate_tags(self):
+        self.mock_backend.invalidate_tags.return_value = ['foo']
+        assert run(self.cache.invalidate_tags(['user:1'])) == ['foo']
+        self.mock_backend.invalidate_tags.assert_awaited_once_with(['user:1'])
+
+    def test_set_with_tags(self):
+        cache = AsyncCache()
+
+        async def scenario():
+            await cache.set('foo', 'bar', tags=['user:1'])
+            await cache.set_many({'baz': 'qux'}, tags=['user:1'])
+            assert sorted(await cache.invalidate_tags(['user:1'])) == ['baz', 'foo']
+            assert await cache.get('foo') is None
+
+        run(scenario())
+
+
+class ReaperTests(AsyncCacheTestCase):
+    def test_keeps_going_after_errors(self):
+        self.mock_backend.reap.side_effect = [ConnectionError(), ['foo'], []]
+
+        async def scenario():
+            task = self.cache.start_reaper(interval=0.001, batch_size=10)
+            while self.mock_backend.reap.await_count < 3:
+                await asyncio.sleep(0.001)
+            task.cancel()
+
+        with self.assertLogs('freon.async_cache', 'ERROR'):
+            run(asyncio.wait_for(scenario(), 1))
+
+
+class PipelineTests(BaseTestCase):
+    def setUp(self):
+        self.cache = AsyncCache()
+
+    def test_results(self):
+        async def scenario():
+            await self.cache.set('baz', 'qux')
+            async with self.cache.pipeline() as pipeline:
+                pipeline.set('foo', lambda: 'bar')
+                pipeline.get('foo')
+                pipeline.set_many({'quux': 1}, ttl=123)
+                pipeline.get_many(['foo', 'baz', 'missing'])
+                pipeline.exists('baz')
+                pipeline.delete('baz')
+                pipeline.delete_many(['foo'])
+                assert await self.cache.exists('foo') is False
+            return pipeline.results
+
+        assert run(scenario()) == ['bar', 'bar', {'quux': 1}, {'foo': 'bar', 'baz': 'qux'},
+                                   True, True, True]
+
+    def test_does_not_execute_on_error(self):
+        async def scenario():
+            with pytest.raises(ValueError):
+                async with self.cache.pipeline() as pipeline:
+                    pipeline.set('foo', 'bar')
+                    raise ValueError()
+            return await self.cache.exists('foo')
+
+        assert run(scenario()) is False
+
+
+class LoadBackendTests(AsyncCacheTestCase):
+    def test_initialization(self):
+        from freon.backends.async_memory import AsyncMemoryBackend
+
+        backend = self.cache._load_backend('memory')
+        assert isinstance(backend, AsyncMemoryBackend) is True
+
+
+class SingleFlightTests(BaseTestCase):
+    def test_waiters_get_the_in_flight_value(self):
+        cache = AsyncCache(wait_timeout=1)
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'bar'
+
+        async def scenario():
+            return await asyncio.gather(*[cache.get_or_set('foo', produce) for _ in range(10)])
+
+        assert run(scenario()) == ['bar'] * 10
+        assert len(calls) == 1
+
+
+class StaleWhileRevalidateTests(BaseTestCase):
+    def test_returns_stale_value_and_refreshes_in_background(self):
+        cache = AsyncCache(stale_while_revalidate=True)
+        cache.backend.backend.set('foo', '"bar"', -123)
+
+        async def produce():
+            return 'baz'
+
+        async def scenario():
+            stale = await cache.get_or_set('foo', produce)
+            await asyncio.gather(*cache._refreshes.values())
+            return stale, await cache.get('foo')
+
+        assert run(scenario()) == ('bar', 'baz')
+        assert cache._refreshes == {}
@@ -2,10 +2,15 @@ try:
     from unittest import mock
 except ImportError:
     import mock
+import json
+import pytest
+import redis
+import threading
+import time
 
 from . import BaseTestCase
 
-from freon.cache import Cache
+from freon.cache import XFETCH_MARKER, Cache
 from freon.backends.redis import RedisBackend
 from freon.serializers.msgpack import MsgpackSerializer
 
@@ -15,6 +20,7 @@ class CacheTestCase(BaseTestCase):
         self.cache = Cache()
         self.cache.backend = self.mock_backend = mock.create_autospec(RedisBackend)
         self.cache.serializer = self.mock_serializer = mock.create_autospec(MsgpackSerializer)
+        self.mock_backend.supports_leases = False
 
 
 class GetTests(CacheTestCase):
@@ -40,6 +46,18 @@ class GetTests(CacheTestCase):
         self.mock_serializer.loads.assert_called_once_with('bar')
 
 
+class GetManyTests(CacheTestCase):
+    def test_fetches_all_keys_at_once(self):
+        self.mock_backend.get_many.return_value = [('bar', False), ('baz', True)]
+        self.cache.get_many(['foo', 'qux'])
+        self.mock_backend.get_many.assert_called_once_with(['foo', 'qux'])
+
+    def test_returns_existing_keys(self):
+        self.mock_backend.get_many.return_value = [('bar', False), (None, True), ('baz', True)]
+        self.mock_serializer.loads.side_effect = lambda value: value
+        assert self.cache.get_many(['foo', 'qux', 'quux']) == {'foo': 'bar', 'quux': 'baz'}
+
+
 class SetTests(CacheTestCase):
     def test_acquires_lock(self):
         self.cache.set('foo', 'bar')
@@ -100,6 +118,52 @@ class SetTests(CacheTestCase):
         self.cache.set('foo', 'bar')
         self.mock_backend.get_lock.return_value.release.assert_called()
 
+    def test_tags(self):
+        self.mock_backend.get_lock.return_value.acquire.return_value = True
+        self.mock_serializer.dumps.return_value = 'bar'
+        self.cache.set('foo', 'bar', 123, tags=('user:1',))
+        self.mock_backend.set.assert_called_once_with('foo', 'bar', 123, ['user:1'])
+
+
+class SetManyTests(CacheTestCase):
+    def setUp(self):
+        super(SetManyTests, self).setUp()
+        self.mock_serializer.dumps.side_effect = lambda value: value
+
+    def test_sets_all_keys_at_once(self):
+        self.cache.set_many({'foo': 'bar', 'baz': 'qux'}, 123)
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 123), 'baz': ('qux', 123)})
+
+    def test_callable_values(self):
+        self.cache.set_many({'foo': lambda: 'bar'}, 123)
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 123)})
+
+    def test_callable_ttl(self):
+        self.cache.set_many({'foo': 'bar', 'baz': 'quux'}, lambda value: len(value))
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 3), 'baz': ('quux', 4)})
+
+    def test_per_key_ttl(self):
+        self.cache.default_ttl = 123
+        self.cache.set_many({'foo': 'bar', 'baz': 'qux'}, {'foo': 1234})
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 1234), 'baz': ('qux', 123)})
+
+    def test_default_ttl(self):
+        self.cache.default_ttl = 123
+        self.cache.set_many({'foo': 'bar'})
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 123)})
+
+    def test_return_cached_values_if_successful(self):
+        self.mock_backend.set_many.return_value = True
+        assert self.cache.set_many({'foo': lambda: 'bar'}) == {'foo': 'bar'}
+
+    def test_return_empty_dict_if_unsuccessful(self):
+        self.mock_backend.set_many.return_value = False
+        assert self.cache.set_many({'foo': 'bar'}) == {}
+
+    def test_tags(self):
+        self.cache.set_many({'foo': 'bar'}, 123, tags=['user:1'])
+        self.mock_backend.set_many.assert_called_once_with({'foo': ('bar', 123)}, ['user:1'])
+
 
 @mock.patch.object(Cache, 'set')
 class GetOrSetTests(CacheTestCase):
@@ -146,6 +210,108 @@ class GetOrSetTests(CacheTestCase):
         assert self.cache.get_or_set('foo', 'baz') is None
 
 
+class LeaseTests(CacheTestCase):
+    def setUp(self):
+        super(LeaseTests, self).setUp()
+        self.mock_backend.supports_leases = True
+        self.mock_serializer.dumps.side_effect = lambda value: value
+        self.mock_serializer.loads.side_effect = lambda value: value
+
+    def test_with_not_expired_key_makes_a_single_call(self):
+        self.mock_backend.get_or_lease.return_value = ('bar', False, None)
+        assert self.cache.get_or_set('foo', 'baz') == 'bar'
+        self.mock_backend.get.assert_not_called()
+        self.mock_backend.get_lock.assert_not_called()
+
+    def test_with_lease_sets_with_lease(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+        self.mock_backend.set_with_lease.return_value = True
+        assert self.cache.get_or_set('foo', 'baz', 123) == 'baz'
+        self.mock_backend.set_with_lease.assert_called_once_with('foo', 'baz', 123, 'lease')
+        self.mock_backend.get_lock.assert_not_called()
+
+    def test_returns_value_if_lease_was_lost(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+        self.mock_backend.set_with_lease.return_value = False
+        assert self.cache.get_or_set('foo', 'baz', 123) == 'baz'
+
+    def test_without_lease_does_not_set(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, None)
+        assert self.cache.get_or_set('foo', 'baz') is None
+        self.mock_backend.set_with_lease.assert_not_called()
+        self.mock_backend.set.assert_not_called()
+
+    def test_without_lease_returns_stale_value(self):
+        self.mock_backend.get_or_lease.return_value = ('bar', True, None)
+        assert self.cache.get_or_set('foo', 'baz') == 'bar'
+        self.mock_backend.set_with_lease.assert_not_called()
+
+    def test_releases_lease_if_computing_fails(self):
+        self.mock_backend.get_or_lease.return_value = (None, True, 'lease')
+
+        def fail():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            self.cache.get_or_set('foo', fail)
+        self.mock_backend.release_lease.assert_called_once_with('foo', 'lease')
+
+    def test_refreshes_with_lease(self):
+        self.cache.stale_while_revalidate = True
+        self.mock_backend.get_or_lease.return_value = ('bar', True, 'lease')
+        self.mock_backend.set_with_lease.return_value = True
+        assert self.cache.get_or_set('foo', 'baz', 123) == 'bar'
+        self.cache._executor.shutdown()
+        self.mock_backend.set_with_lease.assert_called_once_with('foo', 'baz', 123, 'lease')
+
+    def test_releases_lease_if_refresh_is_not_scheduled(self):
+        self.cache.stale_while_revalidate = True
+        self.cache.max_refreshes = 0
+        self.mock_backend.get_or_lease.return_value = ('bar', True, 'lease')
+        assert self.cache.get_or_set('foo', 'baz') == 'bar'
+        self.mock_backend.release_lease.assert_called_once_with('foo', 'lease')
+
+
+class SingleFlightTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache(wait_timeout=1)
+        self.started, self.finish = threading.Event(), threading.Event()
+        self.calls = 0
+
+    def produce(self):
+        self.calls += 1
+        self.started.set()
+        self.finish.wait(1)
+        return 'bar'
+
+    def test_waiters_get_the_in_flight_value(self):
+        producer = threading.Thread(target=self.cache.get_or_set, args=('foo', self.produce))
+        producer.start()
+        self.started.wait(1)
+        threading.Timer(0.01, self.finish.set).start()
+
+        assert self.cache.get_or_set('foo', self.produce) == 'bar'
+        producer.join()
+        assert self.calls == 1
+
+    def test_waiters_give_up_after_timeout(self):
+        self.cache.wait_timeout = 0.01
+        producer = threading.Thread(target=self.cache.get_or_set, args=('foo', self.produce))
+        producer.start()
+        self.started.wait(1)
+
+        assert self.cache.get_or_set('foo', self.produce) is None
+        self.finish.set()
+        producer.join()
+
+    def test_does_not_wait_by_default(self):
+        self.cache.wait_timeout = None
+        lock = self.cache.backend.get_lock('foo')
+        lock.acquire()
+        assert self.cache.get_or_set('foo', 'bar') is None
+        lock.release()
+
+
 class DeleteTests(CacheTestCase):
     def test_deletes_key(self):
         self.cache.delete('foo')
@@ -156,6 +322,37 @@ class DeleteTests(CacheTestCase):
         assert self.cache.delete('foo') is True
 
 
+class DeleteManyTests(CacheTestCase):
+    def test_deletes_all_keys_at_once(self):
+        self.cache.delete_many(['foo', 'bar'])
+        self.mock_backend.delete_many.assert_called_once_with(['foo', 'bar'])
+
+    def test_returns_true(self):
+        self.mock_backend.delete_many.return_value = True
+        assert self.cache.delete_many(['foo', 'bar']) is True
+
+
+class InvalidateTagsTests(CacheTestCase):
+    def test_invalidates_all_tags_at_once(self):
+        self.mock_backend.invalidate_tags.return_value = ['foo']
+        assert self.cache.invalidate_tags(('user:1', 'user:2')) == ['foo']
+        self.mock_backend.invalidate_tags.assert_called_once_with(['user:1', 'user:2'])
+
+    def test_with_memory_backend(self):
+        cache = Cache()
+        cache.set('foo', 'bar', tags=['user:1'])
+        cache.set_many({'baz': 1, 'qux': 2}, tags=['user:2'])
+        assert sorted(cache.invalidate_tags(['user:1', 'user:2'])) == ['baz', 'foo', 'qux']
+        assert cache.get_many(['foo', 'baz', 'qux']) == {}
+
+    def test_refreshed_entries_keep_their_tags(self):
+        cache = Cache()
+        cache.set('foo', 'bar', ttl=-123, tags=['user:1'])
+        assert cache.get_or_set('foo', 'baz') == 'baz'
+        assert cache.invalidate_tags(['user:1']) == ['foo']
+        assert cache.get('foo') is None
+
+
 class ExistsTests(CacheTestCase):
     def test_checks_for_existence(self):
         self.cache.exists('foo')
@@ -190,6 +387,34 @@ class GetByTtl(CacheTestCase):
         assert self.cache.get_by_ttl(123) == ['foo', 'bar']
 
 
+class IterTests(CacheTestCase):
+    def test_iter_expired(self):
+        self.mock_backend.iter_expired.return_value = iter(['foo'])
+        assert list(self.cache.iter_expired(batch_size=10)) == ['foo']
+        self.mock_backend.iter_expired.assert_called_once_with(10)
+
+    def test_iter_by_ttl(self):
+        self.mock_backend.iter_by_ttl.return_value = iter(['foo'])
+        assert list(self.cache.iter_by_ttl(123)) == ['foo']
+        self.mock_backend.iter_by_ttl.assert_called_once_with(123, 1000)
+
+    def test_falls_back_to_full_lists(self):
+        from freon.backends.shared_memory import SharedMemoryBackend
+        backend = mock.Mock(spec=SharedMemoryBackend)
+        backend.get_expired.return_value = ['foo']
+        assert list(SharedMemoryBackend.iter_expired(backend)) == ['foo']
+
+
+class ReapTests(CacheTestCase):
+    def test_reaps_backend(self):
+        self.cache.reap(60, 10)
+        self.mock_backend.reap.assert_called_once_with(60, 10)
+
+    def test_returns_reaped_keys(self):
+        self.mock_backend.reap.return_value = ['foo']
+        assert self.cache.reap() == ['foo']
+
+
 class LoadBackendTests(CacheTestCase):
     def test_initialization(self):
         from freon.backends.memory import MemoryBackend
@@ -204,3 +429,214 @@ class LoadSerializerTests(CacheTestCase):
 
         serializer = self.cache._load_serializer('json')
         assert isinstance(serializer, JsonSerializer) is True
+
+    def test_with_underscored_name(self):
+        from freon.serializers.fast_json import FastJsonSerializer
+
+        serializer = self.cache._load_serializer('fast_json')
+        assert isinstance(serializer, FastJsonSerializer) is True
+
+    def test_with_compression(self):
+        from freon.serializers.compressed import CompressedSerializer, ZstdCompressor
+        from freon.serializers.msgpack import MsgpackSerializer
+
+        serializer = self.cache._load_serializer('msgpack+zstd')
+        assert isinstance(serializer, CompressedSerializer) is True
+        assert isinstance(serializer.serializer, MsgpackSerializer) is True
+        assert isinstance(serializer.compressor, ZstdCompressor) is True
+
+    def test_with_instance(self):
+        from freon.serializers.pickle import PickleSerializer
+
+        serializer = PickleSerializer()
+        assert self.cache._load_serializer(serializer) is serializer
+
+    def test_compressed_values_round_trip(self):
+        cache = Cache(serializer='json+zlib')
+        value = {'foo': ['bar'] * 1000}
+        assert cache.set('foo', value) == value
+        assert cache.get('foo') == value
+
+
+class ReturnStaleTests(CacheTestCase):
+    def test_get_returns_expired_entries_by_default(self):
+        self.mock_backend.get.return_value = ('bar', True)
+        self.mock_serializer.loads.return_value = 'bar'
+        assert self.cache.get('foo') == 'bar'
+
+    def test_get_skips_expired_entries(self):
+        self.cache.return_stale = False
+        self.mock_backend.get.return_value = ('bar', True)
+        assert self.cache.get('foo') is None
+
+    def test_get_many_skips_expired_entries(self):
+        self.cache.return_stale = False
+        self.mock_backend.get_many.return_value = [('bar', True), ('baz', False)]
+        self.mock_serializer.loads.side_effect = lambda value: value
+        assert self.cache.get_many(['foo', 'qux']) == {'qux': 'baz'}
+
+
+class StaleWhileRevalidateTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache(stale_while_revalidate=True)
+        self.cache.backend.set('foo', '"bar"', -123)
+        self.release = threading.Event()
+
+    def produce(self):
+        self.release.wait(1)
+        return 'baz'
+
+    def test_returns_stale_value_right_away(self):
+        assert self.cache.get_or_set('foo', self.produce) == 'bar'
+        self.release.set()
+
+    def test_refreshes_in_background(self):
+        self.cache.get_or_set('foo', self.produce)
+        self.release.set()
+        self.cache._executor.shutdown(wait=True)
+        assert self.cache.backend.get('foo') == ('"baz"', False)
+
+    def test_refreshes_each_key_once_at_a_time(self):
+        assert self.cache.refresh('foo', self.produce) is not None
+        assert self.cache.refresh('foo', self.produce) is None
+        self.release.set()
+        self.cache._executor.shutdown(wait=True)
+        assert self.cache._refreshes == set()
+
+    def test_bounds_pending_refreshes(self):
+        self.cache.max_refreshes = 1
+        assert self.cache.refresh('foo', self.produce) is not None
+        assert self.cache.refresh('bar', self.produce) is None
+        self.release.set()
+
+    def test_missing_entries_are_cached_inline(self):
+        assert self.cache.get_or_set('baz', 'qux') == 'qux'
+        assert self.cache._executor is None
+
+
+class EarlyRefreshTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache(early_refresh_beta=1)
+
+    def test_stores_compute_time_and_expiry_with_value(self):
+        self.cache.set('foo', lambda: time.sleep(0.01) or 'bar', 123)
+        marker, value, delta, expires_at = json.loads(self.cache.backend.get('foo')[0])
+        assert marker == XFETCH_MARKER
+        assert value == 'bar'
+        assert delta >= 0.01
+        assert expires_at == pytest.approx(time.time() + 123, abs=1)
+
+    def test_reads_unwrap_values(self):
+        self.cache.set('foo', 'bar')
+        self.cache.set_many({'baz': 'qux'})
+        assert self.cache.get('foo') == 'bar'
+        assert self.cache.get_many(['baz']) == {'baz': 'qux'}
+        assert self.cache.get_or_set('foo', 'quux') == 'bar'
+
+    def test_refreshes_ahead_of_expiry_for_slow_values(self):
+        self.cache.backend.set('foo', json.dumps([XFETCH_MARKER, 'bar', 10 ** 9, time.time() + 1]), 123)
+        assert self.cache.get_or_set('foo', 'baz') == 'baz'
+
+    def test_does_not_refresh_far_from_expiry(self):
+        self.cache.backend.set('foo', json.dumps([XFETCH_MARKER, 'bar', 0.001, time.time() + 1000]), 1000)
+        assert self.cache.get_or_set('foo', 'baz') == 'bar'
+
+    def plain_cache(self):
+        cache = Cache()
+        cache.backend = self.cache.backend
+        return cache
+
+    def test_reads_entries_stored_without_xfetch(self):
+        for value in ['bar', {'baz': 1}, ['qux', 1, 2], ['qux', 1, 2, 3]]:
+            self.plain_cache().set('foo', value)
+            assert self.cache.get('foo') == value
+            assert self.cache.get_many(['foo']) == {'foo': value}
+            assert self.cache.get_or_set('foo', 'quux') == value
+
+    def test_entries_stored_with_xfetch_are_read_without_it(self):
+        self.cache.set('foo', ['bar', 1, 2])
+        assert self.plain_cache().get('foo') == ['bar', 1, 2]
+
+    def test_serves_current_value_if_refresh_is_in_progress(self):
+        self.cache.backend.set('foo', json.dumps([XFETCH_MARKER, 'bar', 10 ** 9, time.time() + 1]), 123)
+        lock = self.cache.backend.get_lock('foo')
+        lock.acquire()
+        assert self.cache.get_or_set('foo', 'baz') == 'bar'
+        lock.release()
+
+
+class RedisLeaseTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache(backend='redis', db=15, ttl_key='freon:cache:test_ttl',
+                           lock_timeout=0.05)
+        self.client = redis.StrictRedis(db=15)
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_caches_values_computed_past_lock_timeout(self):
+        assert self.cache.get_or_set('foo', lambda: time.sleep(0.1) or 'bar') == 'bar'
+        assert self.cache.get('foo') == 'bar'
+
+
+class TtlJitterTests(CacheTestCase):
+    def test_no_jitter_by_default(self):
+        self.mock_backend.get_lock.return_value.acquire.return_value = True
+        self.cache.set('foo', 'bar', 1000)
+        self.mock_backend.set.assert_called_once_with(mock.ANY, mock.ANY, 1000)
+
+    def test_set_jitters_ttl(self):
+        self.cache.ttl_jitter = 0.1
+        self.mock_backend.get_lock.return_value.acquire.return_value = True
+        ttls = set()
+        for _ in range(20):
+            self.cache.set('foo', 'bar', 1000)
+            ttls.add(self.mock_backend.set.call_args[0][2])
+        assert len(ttls) > 1
+        assert all(900 <= ttl <= 1100 for ttl in ttls)
+
+    def test_set_many_jitters_ttl(self):
+        self.cache.ttl_jitter = 0.1
+        self.cache.set_many(dict(('foo%d' % i, 'bar') for i in range(20)), 1000)
+        ttls = set(ttl for _, ttl in self.mock_backend.set_many.call_args[0][0].values())
+        assert len(ttls) > 1
+        assert all(900 <= ttl <= 1100 for ttl in ttls)
+
+
+class PipelineTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache()
+
+    def test_queues_operations_until_the_block_exits(self):
+        with self.cache.pipeline() as pipeline:
+            pipeline.set('foo', 'bar')
+            assert self.cache.exists('foo') is False
+        assert self.cache.get('foo') == 'bar'
+
+    def test_results(self):
+        self.cache.set('baz', 'qux')
+        with self.cache.pipeline() as pipeline:
+            pipeline.set('foo', lambda: 'bar')
+            pipeline.get('foo')
+            pipeline.get('missing')
+            pipeline.set_many({'quux': 1}, ttl=123)
+            pipeline.get_many(['foo', 'baz', 'missing'])
+            pipeline.exists('baz')
+            pipeline.delete('baz')
+            pipeline.delete_many(['foo'])
+        assert pipeline.results == ['bar', 'bar', None, {'quux': 1},
+                                    {'foo': 'bar', 'baz': 'qux'}, True, True, True]
+
+    def test_does_not_execute_on_error(self):
+        with pytest.raises(ValueError):
+            with self.cache.pipeline() as pipeline:
+                pipeline.set('foo', 'bar')
+                raise ValueError()
+        assert self.cache.exists('foo') is False
+
+    def test_respects_return_stale(self):
+        self.cache.return_stale = False
+        self.cache.set('foo', 'bar', -123)
+        with self.cache.pipeline() as pipeline:
+            pipeline.get('foo')
+        assert pipeline.results == [None]
@@ -0,0 +1,187 @@
+import asyncio
+import dataclasses
+import pytest
+
+from . import BaseTestCase
+
+from freon.async_cache import AsyncCache
+from freon.cache import Cache
+from freon.memoize import MemoizeStats, make_key, normalize
+
+
+Point = dataclasses.make_dataclass('Point', ['x', 'y'])
+
+
+class MakeKeyTests(BaseTestCase):
+    def test_is_stable(self):
+        assert make_key('ns', None, (1, 'a'), {'b': 2}) == make_key('ns', None, (1, 'a'), {'b': 2})
+
+    def test_depends_on_arguments(self):
+        assert make_key('ns', None, (1,), {}) != make_key('ns', None, (2,), {})
+
+    def test_depends_on_namespace(self):
+        assert make_key('foo', None, (1,), {}) != make_key('bar', None, (1,), {})
+
+    def test_includes_namespace(self):
+        assert make_key('ns', None, (1,), {}).startswith('freon:memoize:ns:')
+
+    def test_key_fn(self):
+        assert make_key('ns', None, (1, 2), {}, key_fn=lambda a, b: '%s-%s' % (a, b)) == 'freon:memoize:ns:1-2'
+
+    def test_normalize_ignores_ordering(self):
+        assert repr(normalize({'a': 1, 'b': {2, 1}})) == repr(normalize({'b': {1, 2}, 'a': 1}))
+        assert repr(normalize({1, 'a', None})) == repr(normalize({None, 'a', 1}))
+
+    def test_dataclasses(self):
+        assert make_key('ns', None, (Point(1, 2),), {}) == make_key('ns', None, (Point(1, 2),), {})
+        assert make_key('ns', None, (Point(1, 2),), {}) != make_key('ns', None, (Point(2, 1),), {})
+        assert make_key('ns', None, (Point(1, 2),), {}) != make_key('ns', None, ((1, 2),), {})
+
+    def test_unsupported_arguments(self):
+        with pytest.raises(TypeError):
+            make_key('ns', None, (object(),), {})
+        with pytest.raises(TypeError):
+            make_key('ns', None, ([{'a': object()}],), {})
+
+
+class MemoizeTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache()
+        self.calls = []
+
+        @self.cache.memoize(ttl=123)
+        def add(a, b=0):
+            self.calls.append((a, b))
+            return a + b
+
+        self.add = add
+
+    def test_caches_results(self):
+        assert self.add(1, 2) == 3
+        assert self.add(1, 2) == 3
+        assert self.calls == [(1, 2)]
+
+    def test_keys_by_arguments(self):
+        self.add(1, 2)
+        self.add(2, 1)
+        assert len(self.calls) == 2
+
+    def test_binds_arguments_to_signature(self):
+        self.add(1, 0)
+        self.add(1)
+        self.add(a=1, b=0)
+        assert len(self.calls) == 1
+
+    def test_objects_need_a_key_fn(self):
+        class User(object):
+            def __init__(self, id):
+                self.id = id
+
+        @self.cache.memoize()
+        def user_id(user):
+            return user.id
+
+        with pytest.raises(TypeError):
+            user_id(User(1))
+
+        @self.cache.memoize(key_fn=lambda user: user.id)
+        def user_id(user):
+            return user.id
+
+        assert [user_id(User(i)) for i in range(1, 4)] == [1, 2, 3]
+
+    def test_uses_ttl(self):
+        self.add(1)
+        assert self.cache.backend.get_by_ttl(124) == [self.add.key(1)]
+
+    def test_callable_ttl(self):
+        @self.cache.memoize(ttl=lambda value: value)
+        def identity(a):
+            return a
+
+        identity(12)
+        assert self.cache.backend.get_by_ttl(13) == [identity.key(12)]
+
+    def test_invalidate(self):
+        self.add(1, 2)
+        self.add.invalidate(1, 2)
+        self.add(1, 2)
+        assert len(self.calls) == 2
+
+    def test_functions_have_own_namespace(self):
+        @self.cache.memoize()
+        def sub(a, b=0):
+            return a - b
+
+        assert sub.key(1, 2) != self.add.key(1, 2)
+        assert self.add(1, 2) == 3
+        assert sub(1, 2) == -1
+
+    def test_stats(self):
+        self.add(1)
+        self.add(1)
+        self.add(2)
+        assert self.add.stats.hits == 1
+        assert self.add.stats.misses == 2
+        assert self.cache.memoized[self.add.key(1).split(':')[2]] is self.add.stats
+
+    def test_computes_when_another_producer_holds_the_lock(self):
+        lock = self.cache.backend.get_lock(self.add.key(1))
+        lock.acquire()
+        assert self.add(1) == 1
+        lock.release()
+
+    def test_coroutine_function(self):
+        @self.cache.memoize()
+        async def double(a):
+            self.calls.append(a)
+            return 2 * a
+
+        assert asyncio.run(double(2)) == 4
+        assert asyncio.run(double(2)) == 4
+        assert self.calls == [2]
+        assert double.stats.hits == 1
+
+
+class AsyncMemoizeTests(BaseTestCase):
+    def setUp(self):
+        self.cache = AsyncCache()
+        self.calls = []
+
+    def test_coroutine_function(self):
+        @self.cache.memoize()
+        async def double(a):
+            self.calls.append(a)
+            return 2 * a
+
+        async def scenario():
+            return [await double(2), await double(2)]
+
+        assert asyncio.run(scenario()) == [4, 4]
+        assert self.calls == [2]
+
+    def test_regular_function(self):
+        @self.cache.memoize()
+        def double(a):
+            self.calls.append(a)
+            return 2 * a
+
+        async def scenario():
+            first = await double(2)
+            await double.invalidate(2)
+            return [first, await double(2)]
+
+        assert asyncio.run(scenario()) == [4, 4]
+        assert self.calls == [2, 2]
+
+
+class MemoizeStatsTests(BaseTestCase):
+    def test_hit_rate(self):
+        stats = MemoizeStats()
+        stats.record(True, 0.1)
+        stats.record(False, 0.3)
+        assert stats.hit_rate == 0.5
+        assert stats.as_dict()['miss_time'] == 0.3
+
+    def test_hit_rate_without_calls(self):
+        assert MemoizeStats().hit_rate == 0.0
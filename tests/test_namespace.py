@@ -0,0 +1,259 @@
+import asyncio
+import pytest
+import redis
+
+from freon.async_cache import AsyncCache
+from freon.cache import Cache
+from freon.stats import MemorySink
+from freon.tiered import TieredCache
+
+from tests import BaseTestCase
+
+
+class NamespaceTestCase(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache()
+        self.tenant = self.cache.namespace('tenant:42')
+
+
+class KeyTests(NamespaceTestCase):
+    def test_keys_are_kept_apart(self):
+        self.tenant.set('foo', 'bar')
+        self.cache.namespace('tenant:43').set('foo', 'baz')
+        assert self.tenant.get('foo') == 'bar'
+        assert self.cache.namespace('tenant:43').get('foo') == 'baz'
+        assert self.cache.get('foo') is None
+
+    def test_all_operations(self):
+        assert self.tenant.get_or_set('foo', lambda: 'bar') == 'bar'
+        assert self.tenant.set_many({'baz': 1, 'qux': 2}) == {'baz': 1, 'qux': 2}
+        assert self.tenant.get_many(['foo', 'baz', 'quux']) == {'foo': 'bar', 'baz': 1}
+        assert self.tenant.exists('qux') is True
+        assert self.tenant.delete('foo') is True
+        assert self.tenant.delete_many(['baz', 'qux']) is True
+        assert self.tenant.get_many(['foo', 'baz', 'qux']) == {}
+
+    def test_pipeline(self):
+        with self.tenant.pipeline() as pipeline:
+            pipeline.set('foo', 'bar')
+            pipeline.get('foo')
+        assert pipeline.results == ['bar', 'bar']
+        assert self.tenant.get('foo') == 'bar'
+
+    def test_memoize(self):
+        calls = []
+
+        @self.tenant.memoize()
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        assert double(2) == 4
+        self.tenant.invalidate_namespace()
+        assert double(2) == 4
+        assert calls == [2, 2]
+
+    def test_tiered_cache(self):
+        cache = TieredCache(backend='memory')
+        tenant = cache.namespace('tenant:42')
+        tenant.set('foo', 'bar')
+        cache.set('foo', 'baz')
+        assert tenant.get('foo') == 'bar'
+        assert cache.local.exists('freon:ns:tenant:42#0:foo') is True
+        tenant.invalidate_namespace()
+        assert tenant.get('foo') is None
+        assert cache.get('foo') == 'baz'
+        tenant.set_many({'foo': 1, 'qux': 2}, tags=['user:1'])
+        assert tenant.get_many(['foo', 'qux']) == {'foo': 1, 'qux': 2}
+        tenant.invalidate_tags(['user:1'])
+        assert cache.local.exists('freon:ns:tenant:42#1:foo') is False
+
+
+class InvalidationTests(NamespaceTestCase):
+    def test_invalidate_namespace(self):
+        self.tenant.set('foo', 'bar')
+        self.cache.set('foo', 'baz')
+        assert self.tenant.invalidate_namespace() == 1
+        assert self.tenant.get('foo') is None
+        assert self.cache.get('foo') == 'baz'
+
+    def test_is_seen_by_other_caches_of_the_namespace(self):
+        self.tenant.set('foo', 'bar')
+        self.cache.invalidate_namespace('tenant:42')
+        assert self.tenant.get('foo') is None
+        assert self.cache.namespace('tenant:42').get('foo') is None
+
+    def test_generation_ttl(self):
+        tenant = self.cache.namespace('tenant:42', generation_ttl=60)
+        tenant.set('foo', 'bar')
+        self.cache.invalidate_namespace('tenant:42')
+        assert tenant.get('foo') == 'bar'
+        tenant.invalidate_namespace()
+        assert tenant.get('foo') is None
+
+    def test_without_namespace(self):
+        with pytest.raises(ValueError):
+            self.cache.invalidate_namespace()
+
+    def test_old_generations_are_reaped(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        self.tenant.invalidate_namespace()
+        self.tenant.set('foo', 'baz', ttl=-1)
+        assert self.tenant.get_expired() == ['foo']
+        assert len(self.tenant.reap()) == 2
+        assert self.tenant.get_expired() == []
+
+    def test_parent_reaps_old_generations(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        self.tenant.invalidate_namespace()
+        assert self.cache.reap() == ['freon:ns:tenant:42#0:foo']
+
+    def test_tags_are_scoped(self):
+        other = self.cache.namespace('tenant:43')
+        self.tenant.set('foo', 'bar', tags=['user:1'])
+        other.set('foo', 'baz', tags=['user:1'])
+        self.tenant.set_many({'qux': 1}, tags=['user:1'])
+        assert sorted(self.tenant.invalidate_tags(['user:1'])) == [
+            'freon:ns:tenant:42#0:foo', 'freon:ns:tenant:42#0:qux']
+        assert self.tenant.get('foo') is None
+        assert other.get('foo') == 'baz'
+
+
+class ExpiryTests(NamespaceTestCase):
+    def test_namespaces_have_their_own_index(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        self.cache.set('baz', 'qux', ttl=-1)
+        assert self.tenant.get_expired() == ['foo']
+        assert self.cache.get_expired() == ['baz']
+
+    def test_get_by_ttl(self):
+        self.tenant.set('foo', 'bar', ttl=10)
+        self.tenant.set('baz', 'qux', ttl=1000)
+        assert self.tenant.get_by_ttl(100) == ['foo']
+        assert [key for key, _ in self.tenant.backend.get_by_ttl(100, with_scores=True)] == \
+            ['foo']
+
+    def test_iter(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        self.tenant.set('baz', 'qux', ttl=10)
+        self.cache.set('quux', 'corge', ttl=-1)
+        assert list(self.tenant.iter_expired(batch_size=1)) == ['foo']
+        assert list(self.tenant.iter_by_ttl(100)) == ['baz']
+        assert [key for key, _ in self.tenant.backend.iter_expired(with_scores=True)] == ['foo']
+
+
+    def test_with_stats(self):
+        sink = MemorySink()
+        tenant = Cache(stats=sink).namespace('tenant:42')
+        tenant.get('foo')
+        assert sink.counter('misses') == 1
+        assert sink.histogram('backend', operation='get_counter').count == 1
+
+
+class RedisTests(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache(backend='redis', db=15, ttl_key='freon:cache:test_ttl')
+        self.tenant = self.cache.namespace('tenant:42')
+        self.client = redis.StrictRedis(db=15, decode_responses=True)
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_invalidate_namespace(self):
+        assert self.tenant.get_or_set('foo', 'bar') == 'bar'
+        assert self.tenant.invalidate_namespace() == 1
+        assert self.tenant.get('foo') is None
+        assert self.client.get('freon:generation:tenant:42') == '1'
+
+    def test_namespace_has_its_own_sorted_set(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        assert self.client.zrange('freon:cache:test_ttl:tenant:42', 0, -1) == [
+            'freon:ns:tenant:42#0:foo']
+        assert self.client.zcard('freon:cache:test_ttl') == 0
+        assert self.tenant.get_expired() == ['foo']
+
+    def test_parent_reaps_old_generations(self):
+        self.tenant.set('foo', 'bar', ttl=-1)
+        self.tenant.invalidate_namespace()
+        assert self.cache.reap() == ['freon:ns:tenant:42#0:foo']
+        assert self.client.exists('freon:ns:tenant:42#0:foo') == 0
+
+    def test_tags(self):
+        self.tenant.set('foo', 'bar', tags=['user:1'])
+        self.cache.set('foo', 'baz', tags=['user:1'])
+        assert self.client.smembers('freon:cache:tag:tenant:42:user:1') == {
+            'freon:ns:tenant:42#0:foo'}
+        assert self.tenant.invalidate_tags(['user:1']) == ['freon:ns:tenant:42#0:foo']
+        assert self.cache.get('foo') == 'baz'
+
+
+class AsyncTests(BaseTestCase):
+    def test_invalidate_namespace(self):
+        cache = AsyncCache()
+        tenant = cache.namespace('tenant:42')
+
+        async def run():
+            assert await tenant.get_or_set('foo', 'bar') == 'bar'
+            assert await tenant.set('baz', 'qux') == 'qux'
+            assert await tenant.get_many(['foo', 'baz']) == {'foo': 'bar', 'baz': 'qux'}
+            assert await cache.get('foo') is None
+            assert await cache.invalidate_namespace('tenant:42') == 1
+            assert await tenant.get('foo') is None
+            assert await tenant.get_or_set('foo', 'baz') == 'baz'
+
+        asyncio.run(run())
+
+    def test_pipeline(self):
+        cache = AsyncCache()
+        tenant = cache.namespace('tenant:42')
+
+        async def run():
+            await tenant.set('foo', 'bar')
+            async with tenant.pipeline() as pipeline:
+                pipeline.get('foo')
+                pipeline.set('baz', 'qux')
+                pipeline.get_many(['foo', 'baz'])
+            assert pipeline.results == ['bar', 'qux', {'foo': 'bar', 'baz': 'qux'}]
+            assert await cache.get('baz') is None
+            await cache.invalidate_namespace('tenant:42')
+            async with tenant.pipeline() as pipeline:
+                pipeline.get('baz')
+            assert pipeline.results == [None]
+
+        asyncio.run(run())
+
+    def test_pipeline_on_redis(self):
+        tenant = AsyncCache(backend='redis', db=15,
+                            ttl_key='freon:cache:test_ttl').namespace('tenant:42')
+
+        async def run():
+            async with tenant.pipeline() as pipeline:
+                pipeline.set('foo', 'bar')
+                pipeline.get('foo')
+            return pipeline.results
+
+        try:
+            assert asyncio.run(run()) == ['bar', 'bar']
+            assert redis.StrictRedis(db=15).exists('freon:ns:tenant:42#0:foo') == 1
+        finally:
+            redis.StrictRedis(db=15).flushdb()
+
+    def test_iter_expired(self):
+        tenant = AsyncCache().namespace('tenant:42')
+
+        async def run():
+            await tenant.set('foo', 'bar', ttl=-1)
+            assert [key async for key in tenant.iter_expired()] == ['foo']
+
+        asyncio.run(run())
+
+    def test_get_expired(self):
+        tenant = AsyncCache().namespace('tenant:42')
+
+        async def run():
+            await tenant.set('foo', 'bar', ttl=-1)
+            assert await tenant.get_expired() == ['foo']
+            await tenant.invalidate_namespace()
+            assert await tenant.get_expired() == []
+
+        asyncio.run(run())
@@ -0,0 +1,57 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import itertools
+import time
+
+from freon.backends.memory import MemoryBackend
+from freon.reaper import Reaper
+
+from . import BaseTestCase
+
+
+class ReaperTests(BaseTestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        for i in range(25):
+            self.backend.set('expired:%d' % i, 'foo', -123)
+        self.backend.set('fresh', 'foo', 123)
+
+    def test_reaps_in_batches_until_done(self):
+        reaper = Reaper(self.backend, interval=60, batch_size=10)
+        reaper.start()
+        deadline = time.time() + 1
+        while reaper.reaped < 25 and time.time() < deadline:
+            time.sleep(0.001)
+        reaper.stop()
+        reaper.join(1)
+
+        assert reaper.reaped == 25
+        assert self.backend.get_expired() == []
+        assert self.backend.exists('fresh') is True
+
+    def test_keeps_going_after_errors(self):
+        backend = mock.Mock()
+        backend.reap.side_effect = itertools.chain([ConnectionError(), ['foo']], itertools.repeat([]))
+        reaper = Reaper(backend, interval=0.001)
+        with self.assertLogs('freon.reaper', 'ERROR'):
+            reaper.start()
+            deadline = time.time() + 1
+            while backend.reap.call_count < 3 and time.time() < deadline:
+                time.sleep(0.001)
+            reaper.stop()
+            reaper.join(1)
+
+        assert reaper.failed == 1
+        assert reaper.reaped == 1
+
+    def test_is_daemon(self):
+        assert Reaper(self.backend).daemon is True
+
+    def test_stop(self):
+        reaper = Reaper(self.backend, interval=60)
+        reaper.start()
+        reaper.stop()
+        reaper.join(1)
+        assert reaper.is_alive() is False
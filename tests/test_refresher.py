@@ -0,0 +1,251 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import asyncio
+import itertools
+import threading
+import time
+
+from freon.async_cache import AsyncCache
+from freon.cache import Cache
+from freon.refresher import AccessCounter, AsyncRefresher, Loader, Refresher
+from freon.tiered import TieredCache
+
+from . import BaseTestCase
+
+
+def wait_for(condition, timeout=1):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+class RefresherTestCase(BaseTestCase):
+    def setUp(self):
+        self.cache = Cache()
+        self.cache.set('user:1', 'old', ttl=10)
+        self.cache.set('user:2', 'old', ttl=30)
+        self.cache.set('user:3', 'old', ttl=1000)
+        self.cache.set('order:1', 'old', ttl=10)
+        self.loaded = []
+
+    def load(self, key):
+        self.loaded.append(key)
+        return 'new'
+
+    def refresher(self, **kwargs):
+        refresher = Refresher(self.cache, {'user:*': self.load}, **kwargs)
+        self.addCleanup(refresher._executor.shutdown)
+        return refresher
+
+    def wait(self, refresher):
+        assert wait_for(lambda: not refresher.pending)
+
+
+class ScheduleTests(RefresherTestCase):
+    def test_refreshes_matching_keys_due(self):
+        refresher = self.refresher()
+        assert sorted(refresher.schedule()) == ['user:1', 'user:2']
+        self.wait(refresher)
+        assert sorted(self.loaded) == ['user:1', 'user:2']
+        assert self.cache.get('user:1') == 'new'
+        assert self.cache.get('user:3') == 'old'
+        assert self.cache.get('order:1') == 'old'
+        assert refresher.refreshed == 2
+        assert self.cache.get_by_ttl(60) == ['order:1']
+
+    def test_soonest_expiring_first(self):
+        refresher = self.refresher(max_pending=1)
+        assert refresher.schedule() == ['user:1']
+
+    def test_most_read_first(self):
+        refresher = self.refresher(max_pending=1)
+        self.cache._reads = refresher.reads
+        for _ in range(5):
+            self.cache.get('user:2')
+        assert refresher.schedule() == ['user:2']
+
+    def test_min_reads(self):
+        refresher = self.refresher(min_reads=2)
+        self.cache._reads = refresher.reads
+        self.cache.get_many(['user:1', 'user:2'])
+        self.cache.get('user:2')
+        assert refresher.schedule() == ['user:2']
+
+    def test_first_matching_pattern_wins(self):
+        refresher = self.refresher()
+        refresher.register('*', lambda key: 'fallback', ttl=123)
+        refresher.schedule()
+        self.wait(refresher)
+        assert self.cache.get('user:1') == 'new'
+        assert self.cache.get('order:1') == 'fallback'
+        assert self.cache.get_by_ttl(124) == ['order:1']
+
+    def test_pending_keys_are_not_scheduled_twice(self):
+        release = threading.Event()
+        refresher = Refresher(self.cache, {'user:1': lambda key: release.wait(1) and 'new'})
+        assert refresher.schedule() == ['user:1']
+        assert refresher.schedule() == []
+        release.set()
+        self.wait(refresher)
+        assert refresher.schedule() == []
+
+    def test_rate_limit(self):
+        refresher = Refresher(self.cache, {'user:*': Loader(self.load, rate=1)})
+        assert refresher.schedule() == ['user:1']
+        assert refresher.throttled == 1
+
+    def test_locked_entries_are_left_alone(self):
+        refresher = self.refresher()
+        lock = self.cache.backend.get_lock('user:1')
+        lock.acquire()
+        refresher.schedule()
+        self.wait(refresher)
+        lock.release()
+        assert self.loaded == ['user:2']
+        assert refresher.refreshed == 1
+
+    def test_failures_are_counted(self):
+        def fail(key):
+            raise ValueError(key)
+
+        refresher = Refresher(self.cache, {'user:1': fail})
+        refresher.schedule()
+        self.wait(refresher)
+        assert refresher.failed == 1
+        assert self.cache.get('user:1') == 'old'
+
+
+class CacheTests(RefresherTestCase):
+    def test_start_refresher(self):
+        refresher = self.cache.start_refresher({'user:*': self.load}, interval=60)
+        assert wait_for(lambda: refresher.refreshed == 2)
+        refresher.stop()
+        refresher.join(1)
+        assert refresher.is_alive() is False
+        assert refresher.daemon is True
+
+    def test_keeps_going_after_errors(self):
+        with mock.patch.object(Refresher, 'schedule', side_effect=itertools.chain(
+                [ConnectionError()], itertools.repeat([]))) as \
+                schedule:
+            with self.assertLogs('freon.refresher', 'ERROR'):
+                refresher = self.cache.start_refresher({}, interval=0.001)
+                assert wait_for(lambda: schedule.call_count >= 2)
+                refresher.stop()
+                refresher.join(1)
+
+    def test_reads_are_counted_once_started(self):
+        self.cache.get('user:1')
+        refresher = self.cache.start_refresher({}, interval=60)
+        self.cache.get('user:1')
+        self.cache.get_or_set('user:2', 'new')
+        refresher.stop()
+        assert refresher.reads.counts == {'user:1': 1, 'user:2': 1}
+        assert self.cache.namespace('tenant:42')._reads is None
+
+    def test_l1_hits_are_counted(self):
+        cache = TieredCache(backend='memory')
+        refresher = cache.start_refresher({}, interval=60)
+        cache.set('foo', 'bar')
+        cache.get('foo')
+        refresher.stop()
+        assert refresher.reads.counts == {'foo': 1}
+
+    def test_failures_are_logged(self):
+        def fail(key):
+            raise ValueError(key)
+
+        refresher = Refresher(self.cache, {'user:1': fail})
+        with self.assertLogs('freon.refresher', 'ERROR') as logs:
+            refresher.schedule()
+            self.wait(refresher)
+        assert 'Failed to refresh user:1' in logs.output[0]
+
+
+class AsyncRefresherTests(BaseTestCase):
+    def setUp(self):
+        self.cache = AsyncCache()
+        self.loaded = []
+
+    async def load(self, key):
+        self.loaded.append(key)
+        await asyncio.sleep(0.01)
+        return 'new'
+
+    def test_schedule(self):
+        async def run():
+            await self.cache.set('user:1', 'old', ttl=10)
+            await self.cache.set('user:2', 'old', ttl=1000)
+            await self.cache.set('order:1', 'old', ttl=10)
+            refresher = AsyncRefresher(self.cache, {'user:*': self.load})
+            assert await refresher.schedule() == ['user:1']
+            assert await refresher.schedule() == []
+            await asyncio.gather(*refresher._tasks)
+            assert refresher.pending == set()
+            assert refresher.refreshed == 1
+            assert await self.cache.get('user:1') == 'new'
+            assert await self.cache.get('order:1') == 'old'
+
+        asyncio.run(run())
+
+    def test_workers_bound_concurrent_refreshes(self):
+        running = []
+
+        async def load(key):
+            running.append(key)
+            assert len(running) <= 2
+            await asyncio.sleep(0.01)
+            running.remove(key)
+            return 'new'
+
+        async def run():
+            await self.cache.set_many(dict(('user:%d' % i, 'old') for i in range(6)), ttl=10)
+            refresher = AsyncRefresher(self.cache, {'user:*': load}, workers=2)
+            assert len(await refresher.schedule()) == 6
+            await asyncio.gather(*refresher._tasks)
+            assert refresher.refreshed == 6
+
+        asyncio.run(run())
+
+    def test_failures_are_logged(self):
+        async def fail(key):
+            raise ValueError(key)
+
+        async def run():
+            await self.cache.set('user:1', 'old', ttl=10)
+            refresher = AsyncRefresher(self.cache, {'user:1': fail})
+            await refresher.schedule()
+            await asyncio.gather(*refresher._tasks)
+            return refresher
+
+        with self.assertLogs('freon.refresher', 'ERROR'):
+            refresher = asyncio.run(run())
+        assert refresher.failed == 1
+
+    def test_start_refresher(self):
+        async def run():
+            await self.cache.set('user:1', 'old', ttl=10)
+            refresher = self.cache.start_refresher({'user:*': self.load}, interval=60)
+            for _ in range(100):
+                if refresher.refreshed:
+                    break
+                await asyncio.sleep(0.01)
+            refresher.stop()
+            assert refresher.refreshed == 1
+            assert await self.cache.get('user:1') == 'new'
+            await self.cache.get_or_set('user:2', 'new')
+            assert refresher.reads.counts == {'user:1': 1, 'user:2': 1}
+
+        asyncio.run(run())
+
+
+class AccessCounterTests(BaseTestCase):
+    def test_decay_halves_counts(self):
+        counter = AccessCounter()
+        for key in ['foo', 'foo', 'foo', 'bar']:
+            counter.add(key)
+        assert counter.decay() == {'foo': 3, 'bar': 1}
+        assert counter.counts == {'foo': 1}
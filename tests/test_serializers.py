@@ -1,8 +1,21 @@
+import dataclasses
+import datetime
+import decimal
+import msgpack
 import pytest
 import time
+import uuid
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freon.serializers.compressed import COMPRESSORS, MARKER, CompressedSerializer, train_dictionary
+from freon.serializers import fast_json
+from freon.serializers.fast_json import FastJsonSerializer
 from freon.serializers.json import JsonSerializer
-from freon.serializers.msgpack import MsgpackSerializer
+from freon.serializers.msgpack import COMMON_EXT_TYPES, ExtType, MsgpackSerializer
 from freon.serializers.pickle import PickleSerializer
 
 from tests import BaseTestCase
@@ -58,3 +71,163 @@ class CustomSerializeTests(BaseTestCase):
     def test_custom(self):
         for serializer in self.serializers:
             assert isinstance(serializer.loads(serializer.dumps(Baz())), Baz)
+
+
+class CompressedSerializeTests(BaseTestCase):
+    def setUp(self):
+        self.value = {'foo': ['bar'] * 1000}
+
+    def test_round_trip(self):
+        for compression in ['zlib', 'lz4', 'zstd']:
+            for serializer in [JsonSerializer(), MsgpackSerializer(), PickleSerializer()]:
+                serializer = CompressedSerializer(serializer, compression)
+                dump = serializer.dumps(self.value)
+                assert dump[:2] == MARKER + bytes(bytearray([COMPRESSORS[compression].id]))
+                assert len(dump) < len(repr(self.value)) / 10
+                assert serializer.loads(dump) == self.value
+
+    def test_does_not_compress_below_threshold(self):
+        serializer = CompressedSerializer(JsonSerializer(), threshold=1024)
+        assert serializer.dumps('foo') == '"foo"'
+        assert serializer.loads('"foo"') == 'foo'
+
+    def test_does_not_compress_if_not_smaller(self):
+        serializer = CompressedSerializer(MsgpackSerializer(), threshold=0)
+        assert serializer.dumps(b'\xff') == MsgpackSerializer().dumps(b'\xff')
+
+    def test_decodes_uncompressed_entries(self):
+        serializer = CompressedSerializer(MsgpackSerializer(), threshold=0)
+        assert serializer.loads(MsgpackSerializer().dumps(self.value)) == self.value
+
+    def test_decodes_entries_compressed_with_another_algorithm(self):
+        dump = CompressedSerializer(JsonSerializer(), 'lz4').dumps(self.value)
+        assert CompressedSerializer(JsonSerializer(), 'zstd').loads(dump) == self.value
+
+    def test_with_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            CompressedSerializer(JsonSerializer()).loads(MARKER + b'\xff')
+
+    def test_zstd_with_dictionary(self):
+        samples = [{'id': i, 'name': 'user %s' % i, 'tags': ['foo', 'bar', str(i % 7)]}
+                   for i in range(1000)]
+        dictionary = train_dictionary(JsonSerializer(), samples, size=1024)
+        plain = CompressedSerializer(JsonSerializer(), 'zstd', threshold=0)
+        trained = CompressedSerializer(JsonSerializer(), 'zstd', threshold=0,
+                                       dictionary=dictionary)
+
+        value = samples[123]
+        assert len(trained.dumps(value)) < len(plain.dumps(value))
+        assert trained.loads(trained.dumps(value)) == value
+
+    def test_dictionary_requires_zstd(self):
+        with pytest.raises(ValueError):
+            CompressedSerializer(JsonSerializer(), 'zlib', dictionary=b'foo')
+
+    def test_keeps_custom_encoder_and_decoder(self):
+        serializer = CompressedSerializer(JsonSerializer(custom_encoder, custom_decoder), threshold=0)
+        assert serializer.custom_encoder is custom_encoder
+        assert isinstance(serializer.loads(serializer.dumps(Baz())), Baz)
+
+
+@dataclasses.dataclass
+class Point(object):
+    x: int
+    y: int
+
+
+ROUND_TRIP_VALUES = [
+    'foobar', 'fO0b@r ', u'é中', '', 0, -1234, 2 ** 63 - 1, 2 ** 70, 12.34, 1e-300,
+    True, False, None, [], {}, ['foo', 1, None], {'foo': {'bar': [1, 2.5, 'baz']}},
+    {1: 'foo', 'bar': 2},
+]
+
+
+class FastJsonSerializeTests(BaseTestCase):
+    def setUp(self):
+        self.json = JsonSerializer()
+
+    def test_round_trips_like_json_serializer(self):
+        for fallback in [False, True]:
+            with mock.patch('freon.serializers.fast_json.orjson',
+                            None if fallback else fast_json.orjson):
+                serializer = FastJsonSerializer()
+                for value in ROUND_TRIP_VALUES:
+                    expected = self.json.loads(self.json.dumps(value))
+                    assert serializer.loads(serializer.dumps(value)) == expected
+                    assert self.json.loads(serializer.dumps(value)) == expected
+                    assert serializer.loads(self.json.dumps(value)) == expected
+
+    def test_builtin_types(self):
+        value = {
+            'datetime': datetime.datetime(2020, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc),
+            'date': datetime.date(2020, 1, 2),
+            'uuid': uuid.UUID(int=1),
+            'point': Point(1, 2),
+        }
+        expected = {
+            'datetime': '2020-01-02T03:04:05.000006+00:00',
+            'date': '2020-01-02',
+            'uuid': '00000000-0000-0000-0000-000000000001',
+            'point': {'x': 1, 'y': 2},
+        }
+        for fallback in [False, True]:
+            with mock.patch('freon.serializers.fast_json.orjson',
+                            None if fallback else fast_json.orjson):
+                serializer = FastJsonSerializer()
+                assert serializer.loads(serializer.dumps(value)) == expected
+
+    def test_custom(self):
+        for fallback in [False, True]:
+            with mock.patch('freon.serializers.fast_json.orjson',
+                            None if fallback else fast_json.orjson):
+                serializer = FastJsonSerializer(custom_encoder, custom_decoder)
+                assert isinstance(serializer.loads(serializer.dumps(Baz())), Baz)
+
+
+class MsgpackExtTypesTests(BaseTestCase):
+    def setUp(self):
+        self.serializer = MsgpackSerializer(ext_types=COMMON_EXT_TYPES)
+
+    def test_round_trips_like_msgpack_serializer(self):
+        plain = MsgpackSerializer()
+        for value in ROUND_TRIP_VALUES:
+            if value in [2 ** 70, {1: 'foo', 'bar': 2}]:
+                # msgpack can't pack the former, nor unpack the latter
+                continue
+            expected = plain.loads(plain.dumps(value))
+            assert self.serializer.loads(self.serializer.dumps(value)) == expected
+            assert plain.loads(self.serializer.dumps(value)) == expected
+
+    def test_common_ext_types(self):
+        values = [
+            datetime.datetime(2020, 1, 2, 3, 4, 5, 6),
+            datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+            datetime.date(2020, 1, 2),
+            decimal.Decimal('12.340'),
+            uuid.UUID(int=1),
+        ]
+        for value in values:
+            assert self.serializer.loads(self.serializer.dumps(value)) == value
+            assert type(self.serializer.loads(self.serializer.dumps(value))) is type(value)
+
+    def test_custom_ext_type(self):
+        serializer = MsgpackSerializer(ext_types=[
+            ExtType(10, Point, lambda p: b'%d,%d' % (p.x, p.y),
+                    lambda data: Point(*map(int, bytes(data).split(b','))))])
+        assert serializer.loads(serializer.dumps([Point(1, 2)])) == [Point(1, 2)]
+
+    def test_ext_types_do_not_call_custom_hooks(self):
+        encoder, decoder = mock.Mock(), mock.Mock()
+        serializer = MsgpackSerializer(encoder, decoder, ext_types=COMMON_EXT_TYPES)
+        serializer.loads(serializer.dumps([uuid.UUID(int=1)]))
+        encoder.assert_not_called()
+        decoder.assert_not_called()
+
+    def test_falls_back_to_custom_encoder(self):
+        serializer = MsgpackSerializer(custom_encoder, custom_decoder, ext_types=COMMON_EXT_TYPES)
+        assert isinstance(serializer.loads(serializer.dumps(Baz())), Baz)
+
+    def test_unknown_ext_types_are_left_as_they_are(self):
+        dump = MsgpackSerializer(ext_types=COMMON_EXT_TYPES).dumps(uuid.UUID(int=1))
+        assert MsgpackSerializer(ext_types=COMMON_EXT_TYPES[:1]).loads(dump) == \
+            msgpack.ExtType(4, uuid.UUID(int=1).bytes)
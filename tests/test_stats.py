@@ -0,0 +1,203 @@
+import asyncio
+import sys
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from freon.async_cache import AsyncCache
+from freon.cache import Cache
+from freon.stats import (CallbackSink, Histogram, InstrumentedBackend, MemorySink,
+                         OpenTelemetrySink, PrometheusSink, Stats, StatsdSink, key_prefix)
+from freon.tiered import TieredCache
+
+from tests import BaseTestCase
+
+
+class StatsTestCase(BaseTestCase):
+    def setUp(self):
+        self.sink = MemorySink()
+        self.cache = Cache(stats=self.sink)
+
+
+class DisabledTests(BaseTestCase):
+    def test_backend_and_serializer_are_not_wrapped(self):
+        cache = Cache()
+        assert cache.stats is None
+        assert type(cache.backend).__name__ == 'MemoryBackend'
+        assert type(cache.serializer).__name__ == 'JsonSerializer'
+
+
+class CounterTests(StatsTestCase):
+    def test_get(self):
+        self.cache.set('foo', 'bar', 123)
+        self.cache.set('baz', 'qux', -123)
+        self.cache.get('foo')
+        self.cache.get('baz')
+        self.cache.get('quux')
+        assert self.sink.counter('hits') == 1
+        assert self.sink.counter('stale_hits') == 1
+        assert self.sink.counter('misses') == 1
+
+    def test_get_many(self):
+        self.cache.set('foo', 'bar', 123)
+        self.cache.get_many(['foo', 'baz'])
+        assert self.sink.counter('hits') == 1
+        assert self.sink.counter('misses') == 1
+
+    def test_get_or_set(self):
+        self.cache.get_or_set('foo', 'bar')
+        self.cache.get_or_set('foo', 'bar')
+        assert self.sink.counter('misses') == 1
+        assert self.sink.counter('hits') == 1
+
+    def test_lock_contention(self):
+        lock = self.cache.backend.get_lock('foo')
+        lock.acquire()
+        assert self.cache.set('foo', 'bar') is None
+        assert self.cache.get_or_set('baz', 'qux') == 'qux'
+        assert self.sink.counter('lock_contention') == 1
+        lock.release()
+
+    def test_lock_contention_with_leases(self):
+        self.cache.backend.backend.supports_leases = True
+        self.cache.backend.get_or_lease = lambda key: (None, True, None)
+        assert self.cache.get_or_set('foo', 'bar') is None
+        assert self.sink.counter('lock_contention') == 1
+
+    def test_grouped_by_key_prefix(self):
+        cache = Cache(stats=Stats(self.sink, key_group=key_prefix()))
+        cache.get('user:1')
+        cache.get('user:2')
+        cache.get('order:1')
+        assert self.sink.counter('misses') == 3
+        assert self.sink.counter('misses', group='user') == 2
+        assert self.sink.counter('misses', group='order') == 1
+
+    def test_l1_hits(self):
+        cache = TieredCache(backend='memory', stats=self.sink)
+        cache.set('foo', 'bar')
+        cache.get('foo')
+        assert self.sink.counter('l1_hits') == 1
+        assert self.sink.counter('hits') == 0
+
+
+class LatencyTests(StatsTestCase):
+    def test_backend_round_trips(self):
+        self.cache.set('foo', 'bar')
+        self.cache.get('foo')
+        self.cache.get_many(['foo'])
+        assert self.sink.histogram('backend', operation='get').count == 1
+        assert self.sink.histogram('backend', operation='get_many').count == 1
+        assert self.sink.histogram('backend', operation='set').count == 1
+        assert self.sink.histogram('backend').count == 3
+
+    def test_serialization(self):
+        self.cache.set('foo', 'bar')
+        self.cache.get('foo')
+        assert self.sink.histogram('serialize').count == 1
+        assert self.sink.histogram('deserialize').count == 1
+
+    def test_failed_calls_are_timed(self):
+        backend = InstrumentedBackend(mock.Mock(**{'get.side_effect': IOError}),
+                                      Stats(self.sink))
+        with self.assertRaises(IOError):
+            backend.get('foo')
+        assert self.sink.histogram('backend', operation='get').count == 1
+
+    def test_other_attributes_go_to_the_backend(self):
+        assert self.cache.backend.ttl_key == self.cache.backend.backend.ttl_key
+        assert self.cache.backend.supports_leases is False
+
+    def test_async(self):
+        cache = AsyncCache(stats=self.sink)
+
+        async def run():
+            await cache.set('foo', 'bar')
+            await cache.get('foo')
+            await cache.get('baz')
+
+        asyncio.run(run())
+        assert self.sink.counter('hits') == 1
+        assert self.sink.counter('misses') == 1
+        assert self.sink.histogram('backend', operation='get').count == 2
+
+
+class HistogramTests(BaseTestCase):
+    def test_percentile(self):
+        histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+        for seconds in [0.0005] * 90 + [0.05] * 9 + [1]:
+            histogram.observe(seconds)
+        assert histogram.count == 100
+        assert histogram.percentile(50) == 0.001
+        assert histogram.percentile(99) == 0.1
+        assert histogram.percentile(100) == float('inf')
+
+    def test_empty(self):
+        assert Histogram().percentile(99) == 0.0
+
+
+class SinkTests(BaseTestCase):
+    def test_callback(self):
+        events = []
+        cache = Cache(stats=CallbackSink(lambda *event: events.append(event)))
+        cache.get('foo')
+        assert ('counter', 'misses', 1, {}) in events
+        assert [event[:2] for event in events if event[0] == 'timing'] == [('timing', 'backend')]
+
+    def test_several_sinks(self):
+        sinks = [MemorySink(), MemorySink()]
+        Cache(stats=sinks).get('foo')
+        assert [sink.counter('misses') for sink in sinks] == [1, 1]
+
+    def test_statsd(self):
+        sink = StatsdSink(prefix='app')
+        sink.socket = mock.Mock()
+        sink.incr('misses', 1, {})
+        sink.incr('misses', 1, {'group': 'user'})
+        sink.timing('backend', 0.0015, {'operation': 'get'})
+        assert [c[0][0] for c in sink.socket.sendto.call_args_list] == [
+            b'app.misses:1|c', b'app.misses.user:1|c', b'app.backend.get:1.500|ms']
+
+    def test_statsd_with_tags(self):
+        sink = StatsdSink(tagged=True)
+        sink.socket = mock.Mock()
+        sink.incr('misses', 1, {'group': 'user'})
+        sink.socket.sendto.assert_called_once_with(b'freon.misses:1|c|#group:user',
+                                                   ('localhost', 8125))
+
+    def test_statsd_ignores_network_errors(self):
+        sink = StatsdSink()
+        sink.socket = mock.Mock(**{'sendto.side_effect': OSError})
+        sink.incr('misses', 1, {})
+
+    def test_prometheus(self):
+        prometheus_client = mock.Mock()
+        with mock.patch.dict(sys.modules, {'prometheus_client': prometheus_client}):
+            sink = PrometheusSink(registry='registry')
+        sink.incr('misses', 1, {'group': 'user'})
+        sink.incr('misses', 2, {'group': 'user'})
+        sink.timing('backend', 0.5, {'operation': 'get'})
+
+        prometheus_client.Counter.assert_called_once_with(
+            'misses', 'freon misses', ('group',), namespace='freon', registry='registry')
+        prometheus_client.Counter.return_value.labels.assert_called_with(group='user')
+        prometheus_client.Counter.return_value.labels.return_value.inc.assert_called_with(2)
+        prometheus_client.Histogram.assert_called_once_with(
+            'backend_seconds', 'freon backend_seconds', ('operation',), namespace='freon',
+            registry='registry', buckets=sink.buckets)
+        prometheus_client.Histogram.return_value.labels.return_value.observe.assert_called_with(
+            0.5)
+
+    def test_opentelemetry(self):
+        meter = mock.Mock()
+        sink = OpenTelemetrySink(meter)
+        sink.incr('misses', 1, {'group': 'user'})
+        sink.incr('misses', 1, {})
+        sink.timing('backend', 0.5, {'operation': 'get'})
+
+        meter.create_counter.assert_called_once_with('freon.misses', unit='1')
+        meter.create_counter.return_value.add.assert_called_with(1, {})
+        meter.create_histogram.assert_called_once_with('freon.backend', unit='s')
+        meter.create_histogram.return_value.record.assert_called_with(0.5, {'operation': 'get'})
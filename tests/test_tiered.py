@@ -0,0 +1,143 @@
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import redis
+
+from . import BaseTestCase
+
+from freon.tiered import TieredCache
+
+
+class TieredCacheTestCase(BaseTestCase):
+    def setUp(self):
+        self.cache = TieredCache(backend='memory', l1_max_entries=2, l1_ttl=60)
+
+
+class GetTests(TieredCacheTestCase):
+    def test_fresh_entries_are_served_from_l1(self):
+        self.cache.backend.set('foo', '"bar"', 123)
+        assert self.cache.get('foo') == 'bar'
+        with mock.patch.object(self.cache.backend, 'get') as mock_get:
+            assert self.cache.get('foo') == 'bar'
+            mock_get.assert_not_called()
+
+    def test_expired_entries_are_not_kept_in_l1(self):
+        self.cache.backend.set('foo', '"bar"', -123)
+        assert self.cache.get('foo') == 'bar'
+        assert self.cache.local.exists('foo') is False
+
+    def test_l1_entries_expire(self):
+        self.cache.l1_ttl = -1
+        self.cache.backend.set('foo', '"bar"', 123)
+        self.cache.get('foo')
+        self.cache.backend.set('foo', '"baz"', 123)
+        assert self.cache.get('foo') == 'baz'
+
+    def test_l1_is_bounded(self):
+        for key in ('foo', 'bar', 'baz'):
+            self.cache.set(key, key)
+        assert self.cache.local.exists('foo') is False
+
+    def test_get_many(self):
+        self.cache.set('foo', 'bar')
+        self.cache.backend.set('baz', '"qux"', 123)
+        assert self.cache.get_many(['foo', 'baz', 'quux']) == {'foo': 'bar', 'baz': 'qux'}
+        assert self.cache.local.exists('baz') is True
+
+
+class SetTests(TieredCacheTestCase):
+    def test_set_fills_l1(self):
+        self.cache.set('foo', 'bar')
+        assert self.cache.local.get('foo') == ('bar', False)
+
+    def test_set_many_fills_l1(self):
+        self.cache.set_many({'foo': 'bar'})
+        assert self.cache.local.get('foo') == ('bar', False)
+
+    def test_get_or_set_uses_l1(self):
+        self.cache.set('foo', 'bar')
+        with mock.patch.object(self.cache.backend, 'get') as mock_get:
+            assert self.cache.get_or_set('foo', 'baz') == 'bar'
+            mock_get.assert_not_called()
+
+
+class DeleteTests(TieredCacheTestCase):
+    def test_delete_evicts_l1(self):
+        self.cache.set('foo', 'bar')
+        self.cache.delete('foo')
+        assert self.cache.get('foo') is None
+
+    def test_delete_many_evicts_l1(self):
+        self.cache.set('foo', 'bar')
+        self.cache.delete_many(['foo'])
+        assert self.cache.get('foo') is None
+
+    def test_invalidate_only_evicts_l1(self):
+        self.cache.set('foo', 'bar')
+        self.cache.invalidate(b'foo')
+        assert self.cache.local.exists('foo') is False
+        assert self.cache.backend.exists('foo') is True
+
+    def test_own_invalidations_are_ignored(self):
+        self.cache.set('foo', 'bar')
+        self.cache._invalidated(('%s\0foo' % self.cache.origin).encode('utf-8'))
+        assert self.cache.local.exists('foo') is True
+        self.cache._invalidated(b'other\0foo')
+        assert self.cache.local.exists('foo') is False
+        self.cache.set('foo', 'bar')
+        self.cache._invalidated(b'foo')
+        assert self.cache.local.exists('foo') is False
+
+    def test_invalidate_tags_evicts_l1(self):
+        self.cache.set('foo', 'bar', tags=['user:1'])
+        assert self.cache.invalidate_tags(['user:1']) == ['foo']
+        assert self.cache.local.exists('foo') is False
+        assert self.cache.get('foo') is None
+
+
+class RedisInvalidationTests(BaseTestCase):
+    def setUp(self):
+        self.caches = [TieredCache(db=15, ttl_key='freon:cache:test_ttl') for _ in range(2)]
+        # Let both subscriptions settle before publishing
+        time.sleep(0.1)
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        redis.StrictRedis(db=15).flushdb()
+
+    def wait_for_eviction(self, cache, key):
+        deadline = time.time() + 2
+        while cache.local.exists(key) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_writes_from_other_nodes_evict_l1(self):
+        first, second = self.caches
+        first.set('foo', 'bar')
+        assert second.get('foo') == 'bar'
+
+        first.delete('foo')
+        self.wait_for_eviction(second, 'foo')
+        assert second.get('foo') is None
+
+    def test_namespaced_writes_from_other_nodes_evict_l1(self):
+        first, second = [cache.namespace('tenant:42') for cache in self.caches]
+        first.set('foo', 'bar')
+        assert second.get('foo') == 'bar'
+
+        first.set('foo', 'baz')
+        self.wait_for_eviction(self.caches[1], 'freon:ns:tenant:42#0:foo')
+        assert second.get('foo') == 'baz'
+
+    def test_own_writes_stay_in_l1(self):
+        first, second = self.caches
+        second.set('foo', 'bar')
+        first.set('foo', 'baz')
+        self.wait_for_eviction(second, 'foo')
+        time.sleep(0.1)
+        assert first.local.get('foo') == ('baz', False)
+        assert second.local.exists('foo') is False